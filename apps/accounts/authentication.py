@@ -0,0 +1,222 @@
+"""Stateless JWT authentication
+
+Access tokens carry the user's profile and permission flags as claims, so
+the request user is rebuilt from the token without touching accounts_user.
+Revocation is checked against the auth cache instead:
+
+* `ver` is a fingerprint of the password and the active/staff/superuser
+  flags. Changing any of them publishes a new version, and every token
+  issued before (including access tokens refreshed later) stops working.
+* `deny_token` puts a single token's jti on a denylist until it expires
+  (logout).
+
+Both live in the auth cache, so it must be shared by all workers: with a
+per-process cache a revocation only applies in the worker that handled it.
+check_auth_cache() refuses to start with one unless DEBUG is on.
+
+With ACCOUNTS_AUTH_LOCAL_TTL > 0, tokens that passed the check are not
+re-checked in the same process for that many seconds. Worth it when the
+auth cache is remote; revocations from other processes then take up to
+that long to apply.
+"""
+import threading
+from time import monotonic, time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import salted_hmac
+from django.utils.functional import cached_property
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+VERSION_CLAIM = 'ver'
+VERSION_KEY = 'accounts:token-version:{}'
+DENIED_KEY = 'accounts:denied-token:{}'
+
+
+# Кэши, которые не видят записи других процессов
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+def get_cache():
+    return caches[getattr(settings, 'ACCOUNTS_AUTH_CACHE_ALIAS', 'default')]
+
+
+def check_auth_cache():
+    """Raise ImproperlyConfigured when claims authentication would revoke tokens in one worker only"""
+    if settings.DEBUG:
+        return
+    if not any(issubclass(auth, ClaimsJWTAuthentication) for auth in drf_settings.DEFAULT_AUTHENTICATION_CLASSES):
+        return
+    cache = get_cache()
+    if isinstance(cache, PROCESS_LOCAL_CACHES):
+        raise ImproperlyConfigured(
+            f"ACCOUNTS_AUTH_CACHE_ALIAS points at {type(cache).__name__}, which other workers do not see: "
+            f"password changes, deactivation and logout would not revoke tokens there. "
+            f"Use a shared cache (Redis, Memcached, database) for it."
+        )
+
+
+def token_version(user):
+    """Fingerprint that changes whenever tokens issued to `user` must stop working"""
+    value = f'{user.password}|{user.is_active}|{user.is_staff}|{user.is_superuser}'
+    return salted_hmac('apps.accounts.token_version', value).hexdigest()[:16]
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token with the claims ClaimsUser is built from, copied into every access token"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['email'] = user.email
+        token['full_name'] = user.full_name
+        token['is_active'] = user.is_active
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token[VERSION_CLAIM] = token_version(user)
+        return token
+
+
+class ClaimsUser(TokenUser):
+    """request.user backed by the token claims: use `pk`/`id` for foreign keys, there is no row behind it"""
+
+    @cached_property
+    def id(self):
+        # for_user() пишет id строкой, приводим к типу первичного ключа
+        return get_user_model()._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', True)
+
+    def __str__(self):
+        return self.email or super().__str__()
+
+
+class CheckedTokens:
+    """Per-process memo of tokens that passed the revocation check: jti -> (expires_at, user_id)"""
+    max_entries = 10000
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def hit(self, jti):
+        entry = self.entries.get(jti)
+        return entry is not None and entry[0] > monotonic()
+
+    def add(self, jti, user_id, ttl):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+            self.entries[jti] = (monotonic() + ttl, user_id)
+
+    def forget(self, jti=None, user_id=None):
+        with self.lock:
+            if jti is not None:
+                self.entries.pop(jti, None)
+            if user_id is not None:
+                self.entries = {key: entry for key, entry in self.entries.items() if entry[1] != user_id}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+checked_tokens = CheckedTokens()
+
+
+def publish_version(user_id, version):
+    """Make `version` the only valid one for the user's tokens ('' rejects them all)"""
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    get_cache().set(VERSION_KEY.format(user_id), version, timeout=lifetime)
+    checked_tokens.forget(user_id=str(user_id))
+
+
+def load_version(user_id):
+    """Version from the DB, used when the auth cache has none (cold cache or evicted)"""
+    user = get_user_model().objects.filter(pk=user_id).only(
+        'password', 'is_active', 'is_staff', 'is_superuser').first()
+    version = token_version(user) if user is not None else ''
+    publish_version(user_id, version)
+    return version
+
+
+def deny_token(token):
+    """Reject this token (by jti) until it expires"""
+    remaining = token['exp'] - int(time())
+    if remaining > 0:
+        get_cache().set(DENIED_KEY.format(token[api_settings.JTI_CLAIM]), True, timeout=remaining)
+    checked_tokens.forget(jti=token[api_settings.JTI_CLAIM])
+
+
+def check_token(token):
+    """Raise AuthenticationFailed when `token` (access or refresh) was denied or its version is stale
+
+    Tokens without the version claim are only checked against the denylist.
+    """
+    user_id, jti = ClaimsJWTAuthentication._identify(token)
+    if VERSION_CLAIM not in token:
+        if get_cache().get(DENIED_KEY.format(jti)):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return
+    if not checked_tokens.hit(jti):
+        found = get_cache().get_many([VERSION_KEY.format(user_id), DENIED_KEY.format(jti)])
+        ClaimsJWTAuthentication._check(token, user_id, jti, found, load_version)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that returns a ClaimsUser instead of loading the user row
+
+    Tokens without the version claim (issued before it existed) fall back to
+    the regular lookup.
+    """
+
+    def get_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        check_token(validated_token)
+        return ClaimsUser(validated_token)
+
+    async def aget_user(self, validated_token):
+        if VERSION_CLAIM not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token)
+        user_id, jti = self._identify(validated_token)
+        if not checked_tokens.hit(jti):
+            found = await get_cache().aget_many([VERSION_KEY.format(user_id), DENIED_KEY.format(jti)])
+            version = found.get(VERSION_KEY.format(user_id))
+            if version is None:
+                found[VERSION_KEY.format(user_id)] = await sync_to_async(load_version)(user_id)
+            self._check(validated_token, user_id, jti, found, load_version)
+        return ClaimsUser(validated_token)
+
+    @staticmethod
+    def _identify(token):
+        try:
+            # Ключ локального кэша: id в токене строкой, сигналы передают pk как есть
+            return str(token[api_settings.USER_ID_CLAIM]), token[api_settings.JTI_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    @staticmethod
+    def _check(token, user_id, jti, found, load):
+        if found.get(DENIED_KEY.format(jti)):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        version = found.get(VERSION_KEY.format(user_id))
+        if version is None:
+            version = load(user_id)
+        if version != token[VERSION_CLAIM]:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        ttl = getattr(settings, 'ACCOUNTS_AUTH_LOCAL_TTL', 0)
+        if ttl > 0:
+            checked_tokens.add(jti, user_id, ttl)
@@ -1,25 +1,45 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import ClaimsRefreshToken, check_token
 
 User = get_user_model()
 
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
-    @classmethod
-    def get_token(cls, user):
-        token = super().get_token(user)
-        token['user_id'] = user.id
-        token['email'] = user.email
-        token['full_name'] = user.full_name
-        return token
+    # Профиль и флаги прав попадают в claims, см. ClaimsJWTAuthentication
+    token_class = ClaimsRefreshToken
 
     def validate(self, attrs):
         attrs['username'] = attrs.get('email')
         return super().validate(attrs)
 
 
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    # Отозванный при logout или устаревший по версии refresh новых токенов не выдаёт
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        check_token(self.token_class(attrs['refresh']))
+        return super().validate(attrs)
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            token = ClaimsRefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+        user = self.context['request'].user
+        if str(token.get(api_settings.USER_ID_CLAIM)) != str(user.pk):
+            raise serializers.ValidationError('Token belongs to another user')
+        return token
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import publish_version, token_version
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def publish_token_version(sender, instance, **kwargs):
+    # Смена пароля или флагов отзывает все ранее выданные токены
+    publish_version(instance.pk, token_version(instance))
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    publish_version(instance.pk, '')
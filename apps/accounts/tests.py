@@ -1,3 +1,114 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import ClaimsRefreshToken, ClaimsUser, check_auth_cache, checked_tokens, get_cache
+
+User = get_user_model()
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        checked_tokens.clear()
+        self.user = User.objects.create_user(email='jwt@example.com', password='pw', full_name='Jay')
+        self.client = APIClient()
+
+    def login(self, email='jwt@example.com', password='pw'):
+        response = self.client.post('/api/token/', {'email': email, 'password': password})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def get(self, url, access):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_user_is_built_from_claims(self):
+        access = self.login()['access']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/api/category/', access)
+        self.assertFalse([query for query in queries if 'accounts_user' in query['sql']])
+        self.assertEqual(response.status_code, 200)
+        user = response.wsgi_request.user
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.email, user.full_name, user.is_staff), (self.user.pk, 'jwt@example.com', 'Jay', False))
+
+    def test_password_and_permission_changes_revoke_tokens(self):
+        access = self.login()['access']
+        self.user.set_password('new')
+        self.user.save()
+        self.assertEqual(self.get('/api/user/', access).status_code, 401)
+
+        tokens = self.login(password='new')
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.get('/api/user/', tokens['access']).status_code, 401)
+        # Refresh с устаревшей версией новых токенов не выдаёт
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+        self.assertTrue(self.get('/api/admin-user/', self.login(password='new')['access']).data['is_staff'])
+
+    def test_logout_denies_only_that_token(self):
+        access, other = self.login()['access'], self.login()['access']
+        response = self.client.post('/api/logout/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get('/api/user/', access).status_code, 401)
+        self.assertEqual(self.get('/api/user/', other).status_code, 200)
+
+    def test_logout_revokes_the_refresh_token(self):
+        tokens, other = self.login(), self.login()
+        response = self.client.post(
+            '/api/logout/', {'refresh': tokens['refresh']}, HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}',
+        )
+        self.assertEqual(response.status_code, 204)
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/token/refresh/', {'refresh': other['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/api/user/', response.data['access']).status_code, 200)
+        # Чужой refresh отозвать нельзя
+        stranger = User.objects.create_user(email='other@example.com', password='pw')
+        response = self.client.post(
+            '/api/logout/', {'refresh': str(ClaimsRefreshToken.for_user(stranger))},
+            HTTP_AUTHORIZATION=f'Bearer {other["access"]}',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_cold_cache_and_legacy_tokens(self):
+        access = self.login()['access']
+        get_cache().clear()
+        with self.assertNumQueries(2):  # версия токена из БД, затем профиль
+            self.assertEqual(self.get('/api/user/', access).data['email'], 'jwt@example.com')
+        # Токен без claims версии проверяется по строке пользователя
+        legacy = RefreshToken.for_user(self.user).access_token
+        response = self.get('/api/user/', legacy)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.wsgi_request.user, User)
+
+    @override_settings(ACCOUNTS_AUTH_LOCAL_TTL=60)
+    def test_local_ttl_skips_the_cache_but_not_local_revocations(self):
+        access = self.login()['access']
+        self.get('/api/user/', access)
+        get_cache().clear()
+        with self.assertNumQueries(1):  # только чтение профиля
+            self.get('/api/user/', access)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get('/api/user/', access).status_code, 401)
+
+    def test_process_local_auth_cache_is_refused_without_debug(self):
+        with override_settings(DEBUG=True):
+            check_auth_cache()
+        with override_settings(DEBUG=False):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'LocMemCache'):
+                check_auth_cache()
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(DEBUG=False, CACHES={**settings.CACHES, 'auth': shared},
+                                   ACCOUNTS_AUTH_CACHE_ALIAS='auth'):
+                check_auth_cache()
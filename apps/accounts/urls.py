@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import RegisterView, CustomTokenObtainPairView,UserDetailView, AdminUserDetailView
+from .views import RegisterView, CustomTokenObtainPairView,UserDetailView, AdminUserDetailView, LogoutView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('user/', UserDetailView.as_view(), name='user-detail'),
     path('admin-user/', AdminUserDetailView.as_view(), name='admin-user-detail'),
 ]
\ No newline at end of file
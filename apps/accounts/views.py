@@ -1,11 +1,15 @@
-from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers import CustomTokenObtainPairSerializer, RegisterSerializer, UserSerializer
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .serializers import (
+    ClaimsTokenRefreshSerializer, CustomTokenObtainPairSerializer, LogoutSerializer, RegisterSerializer, UserSerializer,
+)
 from django.contrib.auth import get_user_model
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
+from .authentication import deny_token
+
 User = get_user_model()
 
 
@@ -13,6 +17,10 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
+class ClaimsTokenRefreshView(TokenRefreshView):
+    serializer_class = ClaimsTokenRefreshSerializer
+
+
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = RegisterSerializer  
@@ -33,7 +41,8 @@ class UserDetailView(APIView):
     serializer_class = UserSerializer     
 
     def get(self, request):
-        user = request.user
+        # request.user собран из токена, профиль читаем из БД
+        user = User.objects.get(pk=request.user.pk)
         serializer = self.serializer_class(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -43,6 +52,22 @@ class AdminUserDetailView(APIView):
     serializer_class = UserSerializer    
 
     def get(self, request):
-        user = request.user
+        # request.user собран из токена, профиль читаем из БД
+        user = User.objects.get(pk=request.user.pk)
         serializer = self.serializer_class(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = LogoutSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        deny_token(request.auth)
+        # Без этого refresh продолжал бы выдавать новые access-токены
+        refresh = serializer.validated_data.get('refresh')
+        if refresh is not None:
+            deny_token(refresh)
+        return Response(status=status.HTTP_204_NO_CONTENT)
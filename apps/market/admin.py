@@ -1,15 +1,27 @@
 from django.contrib import admin
 
-from .models import Product, Category, ProductImage, PhotoLike
+from .models import Product, Category, ProductImage, PhotoLike, ImageJob, MediaBlob
 
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1  # Քանի դատարկ դաշտ ցույց տա նոր նկար ավելացնելու համար
+    readonly_fields = ['likes_count', 'dislikes_count', 'variants']
 
 class ProductAdmin(admin.ModelAdmin):
     inlines = [ProductImageInline]
 
 admin.site.register(Category)
 admin.site.register(Product, ProductAdmin)
-admin.site.register(PhotoLike)
\ No newline at end of file
+admin.site.register(PhotoLike)
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'image', 'status', 'attempts', 'updated_at']
+    list_filter = ['status']
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'refcount', 'updated_at']
+    readonly_fields = ['name', 'refcount', 'updated_at']
@@ -0,0 +1,182 @@
+"""ASGI-native read path for the catalog
+
+Under an ASGI server every DRF APIView runs in a thread behind the
+thread-sensitive executor, so concurrent reads queue up. These views serve
+GET/HEAD directly on the event loop with the async ORM. The payload and
+cache entries match the sync views. Any other method is delegated to the
+sync DRF view of the same route.
+
+Payloads are built from `.values()` rows fetched with the async ORM
+(apps.market.payloads), so nothing on the event loop can trigger a lazy
+query.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from apps.accounts.authentication import ClaimsJWTAuthentication
+
+from . import likes, models, payloads, serializers, views
+from .cache import cached_response
+from .conditional import (
+    category_list_state, category_state, conditional_response, product_list_state, product_state,
+)
+from .models import PhotoLike
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+
+renderer = FastJSONRenderer()
+jwt_authentication = ClaimsJWTAuthentication()
+
+
+class JSONResponse(HttpResponse):
+    """JSON rendered like DRF's JSONRenderer, keeping the payload on `.data` like DRF's Response"""
+
+    def __init__(self, data, status=status.HTTP_200_OK, headers=None):
+        super().__init__(renderer.render(data), content_type='application/json', status=status, headers=headers)
+        self.data = data
+
+
+async def authenticate(request):
+    """Async twin of JWTAuthentication.authenticate: the user comes from the token claims"""
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return AnonymousUser()
+    return await jwt_authentication.aget_user(jwt_authentication.get_validated_token(raw_token))
+
+
+class AsyncReadView(View):
+    sync_view = None
+    sync_handler = None
+    login_required = False
+    response_class = JSONResponse
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(sync_handler=cls.sync_view.as_view(), **initkwargs)
+        # Как и DRF: JWT вместо сессии, CSRF не нужен
+        return csrf_exempt(view)
+
+    @property
+    def cache_name(self):
+        # Общие записи кэша с синхронными views
+        return self.sync_view.__name__
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(self.sync_handler)(request, *args, **kwargs)
+
+        request.query_params = request.GET
+        try:
+            request.user = await authenticate(request)
+            if self.login_required and not request.user.is_authenticated:
+                raise NotAuthenticated()
+        except APIException as exc:
+            return JSONResponse(exc.detail, status=status.HTTP_401_UNAUTHORIZED,
+                                headers={'WWW-Authenticate': jwt_authentication.authenticate_header(request)})
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            # Как exception handler DRF: ошибки параметров (fields, cursor, page_size) со своим статусом
+            return JSONResponse(exc.detail, status=exc.status_code)
+
+    def paginated(self, paginator, data):
+        return JSONResponse({
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': data,
+        })
+
+
+class AsyncCategoryViews(AsyncReadView):
+    sync_view = views.CategoryViews
+    login_required = True
+    pagination_class = KeysetPagination
+    ordering_fields = views.CategoryViews.ordering_fields
+
+    @conditional_response(category_list_state, 'category', 'product', 'productimage', 'photolike')
+    @cached_response('category', 'product', 'productimage', 'photolike')
+    async def get(self, request):
+        shape = payloads.request_shape(payloads.CATEGORY, request)
+        paginator = self.pagination_class()
+        categories = models.Category.objects.values(*shape.columns(*self.ordering_fields))
+        rows = await paginator.apaginate_queryset(categories, request, view=self)
+        return self.paginated(paginator, await payloads.acategories(rows, shape))
+
+
+class AsyncCategoryOneViews(AsyncReadView):
+    sync_view = views.CategoryOneViews
+
+    @conditional_response(category_state, 'category', 'product', 'productimage', 'photolike')
+    @cached_response('category', 'product', 'productimage', 'photolike')
+    async def get(self, request, pk):
+        shape = payloads.request_shape(payloads.CATEGORY, request)
+        rows = await payloads.acategories(
+            [row async for row in models.Category.objects.filter(id=pk).values(*shape.columns())], shape)
+        if not rows:
+            return JSONResponse({'detail': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+        return JSONResponse(rows[0])
+
+
+class AsyncProductViews(AsyncReadView):
+    sync_view = views.ProductViews
+    pagination_class = KeysetPagination
+    ordering_fields = views.ProductViews.ordering_fields
+
+    @conditional_response(product_list_state, 'product', 'productimage', 'photolike')
+    @cached_response('product', 'productimage', 'photolike')
+    async def get(self, request):
+        filters = serializers.ProductFilterSerializer(data=request.query_params)
+        if not filters.is_valid():
+            return JSONResponse(filters.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = dict(filters.validated_data)
+        with_facets = params.pop('facets')
+        shape = payloads.request_shape(payloads.PRODUCT, request)
+
+        paginator = self.pagination_class()
+        products = models.Product.objects.browse(**params).values(*shape.columns(*self.ordering_fields))
+        page = await paginator.apaginate_queryset(products, request, view=self)
+        response = self.paginated(paginator, await payloads.aproducts(page, shape))
+        if with_facets:
+            facets = await models.Product.objects.browse(has_images=params.get('has_images')).afacet_counts(
+                settings.MARKET_PRICE_BUCKETS,
+                category_ids=params.get('category_ids'),
+                min_price=params.get('min_price'),
+                max_price=params.get('max_price'),
+            )
+            response = JSONResponse({**response.data, 'facets': facets})
+        return response
+
+
+class AsyncProductOneViews(AsyncReadView):
+    sync_view = views.ProductOneViews
+
+    @conditional_response(product_state, 'product', 'productimage', 'photolike')
+    @cached_response('product', 'productimage', 'photolike')
+    async def get(self, request, pk):
+        shape = payloads.request_shape(payloads.PRODUCT, request)
+        rows = await payloads.aproducts(
+            [row async for row in models.Product.objects.filter(id=pk).values(*shape.columns())], shape)
+        if not rows:
+            return JSONResponse({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return JSONResponse(rows[0])
+
+
+class AsyncPhotoLikeView(AsyncReadView):
+    sync_view = views.PhotoLikeView
+    login_required = True
+
+    async def get(self, request, pk):
+        like = await PhotoLike.objects.filter(user_id=request.user.pk, photo_id=pk).only('is_like').afirst()
+        is_like = likes.buffer.state(request.user.pk, pk, like.is_like if like else None)
+        if is_like is None:
+            state = None
+        else:
+            state = 'liked' if is_like else 'disliked'
+        return JSONResponse({'state': state})
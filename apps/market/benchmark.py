@@ -0,0 +1,462 @@
+import asyncio
+import http.client
+import itertools
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, close_old_connections, connections
+from django.test import AsyncClient, Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from apps.accounts.authentication import ClaimsRefreshToken, publish_version, token_version
+
+from . import payloads, rankings
+from .cache import get_cache
+from .instrumentation import observe_queries
+from .middleware import QueryCounter
+from .models import Category, PhotoLike, Product, ProductImage
+from .serializers import ProductGetSerializer
+
+User = get_user_model()
+
+PASSWORD = 'bench-password'
+WORDS = ('phone case cable charger laptop stand mouse keyboard monitor lamp desk chair bottle bag '
+         'watch strap speaker headphones camera tripod lens adapter battery glass leather steel').split()
+
+
+class Catalog:
+    """Ids and credentials of a seeded benchmark catalog"""
+
+    def __init__(self, admin, users, category_ids, products, image_ids):
+        self.admin = admin
+        self.users = users
+        self.category_ids = category_ids
+        self.products = products  # [(id, name)]
+        self.image_ids = image_ids
+        self._serial = itertools.count()
+        self.tokens = {}
+
+    def serial(self):
+        return next(self._serial)
+
+    def refresh_tokens(self):
+        self.tokens = {
+            'user': f'Bearer {ClaimsRefreshToken.for_user(self.users[0]).access_token}',
+            'admin': f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}',
+        }
+
+
+def seed_catalog(categories=20, products=2000, images=2, likes=5000, users=50, seed=0, batch_size=1000):
+    """Bulk-insert a synthetic catalog; image rows point at fake storage paths"""
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    admin = User.objects.create_superuser(email='bench-admin@example.com', password=PASSWORD)
+    accounts = User.objects.bulk_create([
+        User(email=f'bench{n}@example.com', password=password) for n in range(max(users, 1))
+    ])
+    # bulk_create обходит post_save: версии токенов публикуем сами, иначе в кэше может остаться чужая
+    for account in accounts:
+        publish_version(account.pk, token_version(account))
+    category_ids = [c.id for c in Category.objects.bulk_create([
+        Category(name=f'Bench category {n}', images='category_image/bench.jpg') for n in range(categories)
+    ])]
+
+    rows = []
+    for offset in range(0, products, batch_size):
+        rows += Product.objects.bulk_create([
+            Product(
+                name=f'{rng.choice(WORDS)} {rng.choice(WORDS)} {n}',
+                price=rng.randint(100, 500000) / 100,
+                description=' '.join(rng.choices(WORDS, k=12)),
+                category_id=rng.choice(category_ids),
+            )
+            for n in range(offset, min(offset + batch_size, products))
+        ])
+    image_ids = []
+    for offset in range(0, len(rows), batch_size):
+        image_ids += [i.id for i in ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'product_images/bench-{product.id}-{i}.jpg')
+            for product in rows[offset:offset + batch_size] for i in range(images)
+        ])]
+
+    pairs = {(rng.choice(accounts).id, rng.choice(image_ids)) for _ in range(likes)} if image_ids else set()
+    PhotoLike.objects.bulk_create(
+        [PhotoLike(user_id=user_id, photo_id=photo_id, is_like=rng.random() < 0.8) for user_id, photo_id in pairs],
+        batch_size=batch_size,
+    )
+    ProductImage.objects.all().recount_likes()
+    Product.objects.all().recount_popularity()
+    rankings.recompute()
+    return Catalog(admin, accounts, category_ids, [(p.id, p.name) for p in rows], image_ids)
+
+
+def png_upload(name='bench.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (200, 80, 40)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class Request:
+    __slots__ = ('method', 'path', 'body', 'content_type', 'auth')
+
+    def __init__(self, method, path, body=b'', content_type=None, auth=None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.auth = auth
+
+
+def multipart(method, path, data, auth=None):
+    return Request(method, path, encode_multipart(BOUNDARY, data), MULTIPART_CONTENT, auth)
+
+
+class Scenario:
+    """One endpoint: `build(catalog, n)` prepares the n-th request (untimed, may write fixtures)"""
+
+    def __init__(self, name, build, status=200):
+        self.name = name
+        self.build = build
+        self.status = status
+
+
+def _create_category(catalog, n):
+    return Category.objects.create(name=f'Disposable {catalog.serial()}', images='category_image/bench.jpg')
+
+
+def _create_product(catalog, n):
+    return Product.objects.create(name=f'Disposable product {catalog.serial()}', price=1,
+                                  description='', category_id=catalog.category_ids[0])
+
+
+def _update_product(catalog, n, pk, name):
+    body = {'name': name, 'price': '12.50', 'category': catalog.category_ids[0], 'description': f'revision {n}'}
+    return Request('PUT', f'/api/product/{pk}/', json.dumps(body).encode(), 'application/json')
+
+
+def _import_csv(catalog, n):
+    rng = random.Random(n)
+    lines = ['name,price,description,category']
+    for _, name in rng.sample(catalog.products, min(20, len(catalog.products))):
+        lines.append(f'{name},{rng.randint(100, 99999) / 100},updated,Bench category 0')
+    return SimpleUploadedFile('bench.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+
+def default_scenarios():
+    pick = random.Random(0).choice
+    return [
+        Scenario('category list', lambda c, n: Request('GET', '/api/category/', auth='user')),
+        Scenario('category detail', lambda c, n: Request('GET', f'/api/category/{pick(c.category_ids)}')),
+        Scenario('category trending', lambda c, n: Request('GET', f'/api/category/{pick(c.category_ids)}/trending/')),
+        Scenario('category trending photos', lambda c, n: Request(
+            'GET', f'/api/category/{pick(c.category_ids)}/trending/photos/')),
+        Scenario('category create', lambda c, n: multipart(
+            'POST', '/api/category/', {'name': f'New category {c.serial()}', 'images': png_upload()}, 'user'),
+            status=201),
+        Scenario('category delete', lambda c, n: Request('DELETE', f'/api/category/{_create_category(c, n).pk}'),
+                 status=204),
+        Scenario('product list', lambda c, n: Request('GET', '/api/product/')),
+        Scenario('product list filtered', lambda c, n: Request('GET', '/api/product/?' + urlencode({
+            'category': pick(c.category_ids), 'min_price': 10, 'max_price': 2000,
+            'ordering': '-popularity', 'facets': 'true',
+        }))),
+        Scenario('product detail', lambda c, n: Request('GET', f'/api/product/{pick(c.products)[0]}/')),
+        Scenario('product create', lambda c, n: multipart('POST', '/api/product/', {
+            'name': f'New product {c.serial()}', 'price': '19.99', 'category': c.category_ids[0],
+            'description': 'benchmark', 'upload_images': [png_upload()],
+        }), status=201),
+        Scenario('product update', lambda c, n: _update_product(c, n, *pick(c.products))),
+        Scenario('product delete', lambda c, n: Request('DELETE', f'/api/product/{_create_product(c, n).pk}/'),
+                 status=204),
+        Scenario('product search', lambda c, n: Request('GET', f'/api/product/search/?q={pick(WORDS)}')),
+        Scenario('product import', lambda c, n: multipart(
+            'POST', '/api/product/import/', {'file': _import_csv(c, n)}, 'admin')),
+        Scenario('product export', lambda c, n: Request('GET', '/api/product/export/', auth='admin')),
+        Scenario('photo like state', lambda c, n: Request('GET', f'/api/photos/{pick(c.image_ids)}/like/',
+                                                          auth='user')),
+        Scenario('photo like toggle', lambda c, n: multipart(
+            'POST', f'/api/photos/{pick(c.image_ids)}/like/', {'action': pick(['like', 'dislike'])}, 'user')),
+        Scenario('metrics', lambda c, n: Request('GET', '/api/metrics/', auth='admin')),
+        Scenario('register', lambda c, n: multipart('POST', '/api/register/', {
+            'email': f'new{c.serial()}@example.com', 'full_name': 'Bench', 'password': PASSWORD,
+        }), status=201),
+        Scenario('token', lambda c, n: multipart('POST', '/api/token/', {
+            'email': c.users[n % len(c.users)].email, 'password': PASSWORD,
+        })),
+        Scenario('user detail', lambda c, n: Request('GET', '/api/user/', auth='user')),
+        Scenario('admin user detail', lambda c, n: Request('GET', '/api/admin-user/', auth='admin')),
+    ]
+
+
+def summarize(latencies, wall, statuses, expected):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for code, count in statuses.items() if code != expected),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+    }
+
+
+def _headers(catalog, request):
+    return {'Authorization': catalog.tokens[request.auth]} if request.auth else {}
+
+
+def run_client(catalog, scenarios, repeat, cold=False):
+    """Sequential requests through django.test.Client, counting SQL queries per request"""
+    client = Client()
+    catalog.refresh_tokens()
+    results = {}
+    for scenario in scenarios:
+        requests = [scenario.build(catalog, n) for n in range(repeat)]
+        latencies, statuses, queries = [], Counter(), []
+        wall = 0.0
+        for request in requests:
+            if cold:
+                get_cache().clear()
+            counter = QueryCounter()
+            started = time.perf_counter()
+            with observe_queries(counter):
+                response = client.generic(request.method, request.path, request.body,
+                                          request.content_type or 'application/octet-stream',
+                                          headers=_headers(catalog, request))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            wall += elapsed
+            latencies.append(elapsed)
+            statuses[response.status_code] += 1
+            queries.append(counter.count)
+        results[scenario.name] = {**summarize(latencies, wall, statuses, scenario.status),
+                                  'queries': int(statistics.median(queries))}
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class UvicornServer:
+    """The project's ASGI application on a local port, in a background thread"""
+
+    def __init__(self):
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+
+        self.port = _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(
+            get_asgi_application(), host='127.0.0.1', port=self.port, log_level='warning', lifespan='off',
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def _run_http(catalog, requests, port, concurrency):
+    local = threading.local()
+
+    def send(request):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port)
+        headers = _headers(catalog, request)
+        if request.content_type:
+            headers['Content-Type'] = request.content_type
+        started = time.perf_counter()
+        conn.request(request.method, request.path, body=request.body or None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - started, response.status
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, requests))
+
+
+def _run_in_process(catalog, requests, concurrency):
+    async def main():
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def send(request):
+            async with limit:
+                started = time.perf_counter()
+                response = await client.generic(request.method, request.path, request.body,
+                                                request.content_type or 'application/octet-stream',
+                                                headers=_headers(catalog, request))
+                if response.streaming:
+                    if response.is_async:
+                        async for _ in response.streaming_content:
+                            pass
+                    else:
+                        # Как ASGIHandler: синхронный итератор (с запросами к БД) читается в потоке
+                        await sync_to_async(b''.join)(response.streaming_content)
+                return time.perf_counter() - started, response.status_code
+
+        return await asyncio.gather(*(send(request) for request in requests))
+
+    return asyncio.run(main())
+
+
+def run_asgi(catalog, scenarios, repeat, concurrency):
+    """Concurrent requests through the ASGI handler
+
+    Uses a real uvicorn server when it is installed, otherwise drives the
+    ASGI application in-process with AsyncClient. Returns (results, transport).
+    """
+    catalog.refresh_tokens()
+    try:
+        server = UvicornServer()
+    except ImportError:
+        server = None
+
+    results = {}
+    with server or ExitStack():
+        for scenario in scenarios:
+            requests = [scenario.build(catalog, n) for n in range(repeat)]
+            started = time.perf_counter()
+            if server is not None:
+                timings = _run_http(catalog, requests, server.port, concurrency)
+            else:
+                timings = _run_in_process(catalog, requests, concurrency)
+            wall = time.perf_counter() - started
+            statuses = Counter(code for _, code in timings)
+            results[scenario.name] = {**summarize([t for t, _ in timings], wall, statuses, scenario.status),
+                                      'queries': None}
+    return results, 'uvicorn' if server is not None else 'asgi-in-process'
+
+
+def run_write_concurrency(catalog, writers, readers, seconds, hot_photos=20, seed=0):
+    """Like toggles from `writers` threads while `readers` threads list products, for `seconds`
+
+    Every operation runs like a request: close_old_connections() before and
+    after, so CONN_MAX_AGE decides whether it reconnects. Failed operations
+    are counted under the exception message ("database is locked", ...).
+    """
+    photos = catalog.image_ids[:hot_photos]
+    deadline = time.perf_counter() + seconds
+    outcomes = {'write': [], 'read': []}
+    lock = threading.Lock()
+
+    def toggle(rng, user):
+        PhotoLike.objects.toggle(user, rng.choice(photos), is_like=rng.random() < 0.8)
+
+    def browse(rng, user):
+        category_id = rng.choice(catalog.category_ids)
+        list(Product.objects.filter(category_id=category_id).order_by('-popularity', '-id')
+             .values_list('id', 'popularity')[:20])
+        list(ProductImage.objects.filter(pk__in=rng.sample(photos, min(5, len(photos))))
+             .values_list('likes_count', 'dislikes_count'))
+
+    def worker(kind, operation, n):
+        rng = random.Random(seed + n)
+        user = catalog.users[n % len(catalog.users)]
+        rows = []
+        try:
+            while time.perf_counter() < deadline:
+                close_old_connections()
+                started = time.perf_counter()
+                try:
+                    operation(rng, user)
+                    outcome = 'ok'
+                except DatabaseError as exc:
+                    outcome = str(exc)
+                rows.append((time.perf_counter() - started, outcome))
+                close_old_connections()
+        finally:
+            connections.close_all()
+            with lock:
+                outcomes[kind] += rows
+
+    threads = [threading.Thread(target=worker, args=('write', toggle, n)) for n in range(writers)]
+    threads += [threading.Thread(target=worker, args=('read', browse, writers + n)) for n in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    results = {}
+    for kind, rows in outcomes.items():
+        if rows:
+            statuses = Counter(outcome for _, outcome in rows)
+            results[kind] = summarize([elapsed for elapsed, _ in rows], wall, statuses, 'ok')
+    return results
+
+
+def run_serialization(repeat=3):
+    """CPU time to build and encode the whole product catalog: serializers + DRF renderer vs payloads
+
+    Rows are fetched once up front, so only serialization and encoding are timed.
+    """
+    products = list(Product.objects.with_images().order_by('id'))
+    rows = list(Product.objects.order_by('id').values(*payloads.PRODUCT_FIELDS))
+    related = payloads.fetch(payloads.PRODUCT.full, rows)
+    renderer, dumps = JSONRenderer(), payloads.get_dumps()
+
+    def timed(function):
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            result = function()
+            timings.append(time.process_time() - started)
+        return min(timings), result
+
+    results = {}
+    build, data = timed(lambda: ProductGetSerializer(products, many=True).data)
+    encode, body = timed(lambda: renderer.render(data))
+    results['serializer'] = {'build_s': build, 'encode_s': encode, 'bytes': len(body)}
+    build, data = timed(lambda: payloads.build(payloads.PRODUCT.full, rows, related))
+    encode, body = timed(lambda: dumps(data))
+    results['payloads'] = {'build_s': build, 'encode_s': encode, 'bytes': len(body)}
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, slack_ms=1.0):
+    """Regressions against a saved baseline: more queries, new errors and, unless tolerance is None, slower p95"""
+    failures = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        limit = None if tolerance is None else base['p95_ms'] * (1 + tolerance) + slack_ms
+        if limit is not None and current['p95_ms'] > limit:
+            failures.append(f"{key}: p95 {current['p95_ms']}ms > {limit:.3f}ms (baseline {base['p95_ms']}ms)")
+        if current['queries'] is not None and base.get('queries') is not None and current['queries'] > base['queries']:
+            failures.append(f"{key}: {current['queries']} queries > baseline {base['queries']}")
+        if current['errors'] > base.get('errors', 0):
+            failures.append(f"{key}: {current['errors']} unexpected statuses {current['statuses']}")
+    return failures
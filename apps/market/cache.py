@@ -0,0 +1,156 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import routers
+
+VERSION_KEY = 'market:version:{}'
+VERSIONED_KEY = 'market:{}:{}:{}:{}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'MARKET_CACHE_ALIAS', 'default')]
+
+
+class CacheStats:
+    """Hit/miss counters for the catalog response cache (per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+stats = CacheStats()
+
+
+def _new_version():
+    # Не начинаем с 1: если ключ версии вытеснен из кэша, старые ответы не совпадут
+    return time.time_ns()
+
+
+def get_versions(entities):
+    cache = get_cache()
+    keys = [VERSION_KEY.format(entity) for entity in entities]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(entity):
+    cache = get_cache()
+    key = VERSION_KEY.format(entity)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=None)
+
+
+def bump_version(entity):
+    """Invalidate every cached response depending on `entity` once the write is committed
+
+    Bumping before commit would let a concurrent reader cache pre-write data
+    under the new version.
+    """
+    transaction.on_commit(lambda: _bump(entity))
+
+
+def versioned_key(kind, name, entities, discriminator):
+    """Cache key that changes whenever any of `entities` is written"""
+    versions = '.'.join(str(v) for v in get_versions(entities))
+    digest = hashlib.md5(str(discriminator).encode()).hexdigest()
+    return VERSIONED_KEY.format(kind, name, versions, digest)
+
+
+def get_timeout():
+    return getattr(settings, 'MARKET_CACHE_TIMEOUT', 300)
+
+
+def read_timeout():
+    """get_timeout() for data read in this context, at most the replica lag after a replica read"""
+    timeout = get_timeout()
+    if routers.used_replica():
+        # Реплика могла ещё не получить запись, под версию которой кладём данные
+        timeout = min(timeout, routers.get_lag())
+    return timeout
+
+
+def cached_response(*entities):
+    """Cache successful GET payloads keyed by the path and the versions of `entities`
+
+    Works on sync and async views. A hit is rebuilt with the view's
+    `response_class` (DRF's Response by default). Views can share cache
+    entries through `cache_name`. The catalog alias is in-process locmem, so
+    the sync cache calls do not block the event loop.
+    """
+
+    def decorator(method):
+        def lookup(view, request):
+            cache = get_cache()
+            name = getattr(view, 'cache_name', type(view).__name__)
+            key = versioned_key('response', name, entities, request.build_absolute_uri())
+            data = cache.get(key)
+            stats.record(hit=data is not None)
+            if data is None:
+                return key, None
+            response = getattr(view, 'response_class', Response)(data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'HIT'
+            return key, response
+
+        def store(key, response):
+            if response.status_code == status.HTTP_200_OK:
+                get_cache().set(key, response.data, timeout=read_timeout())
+            response['X-Cache'] = 'MISS'
+            return response
+
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                key, response = lookup(view, request)
+                if response is not None:
+                    return response
+                return store(key, await method(view, request, *args, **kwargs))
+
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key, response = lookup(view, request)
+            if response is not None:
+                return response
+            return store(key, method(view, request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,133 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+from .cache import get_cache, read_timeout, versioned_key
+from .models import Category, Product, ProductImage
+
+
+STATE_AGGREGATES = {'count': Count('pk'), 'latest': Max('updated_at')}
+
+
+def _fold_state(aggregates):
+    parts = []
+    last_modified = None
+    for state in aggregates:
+        latest = state['latest']
+        parts.append(f"{state['count']}:{latest.isoformat() if latest else ''}")
+        if latest and (last_modified is None or latest > last_modified):
+            last_modified = latest
+
+    etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+    return etag, timegm(last_modified.utctimetuple()) if last_modified else None
+
+
+def catalog_state(*querysets):
+    """ETag and Last-Modified from (COUNT, MAX(updated_at)) of each queryset
+
+    Nothing is serialized: each part is one aggregate over an indexed column.
+    The counts make deletes change the ETag even though they leave MAX intact.
+    """
+    return _fold_state([queryset.aggregate(**STATE_AGGREGATES) for queryset in querysets])
+
+
+async def acatalog_state(*querysets):
+    return _fold_state([await queryset.aaggregate(**STATE_AGGREGATES) for queryset in querysets])
+
+
+# Источники состояния: querysets, из которых catalog_state считает ETag
+def category_list_state(request):
+    return Category.objects.all(), Product.objects.all(), ProductImage.objects.all()
+
+
+def category_state(request, pk):
+    return (
+        Category.objects.filter(pk=pk),
+        Product.objects.filter(category_id=pk),
+        ProductImage.objects.filter(product__category_id=pk),
+    )
+
+
+def product_list_state(request):
+    return Product.objects.all(), ProductImage.objects.all()
+
+
+def product_state(request, pk):
+    return Product.objects.filter(pk=pk), ProductImage.objects.filter(product_id=pk)
+
+
+def representation_etag(etag, request):
+    """ETag of the state as rendered for this request
+
+    Pages, orderings, filters and `?fields=` of one path are different
+    bodies built from the same state, so the query string is hashed in.
+    """
+    query = sorted(request.GET.lists())
+    if not query:
+        return etag
+    return quote_etag(hashlib.md5(f'{etag}|{query!r}'.encode()).hexdigest())
+
+
+def _with_validators(response, etag, last_modified):
+    # 304 повторяет валидаторы, иначе клиент не обновит сохранённые
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_response(state_func, *entities):
+    """Answer If-None-Match/If-Modified-Since with 304 before the view builds its payload
+
+    `state_func(request, *args)` returns the querysets the payload is built
+    from. The computed state is memoized under the versions of `entities`, so
+    a warm cache answers without touching the DB. Works on sync and async views.
+    """
+
+    def decorator(method):
+        def state_key(args, kwargs):
+            return versioned_key('state', state_func.__name__, entities, (args, sorted(kwargs.items())))
+
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                cache = get_cache()
+                key = state_key(args, kwargs)
+                state = cache.get(key)
+                if state is None:
+                    state = await acatalog_state(*state_func(request, *args, **kwargs))
+                    cache.set(key, state, timeout=read_timeout())
+                etag, last_modified = state
+                etag = representation_etag(etag, request)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is not None:
+                    return _with_validators(response, etag, last_modified)
+                return _with_validators(await method(view, request, *args, **kwargs), etag, last_modified)
+
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_cache()
+            key = state_key(args, kwargs)
+            state = cache.get(key)
+            if state is None:
+                state = catalog_state(*state_func(request, *args, **kwargs))
+                cache.set(key, state, timeout=read_timeout())
+            etag, last_modified = state
+            etag = representation_etag(etag, request)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return _with_validators(response, etag, last_modified)
+            return _with_validators(method(view, request, *args, **kwargs), etag, last_modified)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,48 @@
+import zlib
+from itertools import islice
+
+from . import payloads
+from .models import Product
+
+BUFFER_SIZE = 64 * 1024
+
+
+def iter_product_lines(chunk_size=1000):
+    """Yield one NDJSON line (bytes) per product, holding at most one chunk of products in memory
+
+    Products come from one `.values()` cursor and their images from one query
+    per chunk, so the export costs 1 + N/chunk_size queries and the same
+    payload shape as the API.
+    """
+    dumps = payloads.get_dumps()
+    rows = Product.objects.order_by('id').values(*payloads.PRODUCT_FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        for payload in payloads.products(chunk):
+            yield dumps(payload) + b'\n'
+
+
+def iter_buffered(lines, buffer_size=BUFFER_SIZE):
+    """Join small lines into ~buffer_size byte blocks to avoid one write per product"""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_products(chunk_size=1000, gzip=False):
+    blocks = iter_buffered(iter_product_lines(chunk_size))
+    return iter_gzip(blocks) if gzip else blocks
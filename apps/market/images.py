@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from PIL import Image, ImageOps, features
+
+from .cache import bump_version
+from .models import ImageJob, MediaBlob, ProductImage, variant_paths
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name, file extension and encoder options
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'avif', {'quality': 60}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_worker_count():
+    return getattr(settings, 'MARKET_IMAGE_WORKERS', 2)
+
+
+def get_variant_sizes():
+    return getattr(settings, 'MARKET_IMAGE_VARIANTS', {'thumb': 320, 'medium': 1024})
+
+
+def get_formats():
+    wanted = getattr(settings, 'MARKET_IMAGE_FORMATS', ['webp', 'avif'])
+    return [name for name in wanted if name in FORMATS and features.check(name)]
+
+
+def render_variants(image_file, sizes, formats):
+    """Yield (size name, format name, encoded bytes), bounded to `size` px and without metadata"""
+    with Image.open(image_file) as source:
+        # Поворот по EXIF применяем до того, как выбросим метаданные
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in source.getbands() or 'transparency' in source.info
+            source = source.convert('RGBA' if has_alpha else 'RGB')
+        for size_name, size in sizes.items():
+            variant = source.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variant.info = {}
+            for format_name in formats:
+                pil_format, _, options = FORMATS[format_name]
+                buffer = BytesIO()
+                variant.save(buffer, pil_format, **options)
+                yield size_name, format_name, buffer.getvalue()
+
+
+def generate_variants(photo):
+    storage = photo.image.storage
+    directory = os.path.join(os.path.dirname(photo.image.name), 'variants', str(photo.pk))
+    variants = {}
+    with photo.image.open('rb') as image_file:
+        for size_name, format_name, content in render_variants(image_file, get_variant_sizes(), get_formats()):
+            # Хранилище адресует по содержимому: имя — лишь подсказка, перезаписывать нечего
+            name = os.path.join(directory, f'{size_name}.{FORMATS[format_name][1]}')
+            variants.setdefault(size_name, {})[format_name] = storage.save(name, ContentFile(content))
+    return variants
+
+
+def process_job(job_id):
+    """Run one ImageJob, claimed with a conditional UPDATE so concurrent workers never share it"""
+    claimed = ImageJob.objects.filter(
+        pk=job_id, status__in=[ImageJob.PENDING, ImageJob.FAILED]
+    ).update(status=ImageJob.RUNNING, attempts=F('attempts') + 1, updated_at=Now())
+    if not claimed:
+        return False
+
+    job = ImageJob.objects.select_related('image').get(pk=job_id)
+    try:
+        variants = generate_variants(job.image)
+    except Exception as exc:
+        logger.exception("Image job %s failed", job_id)
+        ImageJob.objects.filter(pk=job_id).update(status=ImageJob.FAILED, error=str(exc), updated_at=Now())
+        return False
+
+    ProductImage.objects.filter(pk=job.image_id).update(variants=variants, updated_at=Now())
+    MediaBlob.objects.adjust(added=variant_paths(variants), removed=variant_paths(job.image.variants))
+    ImageJob.objects.filter(pk=job_id).update(status=ImageJob.DONE, error='', updated_at=Now())
+    bump_version('productimage')
+    return True
+
+
+def _run_in_worker(job_id):
+    try:
+        process_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_worker_count(), thread_name_prefix='market-images'
+            )
+        return _executor
+
+
+def enqueue(photos):
+    """Create processing jobs for saved ProductImage rows and start them after commit"""
+    jobs = ImageJob.objects.bulk_create([ImageJob(image=photo) for photo in photos])
+    for job in jobs:
+        transaction.on_commit(partial(submit, job.pk))
+    return jobs
+
+
+def add_product_images(photos):
+    """Insert unsaved ProductImage objects in one statement, bypassing per-row post_save"""
+    photos = ProductImage.objects.bulk_create(photos)
+    MediaBlob.objects.adjust(added=[name for photo in photos for name in photo.media_names()])
+    enqueue(photos)
+    bump_version('productimage')
+    return photos
+
+
+def submit(job_id):
+    """Process a job in the background pool, or inline when MARKET_IMAGE_WORKERS is 0"""
+    if get_worker_count() <= 0:
+        process_job(job_id)
+    else:
+        get_executor().submit(_run_in_worker, job_id)
@@ -0,0 +1,186 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .cache import bump_version
+from .images import add_product_images
+from .models import MAX_PRODUCT_IMAGES, Category, Product, ProductImage
+from .search import get_backend as get_search_backend
+from .uploads import reserved_slot_counts
+
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 1000
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    description = serializers.CharField(allow_blank=True, default='')
+    category = serializers.CharField(max_length=255)
+    # Пути в хранилище медиа, в CSV через ";"
+    images = serializers.ListField(child=serializers.CharField(max_length=100), required=False, max_length=MAX_PRODUCT_IMAGES)
+
+    def to_internal_value(self, data):
+        images = data.get('images')
+        if isinstance(images, str):
+            data = {**data, 'images': [path.strip() for path in images.split(';') if path.strip()]}
+        return super().to_internal_value(data)
+
+
+def _decoded(stream):
+    # Построчно, а не блоками TextIOWrapper: ошибка декодирования указывает на свою строку
+    for line_no, line in enumerate(stream, start=1):
+        yield line.decode('utf-8-sig' if line_no == 1 else 'utf-8')
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict) from a binary CSV or JSONL stream without reading it whole
+
+    Unparsable rows are yielded as the exception. In CSV, where a row may
+    span lines, bytes that are not UTF-8 or a broken structure end the file
+    with that error.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(_decoded(stream))
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        except UnicodeDecodeError as exc:
+            # Строка с ошибкой не дошла до reader и не посчитана в line_num
+            yield reader.line_num + 1, exc
+        except csv.Error as exc:
+            yield reader.line_num, exc
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        try:
+            line = line.decode('utf-8-sig' if line_no == 1 else 'utf-8')
+            if not line.strip():
+                continue
+            row = json.loads(line)
+        except ValueError as exc:
+            row = exc
+        yield line_no, row
+
+
+class ProductImporter:
+    """Upsert products by name in chunked transactions, collecting per-row errors
+
+    Each chunk is validated, resolves its category names with one query
+    (cached across chunks), and is written with one bulk_create and one
+    bulk_update. If the chunk hits a database error it is replayed row by
+    row, so a single bad row never aborts the load.
+    """
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.categories = {}
+        self.seen_names = set()
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.import_chunk(chunk)
+        return self.report()
+
+    def report(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def resolve_categories(self, names):
+        missing = set(names) - self.categories.keys()
+        if missing:
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+        return self.categories
+
+    def validate_chunk(self, chunk):
+        valid = []
+        for line, row in chunk:
+            if not isinstance(row, dict):
+                self.add_error(line, {'non_field_errors': [str(row) if isinstance(row, Exception) else 'Expected an object.']})
+                continue
+            serializer = ProductImportRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.add_error(line, serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data['name'] in self.seen_names:
+                self.add_error(line, {'name': ['Duplicate product name in this import.']})
+                continue
+            self.seen_names.add(data['name'])
+            valid.append((line, data))
+
+        categories = self.resolve_categories({data['category'] for _, data in valid})
+        resolved = []
+        for line, data in valid:
+            if data['category'] not in categories:
+                self.add_error(line, {'category': [f"Unknown category '{data['category']}'."]})
+            else:
+                resolved.append((line, data))
+        return resolved
+
+    def import_chunk(self, chunk):
+        rows = self.validate_chunk(chunk)
+        if not rows:
+            return
+        try:
+            with transaction.atomic():
+                results = [self.write(rows)]
+        except DatabaseError:
+            results = []
+            for line, data in rows:
+                try:
+                    with transaction.atomic():
+                        results.append(self.write([(line, data)]))
+                except DatabaseError as exc:
+                    self.add_error(line, {'non_field_errors': [str(exc)]})
+
+        for created, updated, errors in results:
+            self.created += created
+            self.updated += updated
+            for line, error in errors:
+                self.add_error(line, error)
+
+    def write(self, rows):
+        """Upsert one batch, returns (created, updated, row errors)"""
+        existing = Product.objects.in_bulk([data['name'] for _, data in rows], field_name='name')
+        # Слоты, занятые незавершёнными загрузками, тоже считаются
+        image_counts = reserved_slot_counts([product.pk for product in existing.values()])
+        now = timezone.now()
+        to_create, to_update, images, errors = [], [], [], []
+        for line, data in rows:
+            product = existing.get(data['name']) or Product(name=data['name'])
+            if image_counts[product.pk] + len(data.get('images', [])) > MAX_PRODUCT_IMAGES:
+                errors.append((line, {'images': [f"A product can have at most {MAX_PRODUCT_IMAGES} images."]}))
+                continue
+            product.price = data['price']
+            product.description = data['description']
+            product.category_id = self.categories[data['category']]
+            product.updated_at = now
+            (to_update if product.pk else to_create).append(product)
+            images.extend(ProductImage(product=product, image=path) for path in data.get('images', []))
+
+        Product.objects.bulk_create(to_create)
+        Product.objects.bulk_update(to_update, ['price', 'description', 'category', 'updated_at'])
+        get_search_backend().index(to_create + to_update)
+        if images:
+            add_product_images(images)
+        bump_version('product')
+        return len(to_create), len(to_update), errors
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+# Наблюдатели текущего запроса; ContextVar копируется в потоки sync_to_async,
+# поэтому запросы async ORM тоже видны
+_observers = ContextVar('market_query_observers', default=())
+
+
+def dispatch_queries(execute, sql, params, many, context):
+    """execute_wrapper installed once per connection, reports to the observers of the current context"""
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - started
+        for observer in observers:
+            observer(sql, elapsed)
+
+
+def install(connection):
+    # В начало списка: временные execute_wrapper() снимаются через pop() с конца
+    if dispatch_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch_queries)
+
+
+@contextmanager
+def observe_queries(observer):
+    """Call `observer(sql, elapsed)` for every query run in this context, on any connection"""
+    token = _observers.set((*_observers.get(), observer))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
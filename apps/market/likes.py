@@ -0,0 +1,277 @@
+"""Write-behind buffer for photo like/dislike taps
+
+With MARKET_LIKE_WRITE_BEHIND on, a tap only reads: the user's current
+state and the photo's stored counters, overlaid with what is still
+buffered. The resulting state is kept in memory, coalesced per
+(user, photo). Every MARKET_LIKE_FLUSH_INTERVAL seconds, one transaction
+upserts/deletes the batch of PhotoLike rows. The same transaction
+recounts the touched photos and products from PhotoLike, so counters
+converge even when several processes buffer taps for the same photo.
+
+With MARKET_LIKE_JOURNAL_DIR set, every tap is also appended to a
+per-process journal, truncated after each successful flush. Journals of
+dead processes are replayed on start.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+from contextlib import suppress
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from .cache import bump_version
+from .models import PhotoLike, Product, ProductImage, likes_changed
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# base: состояние в БД на момент первой буферизации (UNKNOWN для записей из журнала)
+Entry = namedtuple('Entry', 'base state')
+UNKNOWN = object()
+DELETE_BATCH = 500
+# likes-{pid}.jsonl пишет процесс pid, replay-{pid}-<имя> он забрал у умершего
+JOURNAL_NAME = re.compile(r'^(?:replay-(\d+)-.+|likes-(\d+)\.jsonl)$')
+
+
+def _counts(state):
+    return int(state is True), int(state is False)
+
+
+class LikeBuffer:
+    def __init__(self):
+        self.pending = {}
+        self.by_photo = {}
+        self.generation = 0
+        self.lock = threading.RLock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.journal = None
+        self.replayed = []
+
+    # --- taps ---
+
+    def toggle(self, user, photo_id, is_like):
+        """Same contract as PhotoLike.objects.toggle, without writing: (is_like or None, likes, dislikes)"""
+        self.start()
+        user_id = user.pk
+        key = (user_id, photo_id)
+        while True:
+            with self.lock:
+                generation = self.generation
+                entry = self.pending.get(key)
+            row = (
+                ProductImage.objects.filter(pk=photo_id)
+                .annotate(mine=Subquery(PhotoLike.objects.filter(
+                    user_id=user_id, photo_id=OuterRef('pk')).values('is_like')[:1]))
+                .values_list('likes_count', 'dislikes_count', 'mine').first()
+            )
+            if row is None:
+                raise ProductImage.DoesNotExist
+            likes_count, dislikes_count, stored = row
+            with self.lock:
+                # Сброс буфера между чтением и записью: прочитанное уже устарело
+                if self.generation != generation:
+                    continue
+                entry = self.pending.get(key) or Entry(stored, stored)
+                current = None if entry.state is is_like else is_like
+                self._put(key, Entry(entry.base, current))
+                likes_delta, dislikes_delta = self._delta(photo_id)
+                self._journal(user_id, photo_id, current)
+            return current, likes_count + likes_delta, dislikes_count + dislikes_delta
+
+    def state(self, user_id, photo_id, stored):
+        """Buffered state for (user, photo), or `stored` when nothing is pending"""
+        entry = self.pending.get((user_id, photo_id))
+        return stored if entry is None else entry.state
+
+    def _put(self, key, entry):
+        self.pending[key] = entry
+        self.by_photo.setdefault(key[1], set()).add(key[0])
+
+    def _delta(self, photo_id):
+        likes = dislikes = 0
+        for user_id in self.by_photo.get(photo_id, ()):
+            entry = self.pending[(user_id, photo_id)]
+            if entry.base is UNKNOWN:
+                continue
+            (new_likes, new_dislikes), (old_likes, old_dislikes) = _counts(entry.state), _counts(entry.base)
+            likes += new_likes - old_likes
+            dislikes += new_dislikes - old_dislikes
+        return likes, dislikes
+
+    # --- flushing ---
+
+    def flush(self):
+        """Write the buffered batch in one transaction, returns the number of (user, photo) rows changed
+
+        Taps wait on the lock for the duration, so none of them reads a
+        half-applied batch.
+        """
+        with self.lock:
+            if not self.pending:
+                self._discard_replayed()
+                return 0
+            batch = self.pending
+            try:
+                written = self._write(batch)
+            except Exception:
+                logger.exception('Like buffer flush failed, %d pairs kept for the next attempt', len(batch))
+                return 0
+            self.pending, self.by_photo = {}, {}
+            self.generation += 1
+            if self.journal is not None:
+                self.journal.seek(0)
+                self.journal.truncate()
+            self._discard_replayed()
+            return written
+
+    def _write(self, batch):
+        changed = {key: entry.state for key, entry in batch.items() if entry.state is not entry.base}
+        if not changed:
+            return 0
+        # Фото или пользователя могли удалить, пока пара ждала в буфере
+        products = dict(ProductImage.objects.filter(
+            pk__in={photo_id for _, photo_id in changed}).values_list('pk', 'product_id'))
+        user_ids = set(User.objects.filter(
+            pk__in={user_id for user_id, _ in changed}).values_list('pk', flat=True))
+        changed = {key: state for key, state in changed.items() if key[0] in user_ids and key[1] in products}
+        upserts = [PhotoLike(user_id=user_id, photo_id=photo_id, is_like=state)
+                   for (user_id, photo_id), state in changed.items() if state is not None]
+        deletes = [Q(user_id=user_id, photo_id=photo_id)
+                   for (user_id, photo_id), state in changed.items() if state is None]
+        added = [key for key, state in changed.items()
+                 if state is True and batch[key].base is not UNKNOWN and batch[key].base is not True]
+        removed = [key for key, state in changed.items() if batch[key].base is True and state is not True]
+        with transaction.atomic():
+            # Снятый лайк вычитается из trending с весом своего created_at, его читаем до записи
+            removed_at = self._liked_at(removed)
+            if upserts:
+                # created_at — время текущей реакции, как в PhotoLike.objects.toggle
+                PhotoLike.objects.bulk_create(
+                    upserts, update_conflicts=True, unique_fields=['user', 'photo'],
+                    update_fields=['is_like', 'created_at'],
+                )
+            for start in range(0, len(deletes), DELETE_BATCH):
+                PhotoLike.objects.filter(reduce(or_, deletes[start:start + DELETE_BATCH])).delete()
+            photo_ids = {photo_id for _, photo_id in changed}
+            ProductImage.objects.filter(pk__in=photo_ids).recount_likes()
+            Product.objects.filter(images__in=photo_ids).distinct().recount_popularity()
+            bump_version('photolike')
+            added_at = self._liked_at(added)
+            likes_changed.send(sender=PhotoLike, changes=[
+                *((key[1], products[key[1]], 1, added_at.get(key)) for key in added),
+                *((key[1], products[key[1]], -1, removed_at.get(key)) for key in removed),
+            ])
+        return len(changed)
+
+    @staticmethod
+    def _liked_at(keys):
+        """{(user_id, photo_id): created_at} of the likes among `keys`"""
+        liked_at = {}
+        for start in range(0, len(keys), DELETE_BATCH):
+            pairs = [Q(user_id=user_id, photo_id=photo_id) for user_id, photo_id in keys[start:start + DELETE_BATCH]]
+            rows = PhotoLike.objects.filter(reduce(or_, pairs), is_like=True).values_list(
+                'user_id', 'photo_id', 'created_at')
+            liked_at.update(((user_id, photo_id), created_at) for user_id, photo_id, created_at in rows)
+        return liked_at
+
+    # --- background flusher and journal ---
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            directory = getattr(settings, 'MARKET_LIKE_JOURNAL_DIR', None)
+            if directory:
+                self._open_journal(directory)
+            interval = getattr(settings, 'MARKET_LIKE_FLUSH_INTERVAL', 0.5)
+            if interval > 0:
+                self.thread = threading.Thread(target=self._run, args=(interval,), name='market-likes', daemon=True)
+                self.thread.start()
+                atexit.register(self.stop)
+            else:
+                # Без фонового потока сбрасывает вызывающий (тесты, команды)
+                self.thread = False
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def _run(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+            finally:
+                connections.close_all()
+
+    def _open_journal(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            match = JOURNAL_NAME.match(name)
+            if match is None:
+                continue
+            owner = int(match.group(1) or match.group(2))
+            if owner == os.getpid() or _alive(owner):
+                continue
+            claimed = os.path.join(directory, f'replay-{os.getpid()}-{name}')
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # забрал другой процесс
+            with open(claimed) as journal:
+                for line in journal:
+                    try:
+                        user_id, photo_id, state = json.loads(line)
+                    except ValueError:
+                        continue  # оборванная последняя строка
+                    self._put((user_id, photo_id), Entry(UNKNOWN, state))
+            self.replayed.append(claimed)
+        self.journal = open(os.path.join(directory, f'likes-{os.getpid()}.jsonl'), 'a+')
+
+    def _journal(self, user_id, photo_id, state):
+        if self.journal is not None:
+            self.journal.write(json.dumps([user_id, photo_id, state]) + '\n')
+            self.journal.flush()
+
+    def _discard_replayed(self):
+        for path in self.replayed:
+            # Файл мог удалить кто-то ещё, поток сброса от этого падать не должен
+            with suppress(FileNotFoundError):
+                os.remove(path)
+        self.replayed = []
+
+    def clear(self):
+        """Drop everything buffered without writing it"""
+        with self.lock:
+            self.pending, self.by_photo = {}, {}
+            self.generation += 1
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+buffer = LikeBuffer()
+
+
+def is_enabled():
+    return getattr(settings, 'MARKET_LIKE_WRITE_BEHIND', False)
@@ -0,0 +1,34 @@
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueLogHandler(QueueHandler):
+    """Hand records to a background thread so request threads never wait on console/file I/O
+
+    `handlers` are the target handler objects; in LOGGING pass them as
+    'cfg://handlers.<name>' and give this handler a name that sorts after
+    theirs, since dictConfig builds handlers in alphabetical order.
+    When the queue is full records are dropped and counted instead of blocking.
+    """
+
+    def __init__(self, handlers, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        # ConvertingList резолвит cfg:// только через __getitem__, не через __iter__
+        targets = [handlers[i] for i in range(len(handlers))]
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()  # дописывает очередь до конца
+        super().close()
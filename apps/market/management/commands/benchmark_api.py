@@ -0,0 +1,101 @@
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from apps.market import benchmark
+from apps.market.cache import get_cache
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+SIZE_OPTIONS = ('categories', 'products', 'images', 'likes', 'users')
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic catalog in a throwaway test database and report p50/p95/p99 latency, "
+            "throughput and query counts for every market and accounts endpoint")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--images', type=int, default=2, help="Images per product")
+        parser.add_argument('--likes', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=30, help="Requests per endpoint and mode")
+        parser.add_argument('--concurrency', type=int, default=8, help="Parallel requests in ASGI mode")
+        parser.add_argument('--mode', choices=['client', 'asgi', 'both'], default='both')
+        parser.add_argument('--only', help="Run only endpoints whose name contains this text")
+        parser.add_argument('--cold', action='store_true', help="Clear the catalog cache before each client request")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help="Overwrite the baseline with this run")
+        # Время зависит от машины: по умолчанию регрессией считаются только запросы к БД и ошибки
+        parser.add_argument('--check-timings', action='store_true', help="Also fail on p95 slowdowns vs baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 slowdown with --check-timings")
+        parser.add_argument('--json', help="Also write the full results to this file")
+
+    def handle(self, *args, **options):
+        params = {name: options[name] for name in (*SIZE_OPTIONS, 'repeat', 'concurrency', 'cold')}
+        baseline_path = Path(options['baseline'])
+        if not options['save_baseline'] and not baseline_path.exists():
+            raise CommandError(f"No baseline at {baseline_path}, record one with --save-baseline")
+        scenarios = [s for s in benchmark.default_scenarios()
+                     if not options['only'] or options['only'] in s.name]
+        if not scenarios:
+            raise CommandError(f"No endpoint matches {options['only']!r}")
+
+        results = {}
+        media_root = tempfile.mkdtemp(prefix='market-bench-')
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # Загрузки пишутся во временный MEDIA_ROOT, профилировщик не искажает замеры
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['*'], MARKET_QUERY_PROFILER='off'):
+                get_cache().clear()
+                catalog = benchmark.seed_catalog(**{name: options[name] for name in SIZE_OPTIONS})
+                if options['mode'] in ('client', 'both'):
+                    for name, row in benchmark.run_client(catalog, scenarios, options['repeat'],
+                                                          cold=options['cold']).items():
+                        results[f'client:{name}'] = row
+                if options['mode'] in ('asgi', 'both'):
+                    rows, transport = benchmark.run_asgi(catalog, scenarios, options['repeat'],
+                                                         options['concurrency'])
+                    self.stderr.write(f"ASGI transport: {transport}")
+                    for name, row in rows.items():
+                        results[f'asgi:{name}'] = row
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.print_table(results)
+        if options['json']:
+            Path(options['json']).write_text(json.dumps({'params': params, 'results': results}, indent=2))
+
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({'params': params, 'results': results}, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        if baseline['params'] != params:
+            raise CommandError(f"{baseline_path} was recorded with {baseline['params']}, rerun with the "
+                               f"same sizes or --save-baseline")
+        tolerance = options['tolerance'] if options['check_timings'] else None
+        failures = benchmark.compare(results, baseline['results'], tolerance=tolerance)
+        if failures:
+            raise CommandError("Regressions against baseline:\n  " + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path}"))
+
+    def print_table(self, results):
+        self.stdout.write(f"{'endpoint':32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} "
+                          f"{'queries':>7} {'errors':>6}")
+        for key, row in results.items():
+            queries = '-' if row['queries'] is None else row['queries']
+            self.stdout.write(f"{key:32} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f} "
+                              f"{row['rps'] or 0:8.1f} {queries:>7} {row['errors']:>6}")
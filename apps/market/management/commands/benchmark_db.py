@@ -0,0 +1,78 @@
+import copy
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from apps.market import benchmark
+from apps.market.cache import get_cache
+
+# Django's SQLite defaults: rollback journal, deferred transactions, a fresh connection per request
+BASELINE = {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}}
+
+
+class Command(BaseCommand):
+    help = ("Compare concurrent like toggles and catalog reads on a throwaway file-backed SQLite database, "
+            "with Django's defaults (baseline) and with the connection settings from config.settings (tuned)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Threads toggling likes")
+        parser.add_argument('--readers', type=int, default=8, help="Threads listing products")
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--hot-photos', type=int, default=20, help="Photos the toggles are spread over")
+        parser.add_argument('--profile', choices=['baseline', 'tuned', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("benchmark_db compares SQLite connection settings, the default database is "
+                               f"{connection.vendor}")
+        configured = copy.deepcopy(connection.settings_dict)
+        profiles = {'baseline': BASELINE, 'tuned': {key: configured[key] for key in BASELINE}}
+        if options['profile'] != 'both':
+            profiles = {options['profile']: profiles[options['profile']]}
+
+        results = {}
+        setup_test_environment(debug=False)
+        try:
+            for name, profile in profiles.items():
+                directory = tempfile.mkdtemp(prefix='market-db-bench-')
+                # Как тестовый раннер: меняем settings_dict на месте, новые соединения потоков берут его же
+                connection.close()
+                connection.settings_dict.update(copy.deepcopy(profile))
+                connection.settings_dict['TEST'] = {**configured['TEST'], 'NAME': Path(directory) / 'bench.sqlite3'}
+                old_config = setup_databases(verbosity=0, interactive=False)
+                try:
+                    with override_settings(MARKET_QUERY_PROFILER='off', MARKET_IMAGE_WORKERS=0):
+                        get_cache().clear()
+                        catalog = benchmark.seed_catalog(
+                            categories=10, products=500, images=2, likes=2000, users=max(options['writers'], 1))
+                        rows = benchmark.run_write_concurrency(
+                            catalog, options['writers'], options['readers'], options['seconds'],
+                            hot_photos=options['hot_photos'])
+                        for kind, row in rows.items():
+                            results[f'{name}:{kind}'] = row
+                finally:
+                    teardown_databases(old_config, verbosity=0)
+                    connection.settings_dict.clear()
+                    connection.settings_dict.update(copy.deepcopy(configured))
+                    shutil.rmtree(directory, ignore_errors=True)
+        finally:
+            teardown_test_environment()
+
+        self.print_table(results)
+
+    def print_table(self, results):
+        self.stdout.write(f"{'profile:operation':20} {'ops':>7} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'errors':>6}")
+        for key, row in results.items():
+            self.stdout.write(f"{key:20} {row['requests']:>7} {row['rps'] or 0:8.1f} {row['p50_ms']:9.2f} "
+                              f"{row['p95_ms']:9.2f} {row['p99_ms']:9.2f} {row['errors']:>6}")
+        for key, row in results.items():
+            failures = {status: count for status, count in row['statuses'].items() if status != 'ok'}
+            if failures:
+                self.stdout.write(f"{key}: {failures}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from apps.market import benchmark, payloads
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic catalog in a throwaway test database and compare the CPU time of building and "
+            "encoding it with ProductGetSerializer + JSONRenderer and with apps.market.payloads")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--images', type=int, default=2, help="Images per product")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement, the fastest one counts")
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            benchmark.seed_catalog(categories=20, products=options['products'], images=options['images'],
+                                   likes=0, users=1)
+            results = benchmark.run_serialization(options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{options['products']} products, encoder: {payloads.get_dumps()!r}")
+        self.stdout.write(f"{'path':12} {'build s':>9} {'encode s':>9} {'total s':>9} {'MB':>7}")
+        for name, row in results.items():
+            self.stdout.write(f"{name:12} {row['build_s']:9.3f} {row['encode_s']:9.3f} "
+                              f"{row['build_s'] + row['encode_s']:9.3f} {row['bytes'] / 1e6:7.1f}")
+        baseline, fast = results['serializer'], results['payloads']
+        speedup = (baseline['build_s'] + baseline['encode_s']) / max(fast['build_s'] + fast['encode_s'], 1e-9)
+        self.stdout.write(self.style.SUCCESS(f"payloads are {speedup:.1f}x faster"))
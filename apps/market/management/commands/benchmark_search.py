@@ -0,0 +1,76 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.market.models import Category, Product
+from apps.market.search import get_backend
+
+SYLLABLES = 'ka lo mi ne ra su ti vo ze ba de fi go hu ja ku le mo nu pa'.split()
+
+
+def vocabulary(size=20000):
+    """Deterministic pseudo-words, index 0 is the most frequent one"""
+    words = (''.join(parts) for n in (2, 3, 4) for parts in itertools.product(SYLLABLES, repeat=n))
+    return list(itertools.islice(words, size))
+
+
+class Command(BaseCommand):
+    help = "Measure product search latency (p50/p95/p99), optionally seeding a synthetic catalog first"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Synthetic products to insert before measuring")
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+
+        words = vocabulary()
+        backend = get_backend()
+        categories = list(Category.objects.values_list('id', flat=True)[:3])
+        # Частота слов падает по Ципфу: words[10] есть примерно в 18% товаров, words[300] в ~0.7%, words[5000] в ~0.04%
+        cases = [
+            ('common token', words[10], None, 0),
+            ('medium token', words[300], None, 0),
+            ('rare token', words[5000], None, 0),
+            ('prefix', words[300][:3], None, 0),
+            ('two tokens', f'{words[20]} {words[300]}', None, 0),
+            ('category filter', words[300], categories, 0),
+            ('deep page', words[10], None, 1000),
+        ]
+        self.stdout.write(f"{type(backend).__name__}, {Product.objects.count()} products")
+        for label, query, category_ids, offset in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                backend.search(query, category_ids=category_ids, limit=options['limit'], offset=offset)
+                timings.append((time.perf_counter() - started) * 1000)
+            p50, p95, p99 = (statistics.quantiles(timings, n=100)[i] for i in (49, 94, 98))
+            self.stdout.write(f"{label:16} {query!r:16} p50={p50:7.2f}ms p95={p95:7.2f}ms p99={p99:7.2f}ms")
+
+    def seed(self, count, batch_size=10000):
+        rng = random.Random(0)
+        words = vocabulary()
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+        categories = [
+            Category.objects.get_or_create(name=f'Benchmark {n}', defaults={'images': 'category_image/bench.jpg'})[0]
+            for n in range(50)
+        ]
+        start = Product.objects.count()
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        name=f"{' '.join(rng.choices(words, cum_weights=weights, k=3))} {start + n}",
+                        price=rng.randint(100, 100000) / 100,
+                        description=' '.join(rng.choices(words, cum_weights=weights, k=20)),
+                        category=rng.choice(categories),
+                    )
+                    for n in range(offset, min(offset + batch_size, count))
+                ])
+            self.stderr.write(f"seeded {min(offset + batch_size, count)}/{count}")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.market import media
+
+
+class Command(BaseCommand):
+    help = ("Move product and category images stored before the content-addressed storage into it, "
+            "keeping one file per distinct content")
+
+    def handle(self, *args, **options):
+        adopted, blobs = media.adopt_existing()
+        self.stdout.write(self.style.SUCCESS(f"Moved {adopted} files into {blobs} blobs"))
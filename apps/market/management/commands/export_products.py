@@ -0,0 +1,29 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.market.exporter import export_products
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as NDJSON (optionally gzip) in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="File path, '-' for stdout")
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=settings.MARKET_EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        blocks = export_products(chunk_size=options['chunk_size'], gzip=options['gzip'])
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for block in blocks:
+                out.write(block)
+            out.flush()
+            return
+
+        with open(options['output'], 'wb') as out:
+            for block in blocks:
+                out.write(block)
+        self.stderr.write(self.style.SUCCESS(f"Exported catalog to {options['output']}"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.market import media
+
+
+class Command(BaseCommand):
+    help = ("Recount the references to content-addressed catalog images and delete the blobs no ProductImage "
+            "or Category uses any more")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        removed, freed = media.collect_garbage(dry_run=options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} unreferenced blobs, {freed / 2 ** 20:.1f} MiB"))
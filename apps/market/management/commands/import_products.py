@@ -0,0 +1,33 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.importer import FORMATS, ProductImporter, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert products from a CSV or JSONL file, reporting invalid rows by line number"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--chunk-size', type=int, default=settings.MARKET_IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt == 'ndjson':
+            fmt = 'jsonl'
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot infer the format of {path}, pass --format")
+
+        with open(path, 'rb') as stream:
+            report = ProductImporter(chunk_size=options['chunk_size']).run(iter_rows(stream, fmt))
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']}, updated {report['updated']}, {report['error_count']} rows rejected"
+        ))
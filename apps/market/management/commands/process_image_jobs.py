@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.market import images
+from apps.market.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = "Process pending image jobs left over after a restart (and optionally retry failed ones)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true')
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help="Seconds after which a running job is considered abandoned",
+        )
+
+    def handle(self, *args, **options):
+        stale = timezone.now() - timedelta(seconds=options['stale_after'])
+        ImageJob.objects.filter(status=ImageJob.RUNNING, updated_at__lt=stale).update(status=ImageJob.PENDING)
+
+        statuses = [ImageJob.PENDING]
+        if options['retry_failed']:
+            statuses.append(ImageJob.FAILED)
+        job_ids = ImageJob.objects.filter(
+            status__in=statuses, attempts__lt=options['max_attempts']
+        ).order_by('id').values_list('id', flat=True)
+
+        done = failed = 0
+        for job_id in job_ids.iterator():
+            if images.process_job(job_id):
+                done += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} image jobs, {failed} failed"))
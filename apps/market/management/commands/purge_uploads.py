@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.market import uploads
+
+
+class Command(BaseCommand):
+    help = ("Delete upload sessions untouched for MARKET_UPLOAD_EXPIRY_HOURS together with their chunks, "
+            "freeing the image slots they hold")
+
+    def handle(self, *args, **options):
+        removed = uploads.purge()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired uploads"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.market.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from market_product"
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index ({type(backend).__name__})"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.market import rankings
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the trending scores of photos and products from PhotoLike and move the ranking epoch "
+            "to now; run periodically (e.g. hourly from cron) to correct incremental drift")
+
+    def handle(self, *args, **options):
+        photos, products = rankings.recompute()
+        self.stdout.write(self.style.SUCCESS(f"Scored {photos} photos and {products} products"))
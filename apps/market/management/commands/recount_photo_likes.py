@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.market.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Recompute ProductImage.likes_count/dislikes_count from PhotoLike and Product.popularity to repair drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = repaired = 0
+        while True:
+            ids = list(
+                ProductImage.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                repaired += ProductImage.objects.filter(id__in=ids).select_for_update().recount_likes()
+            total += len(ids)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted likes for {total} photos, repaired {repaired}"))
+
+        last_id = 0
+        total = repaired = 0
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                repaired += Product.objects.filter(id__in=ids).select_for_update().recount_popularity()
+            total += len(ids)
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted popularity for {total} products, repaired {repaired}"))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copy the SQLite primary into the SQLite files standing in for MARKET_READ_REPLICAS, once or every "
+            "--interval seconds, so replica lag can be reproduced locally")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="Repeat every N seconds until interrupted")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        replicas = [connections[alias] for alias in settings.MARKET_READ_REPLICAS]
+        if primary.vendor != 'sqlite' or any(replica.vendor != 'sqlite' for replica in replicas):
+            raise CommandError("Only SQLite stand-ins can be synced, real replicas replicate themselves")
+        if not replicas:
+            raise CommandError("No replicas configured, set DB_REPLICAS")
+
+        while True:
+            primary.ensure_connection()
+            for replica in replicas:
+                replica.ensure_connection()
+                # Онлайн-бэкап SQLite: согласованный снимок, читатели реплики не видят его наполовину
+                primary.connection.backup(replica.connection)
+                self.stdout.write(f"{replica.alias} <- {primary.alias} ({replica.settings_dict['NAME']})")
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,85 @@
+"""Maintenance of the content-addressed catalog storage (apps.market.storage)"""
+import os
+import time
+
+from django.conf import settings
+from django.db.models.functions import Now
+
+from .cache import bump_version
+from .models import Category, MediaBlob, ProductImage
+from .storage import catalog_storage, is_blob
+
+DELETE_BATCH = 500
+
+
+def get_grace_seconds():
+    return getattr(settings, 'MARKET_MEDIA_GC_GRACE_HOURS', 1) * 3600
+
+
+def collect_garbage(dry_run=False):
+    """Delete blobs no row references, returns (files removed, bytes freed)
+
+    Refcounts are recomputed from the rows first, so drift never costs a
+    referenced file. A blob is only removed once it has also gone unwritten
+    for MARKET_MEDIA_GC_GRACE_HOURS: a save, new or deduplicated, touches
+    it before the row referencing it is committed.
+    """
+    storage = catalog_storage()
+    MediaBlob.objects.recount()
+    referenced = set(MediaBlob.objects.filter(refcount__gt=0).values_list('name', flat=True))
+    cutoff = time.time() - get_grace_seconds()
+
+    removed, freed = [], 0
+    for name in storage.blob_names():
+        if name in referenced:
+            continue
+        path = storage.path(name)
+        stat = os.stat(path)
+        if stat.st_mtime >= cutoff:
+            continue
+        if not dry_run:
+            os.remove(path)
+        removed.append(name)
+        freed += stat.st_size
+
+    if not dry_run:
+        for start in range(0, len(removed), DELETE_BATCH):
+            MediaBlob.objects.filter(name__in=removed[start:start + DELETE_BATCH], refcount=0).delete()
+    return len(removed), freed
+
+
+def adopt_existing():
+    """Move files saved before the blob store into it and point their rows at the blobs
+
+    Returns (files adopted, blobs they collapsed into). Each old file is
+    deleted once every row referencing it has been rewritten.
+    """
+    storage = catalog_storage()
+    blobs = {}
+
+    def adopt(name):
+        if not name or is_blob(name) or not storage.exists(name):
+            return name
+        if name not in blobs:
+            with storage.open(name) as file:
+                blobs[name] = storage.save(name, file)
+        return blobs[name]
+
+    for photo in ProductImage.objects.only('id', 'image', 'variants').iterator():
+        image = adopt(photo.image.name)
+        variants = {size: {fmt: adopt(path) for fmt, path in formats.items()}
+                    for size, formats in photo.variants.items()}
+        if image != photo.image.name or variants != photo.variants:
+            ProductImage.objects.filter(pk=photo.pk).update(image=image, variants=variants, updated_at=Now())
+    for category in Category.objects.only('id', 'images').iterator():
+        images = adopt(category.images.name)
+        if images != category.images.name:
+            Category.objects.filter(pk=category.pk).update(images=images, updated_at=Now())
+
+    for name in blobs:
+        storage.delete(name)
+    MediaBlob.objects.recount()
+    if blobs:
+        bump_version('productimage')
+        bump_version('category')
+    return len(blobs), len(set(blobs.values()))
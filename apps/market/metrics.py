@@ -0,0 +1,186 @@
+import hmac
+import json
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+
+from .cache import stats as cache_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RouteStats:
+    """Aggregates for one (method, route): histograms keep per-bucket counts, cumulated on export"""
+    __slots__ = ('statuses', 'latency', 'latency_sum', 'queries', 'queries_sum', 'query_time',
+                 'size', 'size_sum', 'size_count')
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.queries = [0] * (len(QUERY_BUCKETS) + 1)
+        self.queries_sum = 0
+        self.query_time = 0.0
+        self.size = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+        self.size_count = 0
+
+    def copy(self):
+        other = RouteStats()
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(other, name, value.copy() if isinstance(value, (list, dict)) else value)
+        return other
+
+
+class Registry:
+    """In-process request metrics
+
+    Bucket indices are computed before taking the lock, so the critical
+    section is a handful of integer increments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, method, route, status, duration, queries, query_time, size=None):
+        latency_bucket = bisect_left(LATENCY_BUCKETS, duration)
+        query_bucket = bisect_left(QUERY_BUCKETS, queries)
+        size_bucket = bisect_left(SIZE_BUCKETS, size) if size is not None else None
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats()
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.latency[latency_bucket] += 1
+            stats.latency_sum += duration
+            stats.queries[query_bucket] += 1
+            stats.queries_sum += queries
+            stats.query_time += query_time
+            if size_bucket is not None:
+                stats.size[size_bucket] += 1
+                stats.size_sum += size
+                stats.size_count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: stats.copy() for key, stats in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _histogram(lines, name, buckets, counts, total, count, labels):
+    cumulative = 0
+    for bound, bucket_count in zip(buckets, counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {total}')
+    lines.append(f'{name}_count{_labels(**labels)} {count}')
+
+
+def render_prometheus(snapshot=None, cache=None):
+    """Prometheus text exposition format 0.0.4"""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    cache = cache_stats.snapshot() if cache is None else cache
+    routes = sorted(snapshot.items())
+    lines = [
+        '# HELP market_http_requests_total Requests by route and status code.',
+        '# TYPE market_http_requests_total counter',
+    ]
+    for (method, route), stats in routes:
+        for code, count in sorted(stats.statuses.items()):
+            lines.append(f'market_http_requests_total{_labels(method=method, route=route, status=code)} {count}')
+
+    lines += [
+        '# HELP market_http_request_duration_seconds Request latency.',
+        '# TYPE market_http_request_duration_seconds histogram',
+    ]
+    for (method, route), stats in routes:
+        _histogram(lines, 'market_http_request_duration_seconds', LATENCY_BUCKETS, stats.latency,
+                   stats.latency_sum, sum(stats.latency), {'method': method, 'route': route})
+
+    lines += [
+        '# HELP market_http_db_queries SQL queries per request.',
+        '# TYPE market_http_db_queries histogram',
+    ]
+    for (method, route), stats in routes:
+        _histogram(lines, 'market_http_db_queries', QUERY_BUCKETS, stats.queries,
+                   stats.queries_sum, sum(stats.queries), {'method': method, 'route': route})
+
+    lines += [
+        '# HELP market_http_db_query_seconds_total Time spent in SQL queries.',
+        '# TYPE market_http_db_query_seconds_total counter',
+    ]
+    for (method, route), stats in routes:
+        lines.append(f'market_http_db_query_seconds_total{_labels(method=method, route=route)} {stats.query_time}')
+
+    lines += [
+        '# HELP market_http_response_bytes Response body size, streaming responses excluded.',
+        '# TYPE market_http_response_bytes histogram',
+    ]
+    for (method, route), stats in routes:
+        _histogram(lines, 'market_http_response_bytes', SIZE_BUCKETS, stats.size,
+                   stats.size_sum, stats.size_count, {'method': method, 'route': route})
+
+    lines += [
+        '# HELP market_cache_lookups_total Catalog response cache lookups by result.',
+        '# TYPE market_cache_lookups_total counter',
+        f'market_cache_lookups_total{_labels(result="hit")} {cache["hits"]}',
+        f'market_cache_lookups_total{_labels(result="miss")} {cache["misses"]}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            data = json.dumps(data)  # ошибки аутентификации/прав
+        return data.encode(self.charset)
+
+
+SCRAPER = 'metrics-scraper'
+
+
+class ScrapeTokenAuthentication(BaseAuthentication):
+    """`Authorization: Bearer <MARKET_METRICS_TOKEN>` for Prometheus, checked before JWT"""
+
+    def authenticate(self, request):
+        token = getattr(settings, 'MARKET_METRICS_TOKEN', None)
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return AnonymousUser(), SCRAPER
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+class CanScrapeMetrics(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth == SCRAPER or bool(request.user and request.user.is_staff)
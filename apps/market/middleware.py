@@ -1,35 +1,158 @@
-from django.utils.deprecation import MiddlewareMixin
+import json
+import logging
+from time import perf_counter
 
-class SimpleLoggingMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        print(f"➡️ Նոր հարցում: {request.method} {request.path}")
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import routers
+from .instrumentation import observe_queries
+from .metrics import registry
+from .profiling import QueryProfiler
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """Query observer counting queries and the time spent in them"""
+    __slots__ = ('count', 'elapsed')
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, sql, elapsed):
+        self.count += 1
+        self.elapsed += elapsed
 
-    def process_response(self, request, response):
-        print(f"⬅️ Պատասխան՝ {response.status_code}")
-        return response
-    
-import logging
-import time
 
-logger = logging.getLogger('django.request')
+class HybridMiddleware:
+    """Runs natively under both WSGI and ASGI
+
+    `before(request)` returns a context manager wrapped around the rest of
+    the chain (or None to pass the request through untouched), `after`
+    receives it together with the response. Both default to a pass-through,
+    like Django's MiddlewareMixin.
+    """
+    sync_capable = True
+    async_capable = True
 
-class LoggingMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        # Логируем входящий запрос
-        logger.info(f"Request: {request.method} {request.get_full_path()} User: {request.user}")
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.before(request)
+        if state is None:
+            return self.get_response(request)
+        with state:
+            response = self.get_response(request)
+        return self.after(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.before(request)
+        if state is None:
+            return await self.get_response(request)
+        with state:
+            response = await self.get_response(request)
+        return self.after(request, response, state)
+
+    def before(self, request):
+        return None
+
+    def after(self, request, response, state):
+        return response
+
+
+class RequestTimer:
+    __slots__ = ('queries', 'started', '_observing')
+
+    def __enter__(self):
+        self.queries = QueryCounter()
+        self._observing = observe_queries(self.queries)
+        self._observing.__enter__()
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._observing.__exit__(*exc_info)
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Per-route latency/status/SQL/size aggregates for /api/metrics/
+
+    Nothing is written per request: only requests slower than
+    MARKET_SLOW_REQUEST_SECONDS are logged, through the queue handler.
+    request.user is never touched, so no session or user lookup happens here.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.slow_request = getattr(settings, 'MARKET_SLOW_REQUEST_SECONDS', 1.0)
+
+    def before(self, request):
+        return RequestTimer()
+
+    def after(self, request, response, timer):
+        duration = perf_counter() - timer.started
+        queries = timer.queries
+        match = request.resolver_match
+        # Шаблон маршрута, а не путь: количество серий не растёт с числом id
+        route = match.route if match is not None else '<unmatched>'
+        size = None if response.streaming else len(response.content)
+        registry.observe(request.method, route, response.status_code, duration,
+                         queries.count, queries.elapsed, size)
+
+        if duration >= self.slow_request:
+            logger.warning('Slow request: %s %s -> %s in %.3fs, %d queries (%.3fs)',
+                           request.method, request.path, response.status_code, duration,
+                           queries.count, queries.elapsed)
+        return response
+
+
+class QueryProfilerMiddleware(HybridMiddleware):
+    """Opt-in per-request SQL profile: `X-Query-Profile` summary header plus a JSON report in the log
+
+    MARKET_QUERY_PROFILER is 'off', 'always', or 'header' to profile only
+    requests sent with `X-Profile-Queries: 1`.
+    """
+    header = 'X-Profile-Queries'
+
+    def before(self, request):
+        mode = getattr(settings, 'MARKET_QUERY_PROFILER', 'off')
+        if mode == 'off' or (mode == 'header' and request.headers.get(self.header) != '1'):
+            return None
+        return QueryProfiler()
+
+    def after(self, request, response, profiler):
+        response['X-Query-Profile'] = profiler.summary()
+        report = {'method': request.method, 'path': request.get_full_path(), 'status': response.status_code,
+                  **profiler.report()}
+        log = logger.warning if report['n_plus_one'] else logger.info
+        log('Query profile %s', json.dumps(report, ensure_ascii=False))
+        return response
+
 
-        start_time = time.time()
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """Scope of replica routing (apps.market.routers) for one request
 
-        response = self.get_response(request)
+    A request that wrote sets a cookie keeping the client's reads on the
+    primary for MARKET_REPLICA_LAG_SECONDS, longer than the replicas lag.
+    """
+    cookie = 'market_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
 
-        duration = time.time() - start_time
-        # Логируем ответ и время обработки
-        logger.info(
-            f"Response: {response.status_code} for {request.method} {request.get_full_path()} "
-            f"Duration: {duration:.3f}s"
-        )
+    def before(self, request):
+        if not routers.get_replicas():
+            return None
+        pinned = request.method not in self.safe_methods or self.cookie in request.COOKIES
+        return routers.ReplicaState(pinned)
 
+    def after(self, request, response, state):
+        if state.wrote:
+            response.set_cookie(self.cookie, '1', max_age=routers.get_lag(), httponly=True, samesite='Lax')
         return response
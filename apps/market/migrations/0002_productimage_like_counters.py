@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_counters(apps, schema_editor):
+    ProductImage = apps.get_model('market', 'ProductImage')
+    PhotoLike = apps.get_model('market', 'PhotoLike')
+
+    def count(is_like):
+        likes = (
+            PhotoLike.objects.filter(photo=OuterRef('pk'), is_like=is_like)
+            .values('photo')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return Coalesce(Subquery(likes), 0)
+
+    ProductImage.objects.update(likes_count=count(True), dislikes_count=count(False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_counters, migrations.RunPython.noop),
+    ]
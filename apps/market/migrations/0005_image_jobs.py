@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def enqueue_existing_images(apps, schema_editor):
+    ProductImage = apps.get_model('market', 'ProductImage')
+    ImageJob = apps.get_model('market', 'ImageJob')
+    # Обрабатываются командой process_image_jobs
+    ImageJob.objects.bulk_create(
+        [ImageJob(image_id=image_id) for image_id in ProductImage.objects.values_list('id', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_catalog_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='market.productimage')),
+            ],
+        ),
+        migrations.RunPython(enqueue_existing_images, migrations.RunPython.noop),
+    ]
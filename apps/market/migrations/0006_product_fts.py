@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# FTS5 external-content index над market_product, синхронизируется триггерами.
+# SQLite пересоздаёт таблицу при некоторых AlterField/AddField и теряет триггеры:
+# такие миграции market_product должны создать их заново.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE market_product_fts USING fts5(
+        name, description, category_id UNINDEXED,
+        content='market_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER market_product_fts_ai AFTER INSERT ON market_product BEGIN
+        INSERT INTO market_product_fts(rowid, name, description, category_id)
+        VALUES (new.id, new.name, new.description, new.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER market_product_fts_ad AFTER DELETE ON market_product BEGIN
+        INSERT INTO market_product_fts(market_product_fts, rowid, name, description, category_id)
+        VALUES ('delete', old.id, old.name, old.description, old.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER market_product_fts_au AFTER UPDATE OF name, description, category_id ON market_product BEGIN
+        INSERT INTO market_product_fts(market_product_fts, rowid, name, description, category_id)
+        VALUES ('delete', old.id, old.name, old.description, old.category_id);
+        INSERT INTO market_product_fts(rowid, name, description, category_id)
+        VALUES (new.id, new.name, new.description, new.category_id);
+    END
+    """,
+    "INSERT INTO market_product_fts(market_product_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS market_product_fts_au',
+    'DROP TRIGGER IF EXISTS market_product_fts_ad',
+    'DROP TRIGGER IF EXISTS market_product_fts_ai',
+    'DROP TABLE IF EXISTS market_product_fts',
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_image_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
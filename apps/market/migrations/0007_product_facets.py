@@ -0,0 +1,82 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+# AddField на SQLite пересоздаёт market_product и удаляет FTS-триггеры из 0006
+FTS_TRIGGERS_SQL = [
+    'DROP TRIGGER IF EXISTS market_product_fts_ai',
+    'DROP TRIGGER IF EXISTS market_product_fts_ad',
+    'DROP TRIGGER IF EXISTS market_product_fts_au',
+    """
+    CREATE TRIGGER market_product_fts_ai AFTER INSERT ON market_product BEGIN
+        INSERT INTO market_product_fts(rowid, name, description, category_id)
+        VALUES (new.id, new.name, new.description, new.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER market_product_fts_ad AFTER DELETE ON market_product BEGIN
+        INSERT INTO market_product_fts(market_product_fts, rowid, name, description, category_id)
+        VALUES ('delete', old.id, old.name, old.description, old.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER market_product_fts_au AFTER UPDATE OF name, description, category_id ON market_product BEGIN
+        INSERT INTO market_product_fts(market_product_fts, rowid, name, description, category_id)
+        VALUES ('delete', old.id, old.name, old.description, old.category_id);
+        INSERT INTO market_product_fts(rowid, name, description, category_id)
+        VALUES (new.id, new.name, new.description, new.category_id);
+    END
+    """,
+]
+
+
+def restore_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+def backfill_popularity(apps, schema_editor):
+    Product = apps.get_model('market', 'Product')
+    ProductImage = apps.get_model('market', 'ProductImage')
+    likes = (
+        ProductImage.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(total=Sum('likes_count'))
+        .values('total')
+    )
+    Product.objects.update(popularity=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0006_product_fts'),
+    ]
+
+    operations = [
+        # При откате RemoveField снова пересоздаёт таблицу, триггеры восстанавливаются после него
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['popularity', 'id'], name='product_popularity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_cat_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'popularity', 'id'], name='product_cat_pop_id_idx'),
+        ),
+    ]
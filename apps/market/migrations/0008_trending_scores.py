@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0007_product_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImageScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='market.category')),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='market.productimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'score', 'id'], name='imagescore_cat_score_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='market.category')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trending', to='market.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'score', 'id'], name='productscore_cat_score_idx')],
+            },
+        ),
+    ]
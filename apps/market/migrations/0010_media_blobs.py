@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:16
+
+import apps.market.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='images',
+            field=models.ImageField(storage=apps.market.storage.catalog_storage, upload_to='category_image'),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=apps.market.storage.catalog_storage, upload_to='product_images'),
+        ),
+    ]
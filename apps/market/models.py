@@ -1,13 +1,217 @@
-from django.db import models
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Greatest, Now
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
+from .cache import bump_version
+from .storage import catalog_storage, is_blob
+
 User = get_user_model()
 
+# Не больше стольких фото у товара, считая открытые UploadSession
+MAX_PRODUCT_IMAGES = 5
+
+# Отправляется внутри транзакции записи: changes = [(photo_id, product_id, likes_delta, liked_at), ...],
+# liked_at — created_at добавленного или снятого лайка
+likes_changed = Signal()
+
+
+class CategoryQuerySet(models.QuerySet):
+    def with_catalog(self):
+        """Prefetch products -> images in a fixed number of queries"""
+        return self.prefetch_related(
+            Prefetch('products', queryset=Product.objects.with_images())
+        )
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_images(self):
+        return self.prefetch_related('images')
+
+    def browse(self, category_ids=None, min_price=None, max_price=None, has_images=None):
+        """Catalog filters, each one served by the (category, price|popularity, id) indexes"""
+        products = self
+        if category_ids:
+            products = products.filter(category_id__in=category_ids)
+        if min_price is not None:
+            products = products.filter(price__gte=min_price)
+        if max_price is not None:
+            products = products.filter(price__lte=max_price)
+        if has_images is not None:
+            has_any = Exists(ProductImage.objects.filter(product=OuterRef('pk')))
+            products = products.filter(has_any if has_images else ~has_any)
+        return products
+
+    def facet_counts(self, buckets, category_ids=None, min_price=None, max_price=None):
+        """Product counts per category and per price bucket in one GROUP BY query
+
+        `buckets` are ascending upper bounds, the last bucket is open-ended.
+        Each facet ignores its own filter (so other categories/ranges stay
+        selectable) but respects the other one: rows are grouped by
+        (category, bucket, in price range) and folded in Python.
+        """
+        rows = self._facet_rows(buckets, min_price, max_price)
+        return self._fold_facets(rows, buckets, category_ids)
+
+    async def afacet_counts(self, buckets, category_ids=None, min_price=None, max_price=None):
+        rows = [row async for row in self._facet_rows(buckets, min_price, max_price)]
+        return self._fold_facets(rows, buckets, category_ids)
+
+    def _facet_rows(self, buckets, min_price, max_price):
+        bucket = Case(
+            *[When(price__lt=bound, then=Value(n)) for n, bound in enumerate(buckets)],
+            default=Value(len(buckets)), output_field=IntegerField(),
+        )
+        price_range = Q()
+        if min_price is not None:
+            price_range &= Q(price__gte=min_price)
+        if max_price is not None:
+            price_range &= Q(price__lte=max_price)
+        if price_range:
+            in_range = Case(When(price_range, then=Value(1)), default=Value(0), output_field=IntegerField())
+        else:
+            in_range = Value(1, output_field=IntegerField())
+        return (
+            self.order_by()
+            .values('category_id', bucket=bucket, in_range=in_range)
+            .annotate(count=Count('id'))
+        )
+
+    @staticmethod
+    def _fold_facets(rows, buckets, category_ids):
+        categories, prices = {}, [0] * (len(buckets) + 1)
+        for row in rows:
+            if row['in_range']:
+                categories[row['category_id']] = categories.get(row['category_id'], 0) + row['count']
+            if not category_ids or row['category_id'] in category_ids:
+                prices[row['bucket']] += row['count']
+        bounds = [None, *buckets, None]
+        return {
+            'categories': [{'id': pk, 'count': count} for pk, count in sorted(categories.items())],
+            'price': [
+                {'min': bounds[n], 'max': bounds[n + 1], 'count': count} for n, count in enumerate(prices)
+            ],
+        }
+
+    def recount_popularity(self):
+        """Recompute Product.popularity from the image like counters, returns the number of rows fixed"""
+        likes = dict(
+            ProductImage.objects.filter(product__in=self).values('product')
+            .annotate(total=Sum('likes_count')).values_list('product', 'total')
+        )
+        drifted = []
+        for product in self.only('id', 'popularity'):
+            total = likes.get(product.id) or 0
+            if product.popularity != total:
+                product.popularity = total
+                drifted.append(product)
+        if drifted:
+            bump_version('product')
+        return self.model.objects.bulk_update(drifted, ['popularity'])
+
+
+class ProductImageQuerySet(models.QuerySet):
+    def recount_likes(self):
+        """Recompute the stored like/dislike counters from PhotoLike, returns the number of rows fixed"""
+        counts = {
+            row['photo']: row
+            for row in PhotoLike.objects.filter(photo__in=self).values('photo').annotate(
+                likes=Count('id', filter=Q(is_like=True)),
+                dislikes=Count('id', filter=Q(is_like=False)),
+            )
+        }
+        now = timezone.now()
+        drifted = []
+        for image in self.only('id', 'likes_count', 'dislikes_count'):
+            row = counts.get(image.id, {})
+            likes, dislikes = row.get('likes', 0), row.get('dislikes', 0)
+            if (image.likes_count, image.dislikes_count) != (likes, dislikes):
+                image.likes_count, image.dislikes_count, image.updated_at = likes, dislikes, now
+                drifted.append(image)
+        if drifted:
+            bump_version('productimage')
+        return self.model.objects.bulk_update(drifted, ['likes_count', 'dislikes_count', 'updated_at'])
+
+
+class PhotoLikeQuerySet(models.QuerySet):
+    def toggle(self, user, photo_id, is_like):
+        """Toggle a user's like/dislike on a photo, returns (is_like or None, likes_count, dislikes_count)
+
+        The PhotoLike row is read once and then flipped with an UPDATE or
+        removed (same action twice) with a DELETE, both conditional on the
+        state that was read. Without a row it is INSERTed, guarded by
+        unique_together. A concurrent change makes the write miss and the
+        toggle is retried against the new state.
+        """
+        mine = self.filter(user_id=user.pk, photo_id=photo_id)
+        with transaction.atomic():
+            for attempt in range(3):
+                # Время прежней реакции читаем той же выборкой: снятый лайк вычитается из trending
+                # с тем весом, с которым был добавлен
+                row = mine.values_list('pk', 'is_like', 'created_at').first()
+                now = timezone.now()
+                if row is None:
+                    try:
+                        with transaction.atomic():
+                            now = self.create(user_id=user.pk, photo_id=photo_id, is_like=is_like).created_at
+                    except IntegrityError:
+                        continue
+                    previous, current, reacted_at = None, is_like, None
+                    break
+                pk, previous, reacted_at = row
+                unchanged = self.filter(pk=pk, is_like=previous)
+                if previous == is_like:
+                    if unchanged.delete()[0]:
+                        current = None
+                        break
+                # created_at — время текущей реакции, по нему recompute() взвешивает лайк
+                elif unchanged.update(is_like=is_like, created_at=now):
+                    current = is_like
+                    break
+            else:
+                raise IntegrityError('PhotoLike kept changing concurrently')
+
+            likes_delta = int(current is True) - int(previous is True)
+            photo = ProductImage.objects.filter(pk=photo_id)
+            updated = photo.update(
+                likes_count=F('likes_count') + likes_delta,
+                dislikes_count=F('dislikes_count') + int(current is False) - int(previous is False),
+                updated_at=Now(),
+            )
+            if not updated:
+                raise ProductImage.DoesNotExist
+            # update() не шлёт сигналы, поэтому кэш каталога сбрасываем явно
+            bump_version('photolike')
+            likes_count, dislikes_count, product_id = photo.values_list(
+                'likes_count', 'dislikes_count', 'product_id').get()
+            if likes_delta:
+                Product.objects.filter(pk=product_id).update(popularity=F('popularity') + likes_delta)
+                liked_at = now if likes_delta > 0 else reacted_at
+                likes_changed.send(sender=PhotoLike, changes=[(photo_id, product_id, likes_delta, liked_at)])
+        return current, likes_count, dislikes_count
+
+
+def variant_paths(variants):
+    return [path for formats in variants.values() for path in formats.values()]
+
 
 # Create your models here.
 class Category(models.Model):
     name=models.CharField(max_length=255,unique=True)
-    images=models.ImageField(upload_to='category_image')
+    images=models.ImageField(upload_to='category_image', storage=catalog_storage)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CategoryQuerySet.as_manager()
+
+    def media_names(self):
+        return [self.images.name] if self.images else []
 
     def __str__(self):
         return f"{self.name} Id:{self.id}"
@@ -17,13 +221,39 @@ class Product(models.Model):
     price  = models.DecimalField(max_digits=10, decimal_places=2)
     description =models.TextField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Сумма лайков по всем фото товара, поддерживается PhotoLike.objects.toggle и `recount_photo_likes`
+    popularity = models.PositiveIntegerField(default=0)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination по цене: ORDER BY price, id
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['popularity', 'id'], name='product_popularity_id_idx'),
+            # Фильтр по категории + диапазон цен/сортировка одним range scan
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_id_idx'),
+            models.Index(fields=['category', 'popularity', 'id'], name='product_cat_pop_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} Id:{self.id}"
  
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='product_images')
+    image = models.ImageField(upload_to='product_images', storage=catalog_storage)
+    # Denormalized from PhotoLike, kept in sync by PhotoLike.objects.toggle and `recount_photo_likes`
+    likes_count = models.PositiveIntegerField(default=0)
+    dislikes_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # {"thumb": {"webp": "<storage path>", ...}, ...}, заполняется apps.market.images
+    variants = models.JSONField(default=dict, blank=True)
+
+    objects = ProductImageQuerySet.as_manager()
+
+    def media_names(self):
+        return ([self.image.name] if self.image else []) + variant_paths(self.variants)
 
     def __str__(self):
         return f"Image for {self.product.name} (Product ID: {self.product.id})"
@@ -35,6 +265,8 @@ class PhotoLike(models.Model):
     is_like = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = PhotoLikeQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'photo')  # один пользователь = один лайк на фото
 
@@ -42,4 +274,150 @@ class PhotoLike(models.Model):
         return f"{self.user.username} liked {self.photo}"
 
 
-        
+class RankingEpoch(models.Model):
+    """Reference time of the stored trending scores (single row), moved by every recompute/rebase"""
+    started_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Ranking epoch {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class ProductScore(models.Model):
+    """Time-decayed like score of a product, maintained by apps.market.rankings"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # Тренды категории: обратный range scan по (category, score, id)
+            models.Index(fields=['category', 'score', 'id'], name='productscore_cat_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Score {self.score:.3f} for product {self.product_id}"
+
+
+class ImageScore(models.Model):
+    """Time-decayed like score of a product photo, maintained by apps.market.rankings"""
+    image = models.OneToOneField(ProductImage, on_delete=models.CASCADE, related_name='trending')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'score', 'id'], name='imagescore_cat_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Score {self.score:.3f} for image {self.image_id}"
+
+
+class ImageJob(models.Model):
+    """Фоновая обработка загруженного фото: миниатюры и WebP/AVIF варианты"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Job {self.id} for image {self.image_id}: {self.status}"
+
+
+def _upload_cutoff():
+    return timezone.now() - timedelta(hours=getattr(settings, 'MARKET_UPLOAD_EXPIRY_HOURS', 24))
+
+
+class UploadSessionQuerySet(models.QuerySet):
+    def expired(self):
+        """Sessions untouched for MARKET_UPLOAD_EXPIRY_HOURS, open or finished"""
+        return self.filter(updated_at__lt=_upload_cutoff())
+
+    def live(self):
+        """Open sessions that still hold one of their product's image slots"""
+        return self.filter(status=UploadSession.OPEN, updated_at__gte=_upload_cutoff())
+
+
+class UploadSession(models.Model):
+    """Возобновляемая загрузка фото товара по частям, см. apps.market.uploads"""
+    OPEN = 'open'
+    DONE = 'done'
+    STATUS_CHOICES = [(OPEN, 'Open'), (DONE, 'Done')]
+
+    # Случайный id: знание адреса сессии даёт право дописывать в неё
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='upload_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    # Сколько байт от начала файла уже принято
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    image = models.OneToOneField(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = UploadSessionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'status'], name='market_upload_product_idx')]
+
+    def __str__(self):
+        return f"Upload {self.id} of {self.filename} for product {self.product_id}: {self.offset}/{self.size}"
+
+
+class MediaBlobQuerySet(models.QuerySet):
+    def adjust(self, added=(), removed=()):
+        """Count the blob references rows gained and lost, names outside the blob store are ignored"""
+        deltas = Counter(name for name in added if is_blob(name))
+        deltas.subtract(name for name in removed if is_blob(name))
+        by_delta = defaultdict(list)
+        for name, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(name)
+        if not by_delta:
+            return
+        self.bulk_create([MediaBlob(name=name) for name in deltas], ignore_conflicts=True)
+        for delta, names in by_delta.items():
+            # Ниже нуля не уходим: расхождение исправит recount
+            self.filter(name__in=names).update(refcount=Greatest(F('refcount') + delta, 0), updated_at=Now())
+
+    def recount(self):
+        """Recompute refcounts from the ProductImage and Category rows, returns the number of blobs fixed"""
+        counts = Counter()
+        for image, variants in ProductImage.objects.values_list('image', 'variants').iterator():
+            counts.update(name for name in [image, *variant_paths(variants)] if is_blob(name))
+        counts.update(name for name in Category.objects.values_list('images', flat=True).iterator() if is_blob(name))
+
+        self.bulk_create([MediaBlob(name=name) for name in counts], ignore_conflicts=True)
+        now = timezone.now()
+        drifted = []
+        for blob in self.only('name', 'refcount').iterator():
+            if blob.refcount != counts[blob.name]:
+                blob.refcount, blob.updated_at = counts[blob.name], now
+                drifted.append(blob)
+        return self.model.objects.bulk_update(drifted, ['refcount', 'updated_at'], batch_size=500)
+
+
+class MediaBlob(models.Model):
+    """Файл ContentAddressedStorage и число ссылок на него из ProductImage/Category
+
+    Поддерживается сигналами и add_product_images, расхождения исправляет `gc_media`.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MediaBlobQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name}: {self.refcount} references"
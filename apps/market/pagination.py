@@ -0,0 +1,186 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (seek) pagination with opaque cursors
+
+    Pages are selected with `WHERE (field, id) > (last_field, last_id)` against
+    an index on (field, id), so a deep page costs the same as the first one.
+    `id` is always the tie-breaker, which keeps non-unique fields like price stable.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+
+    page_size = getattr(settings, 'MARKET_PAGE_SIZE', 20)
+    max_page_size = getattr(settings, 'MARKET_MAX_PAGE_SIZE', 100)
+    ordering_fields = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._finish_page(list(self._page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Same as paginate_queryset, fetching the page with the async ORM"""
+        return self._finish_page([obj async for obj in self._page_queryset(queryset, request, view)])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+
+        self.cursor = self.decode_cursor(request, queryset.model)
+        backwards = self.cursor is not None and self.cursor['backwards']
+        # Назад идём в обратном порядке и разворачиваем страницу в конце
+        reverse = self.descending != backwards
+        queryset = queryset.order_by(*self.order_by(reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.seek(self.cursor['position'], reverse))
+        return queryset[:self.page_size + 1]
+
+    def _finish_page(self, page):
+        cursor = self.cursor
+        backwards = cursor is not None and cursor['backwards']
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if backwards:
+            page.reverse()
+
+        self.page = page
+        if backwards:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be an integer.'})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be a positive integer.'})
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, view):
+        fields = getattr(view, 'ordering_fields', self.ordering_fields)
+        # Как у DRF OrderingFilter: `ordering` на view задаёт порядок по умолчанию
+        ordering = request.query_params.get(self.ordering_query_param, getattr(view, 'ordering', fields[0]))
+        field = ordering.lstrip('-')
+        if field not in fields:
+            raise ValidationError({self.ordering_query_param: f"Choose one of: {', '.join(fields)}."})
+        return field, ordering.startswith('-')
+
+    def order_by(self, reverse):
+        prefix = '-' if reverse else ''
+        if self.field == 'id':
+            return [prefix + 'id']
+        return [prefix + self.field, prefix + 'id']
+
+    def seek(self, position, reverse):
+        op = 'lt' if reverse else 'gt'
+        value, pk = position
+        if self.field == 'id':
+            return Q(**{f'id__{op}': pk})
+        return Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'id__{op}': pk})
+
+    def position(self, obj):
+        # Страница из моделей или из строк .values()
+        if isinstance(obj, dict):
+            value, pk = obj[self.field], obj['id']
+        else:
+            value, pk = getattr(obj, self.field), obj.pk
+        return [str(value) if isinstance(value, Decimal) else value, pk]
+
+    def encode_cursor(self, position, backwards):
+        payload = {'o': self.field, 'd': self.descending, 'p': position, 'b': backwards}
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param, token.decode().rstrip('='))
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            position, backwards = payload['p'], bool(payload['b'])
+            if payload['o'] != self.field or payload['d'] != self.descending or len(position) != 2:
+                raise ValueError
+            value, pk = position
+            if not isinstance(pk, int) or isinstance(pk, bool):
+                raise ValueError
+            position = [self.clean_position(model, self.field, value), self.clean_position(model, model._meta.pk.name, pk)]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return {'position': position, 'backwards': backwards}
+
+    @staticmethod
+    def clean_position(model, name, value):
+        # Курсор приходит от клиента: значение должно быть допустимым для поля, иначе filter() упадёт с 500
+        if value is None or isinstance(value, (bool, list, dict)):
+            raise ValueError
+        field = model._meta.get_field(name)
+        value = field.to_python(value)
+        field.run_validators(value)
+        return value
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[-1]), backwards=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.position(self.page[0]), backwards=True)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query',
+             'description': 'Opaque cursor from a previous `next`/`previous` link.',
+             'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query',
+             'description': f'Number of results per page (max {self.max_page_size}).',
+             'schema': {'type': 'integer'}},
+            {'name': self.ordering_query_param, 'required': False, 'in': 'query',
+             'description': 'Field to order by, prefix with `-` for descending.',
+             'schema': {'type': 'string',
+                        'enum': [f'{p}{f}' for f in getattr(view, 'ordering_fields', self.ordering_fields)
+                                 for p in ('', '-')]}},
+        ]
@@ -0,0 +1,307 @@
+"""Read-only catalog payloads built straight from `.values()` rows
+
+Going through ProductGetSerializer costs a model instance and a
+field-by-field to_representation for every product and every image. Here
+rows are fetched with `.values()` and turned into plain dicts with the
+same keys, order and formatting as ProductGetSerializer,
+ProductImageSerializer and CategoryProductSerializer (PayloadGoldenTests
+holds them to it). The serializers remain the schema and the write path.
+
+Queries match the prefetching querysets: one per level (categories,
+products, images). A Shape built from `?fields=` and `?expand=` trims the
+payload: levels that are not embedded are not queried, and only the
+columns of the requested keys are selected.
+"""
+import decimal
+import json
+import re
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+
+from .models import Category, Product, ProductImage
+
+_price_field = Product._meta.get_field('price')
+# Как DecimalField у DRF: quantize до decimal_places с точностью max_digits
+_CENTS = decimal.Decimal(1).scaleb(-_price_field.decimal_places)
+_PRICE_CONTEXT = decimal.Context(prec=_price_field.max_digits)
+
+
+def url_builder(storage):
+    """storage.url, with FileSystemStorage's urljoin() (most of the build time) cut to a concatenation"""
+    base_url = storage.base_url if isinstance(storage, FileSystemStorage) else None
+    if base_url is None:
+        return storage.url
+
+    def url(name):
+        path = filepath_to_uri(name).lstrip('/')
+        # Сегменты '.'/'..' urljoin схлопывает, такие пути отдаём ему
+        if '/.' in '/' + path:
+            return storage.url(name)
+        return base_url + path
+
+    return url
+
+
+def _price(value):
+    if not isinstance(value, decimal.Decimal):
+        value = decimal.Decimal(str(value).strip())
+    return format(value.quantize(_CENTS, context=_PRICE_CONTEXT), 'f')
+
+
+# Форматтеры полей: (row, url) -> значение в payload
+def _column(column):
+    return column, lambda row, url: row[column]
+
+
+def _file(column):
+    # FileField в DRF: пустое имя -> None, без request в контексте URL относительный
+    return column, lambda row, url: url(row[column]) if row[column] else None
+
+
+def _variants(row, url):
+    return {size: {fmt: url(path) for fmt, path in formats.items()} for size, formats in row['variants'].items()}
+
+
+class Level:
+    """One kind of payload object: its fields and the relations it can embed
+
+    `fields` maps each key, in serializer order, to the column it is read
+    from and a formatter `(row, url) -> value`. `relations` maps a key to the
+    embedded Level and the column of its rows pointing back here.
+    """
+
+    def __init__(self, model, storage, fields, relations=()):
+        self.model = model
+        self.storage = storage
+        self.fields = fields
+        self.relations = dict(relations)
+        self.full = self.shape()
+
+    def shape(self, fields=None, expand=None):
+        """Shape for the `?fields=` and `?expand=` values, None when the parameter is absent"""
+        return Shape(self, _split(fields), _split(expand))
+
+    def relation_paths(self, prefix=''):
+        for key, (level, _) in self.relations.items():
+            yield prefix + key
+            yield from level.relation_paths(f'{prefix}{key}.')
+
+
+def _split(value):
+    if value is None:
+        return None
+    return [[part.strip() for part in path.split('.')] for path in value.split(',') if path.strip()]
+
+
+def _group(paths, choices, relations, param, prefix):
+    """{key: nested paths} of the first segments of `paths`, all of which must be in `choices`"""
+    groups = {}
+    for key, *nested in paths:
+        if key not in choices:
+            message = f"Unknown field '{prefix}{key}'."
+            if choices:
+                message += f" Choose from: {', '.join(choices)}."
+            raise ValidationError({param: message})
+        if nested and key not in relations:
+            raise ValidationError({param: f"'{prefix}{key}' has no nested fields."})
+        groups.setdefault(key, [])
+        if nested:
+            groups[key].append(nested)
+    return groups
+
+
+class Shape:
+    """The keys of one level to return and the relations to embed, each with its own Shape
+
+    Without `fields` a level returns all its keys, without `expand` it embeds
+    all its relations, so an empty request is the full serializer payload.
+    A relation named in either parameter is embedded, `fields=products.name`
+    embeds products with their names only.
+    """
+
+    def __init__(self, level, fields=None, expand=None, fk=None, prefix=''):
+        keys = [*level.fields, *level.relations]
+        fields = None if fields is None else _group(fields, keys, level.relations, 'fields', prefix)
+        expand = None if expand is None else _group(expand, list(level.relations), level.relations, 'expand', prefix)
+        self.level = level
+        self.fk = fk
+        self.fields = tuple(key for key in level.fields if fields is None or key in fields)
+        self.relations = {}
+        for key, (child, child_fk) in level.relations.items():
+            named = key in (fields or ()) or key in (expand or ())
+            if named or (fields is None and expand is None):
+                # Вложенный уровень без своих путей в fields отдаёт все поля
+                nested_fields = (fields or {}).get(key) or None
+                nested_expand = None if expand is None else expand.get(key, [])
+                self.relations[key] = Shape(child, nested_fields, nested_expand, child_fk, f'{prefix}{key}.')
+
+    def columns(self, *extra):
+        """`.values()` columns: the requested fields, `id` for relations and cursors, and `extra`"""
+        columns = ['id', *(self.level.fields[key][0] for key in self.fields), *extra]
+        if self.fk:
+            columns.append(self.fk)
+        return tuple(dict.fromkeys(columns))
+
+    def related_rows(self, owner_ids):
+        return self.level.model.objects.filter(**{f'{self.fk}__in': owner_ids}).values(*self.columns())
+
+
+def request_shape(level, request):
+    """Shape asked for by `?fields=` and `?expand=`: comma-separated keys, dotted for nested ones"""
+    params = request.query_params
+    # Пустой fields не означает объект без полей
+    return level.shape(params.get('fields') or None, params.get('expand'))
+
+
+IMAGE = Level(ProductImage, ProductImage._meta.get_field('image').storage, {
+    'id': _column('id'),
+    'image': _file('image'),
+    'variants': ('variants', _variants),
+    'likes_count': _column('likes_count'),
+    'dislikes_count': _column('dislikes_count'),
+})
+PRODUCT = Level(Product, None, {
+    'id': _column('id'),
+    'name': _column('name'),
+    'price': ('price', lambda row, url: _price(row['price'])),
+    'category': _column('category_id'),
+    'description': _column('description'),
+}, relations={'images': (IMAGE, 'product_id')})
+CATEGORY = Level(Category, Category._meta.get_field('images').storage, {
+    'id': _column('id'),
+    'name': _column('name'),
+    'images': _file('images'),
+}, relations={'products': (PRODUCT, 'category_id')})
+
+PRODUCT_FIELDS = PRODUCT.full.columns()
+CATEGORY_FIELDS = CATEGORY.full.columns()
+
+
+def fetch(shape, rows):
+    """Rows of every relation `shape` embeds under `rows`: {key: (rows, their related rows)}, one query per level"""
+    owner_ids = [row['id'] for row in rows]
+    related = {}
+    for key, child in shape.relations.items():
+        child_rows = list(child.related_rows(owner_ids)) if owner_ids else []
+        related[key] = (child_rows, fetch(child, child_rows))
+    return related
+
+
+async def afetch(shape, rows):
+    owner_ids = [row['id'] for row in rows]
+    related = {}
+    for key, child in shape.relations.items():
+        child_rows = [row async for row in child.related_rows(owner_ids)] if owner_ids else []
+        related[key] = (child_rows, await afetch(child, child_rows))
+    return related
+
+
+def _grouped(rows, payloads, key):
+    # Внутри владельца порядок выборки сохраняется, как при prefetch
+    groups = {}
+    for row, payload in zip(rows, payloads):
+        groups.setdefault(row[key], []).append(payload)
+    return groups
+
+
+def build(shape, rows, related):
+    """Payloads of `rows` with the rows from fetch() embedded, no queries"""
+    level = shape.level
+    url = url_builder(level.storage) if level.storage is not None else None
+    formatters = [(key, level.fields[key][1]) for key in shape.fields]
+    embedded = []
+    for key, child in shape.relations.items():
+        child_rows, child_related = related[key]
+        embedded.append((key, _grouped(child_rows, build(child, child_rows, child_related), child.fk)))
+
+    payloads = []
+    for row in rows:
+        payload = {key: format(row, url) for key, format in formatters}
+        for key, groups in embedded:
+            payload[key] = groups.get(row['id'], [])
+        payloads.append(payload)
+    return payloads
+
+
+def collect(shape, rows):
+    """Payloads of `.values(*shape.columns())` rows with their relations fetched"""
+    rows = list(rows)
+    return build(shape, rows, fetch(shape, rows))
+
+
+async def acollect(shape, rows):
+    rows = list(rows)
+    return build(shape, rows, await afetch(shape, rows))
+
+
+def products(rows, shape=None):
+    """Like ProductGetSerializer(many=True) with the full shape"""
+    return collect(shape or PRODUCT.full, rows)
+
+
+async def aproducts(rows, shape=None):
+    return await acollect(shape or PRODUCT.full, rows)
+
+
+def categories(rows, shape=None):
+    """Like CategoryProductSerializer(many=True) with the full shape"""
+    return collect(shape or CATEGORY.full, rows)
+
+
+async def acategories(rows, shape=None):
+    return await acollect(shape or CATEGORY.full, rows)
+
+
+# --- encoding ---
+
+def stdlib_dumps(data):
+    """Byte-for-byte what DRF's JSONRenderer produces with the default settings"""
+    text = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+# Числа, которые json пишет в экспоненте (1e+16, 1e-05), а orjson без неё или иначе (1e16, 0.00001).
+# Число в компактном JSON стоит в начале или после ':', ',', '['; редкое совпадение внутри строки
+# лишь отправляет payload в JSONEncoder DRF
+_ORJSON_FLOAT_MISMATCH = re.compile(rb'(?:^|[:,\[])-?(?:\d+(?:\.\d+)?[eE]|0\.0000)')
+
+
+def orjson_dumps(data, dumps, option):
+    """orjson.dumps made byte-identical to stdlib_dumps, TypeError where it cannot be
+
+    orjson leaves U+2028/U+2029 unescaped (they only occur inside strings,
+    so they are escaped afterwards) and formats very large and very small
+    floats differently. Those payloads are handed back to DRF. orjson
+    writes NaN/Infinity as null where DRF raises ValueError.
+    """
+    encoded = dumps(data, option=option)
+    if _ORJSON_FLOAT_MISMATCH.search(encoded):
+        raise TypeError('Float formatting differs from the json module')
+    return encoded.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+@lru_cache(maxsize=None)
+def _load_dumps(path):
+    if path:
+        return import_string(path)
+    try:
+        import orjson
+    except ImportError:
+        return stdlib_dumps
+    # Даты DRF форматирует иначе (миллисекунды, 'Z'): пусть их кодирует его JSONEncoder
+    return partial(orjson_dumps, dumps=orjson.dumps, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def get_dumps():
+    """MARKET_JSON_DUMPS (dotted path), else orjson when installed, else the stdlib
+
+    The callable takes the payload and returns bytes. It must raise TypeError
+    for values it cannot encode the way DRF does, the renderer then falls
+    back to DRF's encoder.
+    """
+    return _load_dumps(getattr(settings, 'MARKET_JSON_DUMPS', None))
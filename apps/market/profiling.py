@@ -0,0 +1,126 @@
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .instrumentation import observe_queries
+
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+WHITESPACE_RE = re.compile(r'\s+')
+
+PROJECT_DIR = str(settings.BASE_DIR) + os.sep
+THIS_FILE = os.path.abspath(__file__)
+
+
+def statement_shape(sql):
+    """SQL with literals and IN-lists collapsed, so per-row queries of one N+1 share a shape"""
+    sql = PLACEHOLDER_LIST_RE.sub('(...)', sql)
+    sql = LITERAL_RE.sub('?', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def _origin():
+    """(first project frame as 'path:line in func', innermost serializer field being rendered)"""
+    location = field_name = None
+    frame = sys._getframe(3)  # _origin <- QueryProfiler.__call__ <- dispatch_queries <- ...
+    while frame is not None and (location is None or field_name is None):
+        code = frame.f_code
+        filename = code.co_filename
+        if (location is None and filename.startswith(PROJECT_DIR) and filename != THIS_FILE
+                and 'site-packages' not in filename):
+            path = os.path.relpath(filename, PROJECT_DIR)
+            location = f'{path}:{frame.f_lineno} in {code.co_name}'
+        if field_name is None and code.co_name == 'to_representation':
+            # Serializer.to_representation обходит поля в цикле с локальной переменной `field`
+            field = frame.f_locals.get('field')
+            if field is not None and getattr(field, 'field_name', None):
+                field_name = f'{type(field.parent).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return location, field_name
+
+
+class QueryProfiler:
+    """Capture every SQL statement run in this context and group them by shape
+
+    A shape executed `threshold` times or more is reported as an N+1, with
+    the project line that issued it and the serializer field being rendered.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or getattr(settings, 'MARKET_N_PLUS_ONE_THRESHOLD', 3)
+        self.statements = {}
+        self.count = 0
+        self.elapsed = 0.0
+        self._observing = None
+
+    def __call__(self, sql, elapsed):
+        self.count += 1
+        self.elapsed += elapsed
+        shape = statement_shape(sql)
+        entry = self.statements.get(shape)
+        if entry is None:
+            location, field = _origin()
+            entry = self.statements[shape] = {
+                'sql': shape, 'count': 0, 'time_ms': 0.0, 'origin': location, 'field': field,
+            }
+        elif entry['count'] + 1 == self.threshold:
+            # Первый вызов мог прийти из prefetch, место повтора точнее
+            entry['origin'], entry['field'] = _origin()
+        entry['count'] += 1
+        entry['time_ms'] += elapsed * 1000
+
+    def __enter__(self):
+        self._observing = observe_queries(self)
+        self._observing.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observing.__exit__(*exc_info)
+        self._observing = None
+
+    @property
+    def n_plus_one(self):
+        return [entry for entry in self.statements.values() if entry['count'] >= self.threshold]
+
+    def report(self):
+        statements = sorted(self.statements.values(), key=lambda entry: -entry['count'])
+        return {
+            'queries': self.count,
+            'time_ms': round(self.elapsed * 1000, 3),
+            'duplicates': self.count - len(self.statements),
+            'statements': [{**entry, 'time_ms': round(entry['time_ms'], 3)} for entry in statements],
+            'n_plus_one': [entry['sql'] for entry in statements if entry['count'] >= self.threshold],
+        }
+
+    def summary(self):
+        """Value for the X-Query-Profile response header"""
+        parts = [f'queries={self.count}', f'time={self.elapsed * 1000:.1f}ms',
+                 f'duplicates={self.count - len(self.statements)}']
+        suspects = [entry['field'] or entry['origin'] or '?' for entry in self.n_plus_one]
+        if suspects:
+            parts.append(f"n+1={','.join(suspects)}")
+        return '; '.join(parts)
+
+    def format(self):
+        lines = [f'{self.count} queries in {self.elapsed * 1000:.1f}ms:']
+        for entry in sorted(self.statements.values(), key=lambda entry: -entry['count']):
+            flag = ' N+1' if entry['count'] >= self.threshold else ''
+            where = ', '.join(filter(None, [entry['field'], entry['origin']]))
+            lines.append(f"  {entry['count']:4}x{flag} {entry['sql'][:200]}" + (f'\n        <- {where}' if where else ''))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(max_queries, threshold=None):
+    """Fail with the grouped statements when the block runs more than `max_queries` queries
+
+    Works as a plain context manager, so it fits both pytest tests and
+    unittest TestCase methods.
+    """
+    with QueryProfiler(threshold) as profiler:
+        yield profiler
+    if profiler.count > max_queries:
+        raise AssertionError(f'Query budget of {max_queries} exceeded: {profiler.format()}')
@@ -0,0 +1,157 @@
+"""Time-decayed trending scores for photos and products
+
+A like at time t is worth 2 ** ((t - epoch) / half_life). Newer likes
+weigh exponentially more, instead of every stored score decaying over
+time. Stored scores never have to change as time passes, and ordering by
+the stored score equals ordering by the decayed one. That is what lets
+the trending list be an index range scan on (category, score, id).
+`decay()` converts a stored score to "recent likes" as of now.
+
+Like changes shift the scores incrementally, through the `likes_changed`
+signal. Each change carries the created_at of the like added or removed,
+so a removed like subtracts exactly the weight it added and the stored
+score stays what `recompute()` would produce. `recompute()` rebuilds
+everything from PhotoLike.created_at and moves the epoch to now; run it
+periodically (`recompute_trending`). `rebase()` rescales all rows when
+the epoch is far enough behind for the weights to approach float range.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import ImageScore, PhotoLike, Product, ProductImage, ProductScore, RankingEpoch
+
+# Веса растут как 2**x: после стольких периодов полураспада все строки пересчитываются к новой эпохе
+REBASE_AFTER = 256
+BATCH_SIZE = 1000
+# Доля веса лайка, ниже которой счёт после вычитания считается нулём
+RESIDUE = 1e-9
+
+
+def get_half_life():
+    """Half-life in seconds"""
+    return getattr(settings, 'MARKET_TRENDING_HALF_LIFE_HOURS', 24) * 3600
+
+
+def get_epoch():
+    # Не кэшируется: после recompute в другом процессе старая эпоха завысила бы веса
+    epoch = RankingEpoch.objects.filter(pk=1).values_list('started_at', flat=True).first()
+    if epoch is None:
+        epoch = RankingEpoch.objects.get_or_create(pk=1, defaults={'started_at': timezone.now()})[0].started_at
+    return epoch
+
+
+def weight(at, epoch):
+    return 2.0 ** ((at - epoch).total_seconds() / get_half_life())
+
+
+def decay(now=None, epoch=None):
+    """Factor turning a stored score into the decayed score at `now`"""
+    return 1 / weight(now or timezone.now(), epoch or get_epoch())
+
+
+def record_likes(changes, at=None):
+    """Shift scores by [(photo_id, product_id, likes_delta, liked_at), ...]
+
+    Each delta is weighted by the created_at of the like it adds or
+    removes. `at` (now by default) stands in for a missing liked_at.
+    """
+    at = at or timezone.now()
+    epoch = get_epoch()
+    if (at - epoch).total_seconds() / get_half_life() > REBASE_AFTER:
+        epoch = rebase(at)
+
+    images, products = defaultdict(float), defaultdict(float)
+    for photo_id, product_id, delta, liked_at in changes:
+        amount = delta * weight(liked_at or at, epoch)
+        images[photo_id] += amount
+        products[product_id] += amount
+    _shift(ImageScore, 'image_id', images)
+    _shift(ProductScore, 'product_id', products)
+
+
+def _shift(model, key, amounts):
+    missing = []
+    for pk, amount in amounts.items():
+        if not amount:
+            continue
+        # Остаток округления после снятия последнего лайка и отрицательные значения обнуляются
+        updated = model.objects.filter(**{key: pk}).update(score=Case(
+            When(score__lt=abs(amount) * RESIDUE - amount, then=Value(0.0)), default=F('score') + amount))
+        if not updated and amount > 0:
+            missing.append(pk)
+    if not missing:
+        return
+    # Первый лайк: строки ещё нет, категория нужна для индекса
+    if model is ImageScore:
+        categories = ProductImage.objects.filter(pk__in=missing).values_list('pk', 'product__category_id')
+    else:
+        categories = Product.objects.filter(pk__in=missing).values_list('pk', 'category_id')
+    model.objects.bulk_create(
+        [model(**{key: pk, 'category_id': category_id, 'score': amounts[pk]}) for pk, category_id in categories],
+        ignore_conflicts=True,
+    )
+
+
+def rebase(now=None):
+    """Rescale every stored score to an epoch at `now`, keeping the order; returns the new epoch"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch = RankingEpoch.objects.select_for_update().get_or_create(
+            pk=1, defaults={'started_at': now})[0]
+        factor = 1 / weight(now, epoch.started_at)
+        ImageScore.objects.update(score=F('score') * factor)
+        ProductScore.objects.update(score=F('score') * factor)
+        epoch.started_at = now
+        epoch.save(update_fields=['started_at'])
+        bump_version('photolike')
+    return now
+
+
+def recompute(now=None):
+    """Rebuild both score tables from PhotoLike with the epoch at `now`; returns (photos, products) scored"""
+    now = now or timezone.now()
+    images = defaultdict(float)
+    likes = PhotoLike.objects.filter(is_like=True).values_list('photo_id', 'created_at')
+    for photo_id, created_at in likes.iterator(chunk_size=BATCH_SIZE):
+        images[photo_id] += weight(created_at, now)
+
+    # Без pk__in: список id лайкнутых фото может превысить лимит параметров SQL
+    owners = {
+        pk: (product_id, category_id)
+        for pk, product_id, category_id in ProductImage.objects.values_list(
+            'pk', 'product_id', 'product__category_id').iterator(chunk_size=BATCH_SIZE)
+        if pk in images
+    }
+    products = {}
+    for photo_id, (product_id, category_id) in owners.items():
+        score = products.get(product_id, (category_id, 0.0))[1] + images[photo_id]
+        products[product_id] = (category_id, score)
+
+    with transaction.atomic():
+        ImageScore.objects.all().delete()
+        ProductScore.objects.all().delete()
+        ImageScore.objects.bulk_create(
+            [ImageScore(image_id=pk, category_id=owners[pk][1], score=images[pk]) for pk in owners],
+            batch_size=BATCH_SIZE,
+        )
+        ProductScore.objects.bulk_create(
+            [ProductScore(product_id=pk, category_id=category_id, score=score)
+             for pk, (category_id, score) in products.items()],
+            batch_size=BATCH_SIZE,
+        )
+        RankingEpoch.objects.update_or_create(pk=1, defaults={'started_at': now})
+        bump_version('photolike')
+    return len(owners), len(products)
+
+
+def move_product(product):
+    """Keep the denormalized category of a product's scores in sync"""
+    ProductScore.objects.filter(product=product).exclude(category_id=product.category_id).update(
+        category_id=product.category_id)
+    ImageScore.objects.filter(image__product=product).exclude(category_id=product.category_id).update(
+        category_id=product.category_id)
@@ -0,0 +1,21 @@
+from rest_framework.renderers import JSONRenderer
+
+from .payloads import get_dumps
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with payloads.get_dumps(), DRF's encoder for whatever that cannot handle
+
+    Indented output (browsable API, `; indent=` in Accept) always goes through DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is None \
+                and self.compact and not self.ensure_ascii:
+            try:
+                return get_dumps()(data)
+            except TypeError:
+                pass
+        return super().render(data, accepted_media_type, renderer_context)
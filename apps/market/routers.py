@@ -0,0 +1,151 @@
+"""Read-replica routing for catalog queries
+
+MARKET_READ_REPLICAS lists database aliases replicating `default`. Inside
+a ReplicaState context (one per request, see ReplicaPinningMiddleware),
+reads of the catalog models go to one replica, chosen once per context by
+MARKET_REPLICA_SELECTION: 'round-robin' or 'least-latency' (lowest moving
+average of query time).
+Everything else reads from and writes to `default`, as do background jobs
+and commands.
+
+A request reads from the primary when:
+
+* its method is not GET/HEAD/OPTIONS, so the rows a write is based on are
+  current (PhotoLikeView, ProductOneViews.put, ...);
+* it has already written something;
+* the read runs inside a transaction on the primary;
+* the client wrote within the last MARKET_REPLICA_LAG_SECONDS (a cookie
+  set by the middleware), so it reads its own writes.
+
+Responses built from replica reads are cached for at most
+MARKET_REPLICA_LAG_SECONDS. They may predate a write whose version bump
+they are stored under.
+"""
+import itertools
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CATALOG_MODELS = frozenset({
+    'category', 'product', 'productimage', 'photolike', 'rankingepoch', 'productscore', 'imagescore',
+})
+# Скользящее среднее времени запроса: вес нового замера
+LATENCY_ALPHA = 0.2
+# При least-latency каждый N-й выбор идёт по кругу, чтобы замеры медленных реплик обновлялись
+EXPLORE_EVERY = 10
+
+_state = ContextVar('market_replica_state', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'MARKET_READ_REPLICAS', [])
+
+
+def get_lag():
+    return getattr(settings, 'MARKET_REPLICA_LAG_SECONDS', 5)
+
+
+class ReplicaState:
+    """Routes catalog reads in its context to a replica, unless `pinned` to the primary"""
+    __slots__ = ('pinned', 'wrote', 'replica', '_token')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+
+    def __enter__(self):
+        self._token = _state.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _state.reset(self._token)
+
+
+class ReplicaSelector:
+    """Picks the replica for a request and keeps per-alias query latency averages"""
+
+    def __init__(self):
+        self.counter = itertools.count()
+        self.latency = {}
+        self.lock = threading.Lock()
+
+    def choose(self, aliases):
+        n = next(self.counter)
+        if getattr(settings, 'MARKET_REPLICA_SELECTION', 'round-robin') == 'least-latency' and n % EXPLORE_EVERY:
+            # Ещё не измеренная реплика считается самой быстрой и получает запросы первой
+            return min(aliases, key=lambda alias: self.latency.get(alias, 0.0))
+        return aliases[n % len(aliases)]
+
+    def observe(self, alias, elapsed):
+        with self.lock:
+            average = self.latency.get(alias)
+            self.latency[alias] = elapsed if average is None else average + LATENCY_ALPHA * (elapsed - average)
+
+    def reset(self):
+        with self.lock:
+            self.latency.clear()
+
+
+selector = ReplicaSelector()
+
+
+def used_replica():
+    """Whether the current context has read from a replica"""
+    state = _state.get()
+    return state is not None and state.replica is not None
+
+
+def install(connection):
+    """Time the queries of replica connections for least-latency selection"""
+    if connection.alias in get_replicas() and measure_latency not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_latency)
+
+
+def measure_latency(execute, sql, params, many, context):
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        selector.observe(context['connection'].alias, perf_counter() - started)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or state.wrote:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        if not replicas or model._meta.app_label != 'market' or model._meta.model_name not in CATALOG_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        # Внутри транзакции на primary читаем её же данные
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = selector.choose(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Явно primary: иначе save() объекта, прочитанного с реплики, ушёл бы на реплику
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от primary
+        if db in get_replicas():
+            return False
+        return None
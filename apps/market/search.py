@@ -0,0 +1,117 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+FTS_TABLE = 'market_product_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:16]
+
+
+class SearchBackend:
+    """Base for product search backends (MARKET_SEARCH_BACKEND)
+
+    A backend defines `search(query, category_ids=None, limit=20, offset=0)`
+    returning the ids of matching products ordered by relevance, restricted
+    to `category_ids` when given. The hooks below are no-ops here:
+    `index`/`remove` are called from Product post_save/post_delete and after
+    bulk imports, for backends whose index lives outside the product table,
+    and `rebuild` by `manage.py rebuild_search_index`.
+    """
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 external-content index over market_product, ranked with bm25
+
+    The index is kept in sync by triggers on market_product (see migration
+    0006), so bulk_create/bulk_update and raw updates are covered too.
+    """
+    # Совпадение в названии важнее совпадения в описании
+    name_weight = 10.0
+    description_weight = 1.0
+
+    def match_expression(self, tokens):
+        # Каждый токен в кавычках, чтобы пользовательский ввод не стал синтаксисом FTS5
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search(self, query, category_ids=None, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [self.match_expression(tokens)]
+        if category_ids:
+            sql += f" AND category_id IN ({', '.join(['%s'] * len(category_ids))})"
+            params += list(category_ids)
+        sql += f' ORDER BY bm25({FTS_TABLE}, %s, %s), rowid LIMIT %s OFFSET %s'
+        params += [self.name_weight, self.description_weight, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+class DatabaseBackend(SearchBackend):
+    """Portable fallback without an index: every token must match name or description
+
+    Ranks name matches above description-only matches.
+    """
+
+    def search(self, query, category_ids=None, limit=20, offset=0):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        products = Product.objects.all()
+        name_match = Q()
+        for token in tokens:
+            products = products.filter(Q(name__icontains=token) | Q(description__icontains=token))
+            name_match &= Q(name__icontains=token)
+        if category_ids:
+            products = products.filter(category_id__in=category_ids)
+        products = products.annotate(
+            rank=Case(When(name_match, then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by('rank', 'id')
+        return list(products.values_list('id', flat=True)[offset:offset + limit])
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'MARKET_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend()
+        else:
+            _backend = DatabaseBackend()
+    return _backend
+
+
+def search_products(query, category_ids=None, limit=20, offset=0):
+    """Products matching `query` in relevance order, with images prefetched"""
+    ids = get_backend().search(query, category_ids=category_ids, limit=limit, offset=offset)
+    products = Product.objects.with_images().in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
@@ -1,23 +1,31 @@
+import os
+
 from . import models
 from typing import Optional, List
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
 from rest_framework import serializers
-from .models import Product, ProductImage, Category, PhotoLike
+from .models import (
+    MAX_PRODUCT_IMAGES, Product, ProductImage, Category, PhotoLike, ProductScore, ImageScore, UploadSession,
+)
+from .images import add_product_images
+from . import uploads
 
 class ProductImageSerializer(serializers.ModelSerializer):
-    likes_count = serializers.SerializerMethodField()
-    dislikes_count = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'likes_count', 'dislikes_count']  # Add other fields you need
-
-    def get_likes_count(self, obj) -> str:
-        # Count of likes where is_like=True
-        return obj.likes.filter(is_like=True).count()
+        fields = ['id', 'image', 'variants', 'likes_count', 'dislikes_count']  # Add other fields you need
+        read_only_fields = ['likes_count', 'dislikes_count']
 
-    def get_dislikes_count(self, obj) -> str:
-        # Count of dislikes where is_like=False
-        return obj.likes.filter(is_like=False).count()
+    def get_variants(self, obj) -> dict[str, dict[str, str]]:
+        # Пусто, пока фоновая обработка не закончилась
+        storage = obj.image.storage
+        return {
+            size: {fmt: storage.url(path) for fmt, path in formats.items()}
+            for size, formats in obj.variants.items()
+        }
 
 
     def get_liked_users(self, obj) -> List[str]:
@@ -27,7 +35,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
         """Убираем liked_by_user, если None"""
         rep = super().to_representation(instance)
         if rep.get('liked_by_user') is None:
-            rep.pop('liked_by_user')
+            rep.pop('liked_by_user', None)
         return rep
 
 
@@ -43,22 +51,10 @@ class ProductGetSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'price', 'category', 'description', 'images', 'upload_images']
 
-    def to_representation(self, instance):
-        """Передаём context для вложенного сериализатора images"""
-        rep = super().to_representation(instance)
-        rep['images'] = ProductImageSerializer(
-            instance.images.all(),
-            many=True,
-            context=self.context
-        ).data
-        return rep
-                
-
     def create(self, validated_data):
         images = validated_data.pop('upload_images', [])
         product = Product.objects.create(**validated_data)
-        for img in images:
-            ProductImage.objects.create(product=product, image=img)
+        add_product_images([ProductImage(product=product, image=img) for img in images])
         return product
 
 class ProductUpdateSerializer(serializers.ModelSerializer):
@@ -74,7 +70,7 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'price', 'category', 'description', 'upload_images', 'images']
 
     def validate_upload_images(self, value):
-        if len(value) > 5:
+        if len(value) > MAX_PRODUCT_IMAGES:
             raise serializers.ValidationError("Можно загрузить максимум 5 изображений одновременно.")
         return value
 
@@ -84,8 +80,7 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         images = validated_data.pop('upload_images', [])
         product = Product.objects.create(**validated_data)
-        for img in images:
-            ProductImage.objects.create(product=product, image=img)
+        add_product_images([ProductImage(product=product, image=img) for img in images])
         return product
 
     def update(self, instance, validated_data):
@@ -96,10 +91,10 @@ class ProductUpdateSerializer(serializers.ModelSerializer):
 
         images = validated_data.get('upload_images', [])
         if images:
-            if len(images) + instance.images.count() > 5:
+            # Открытые UploadSession держат за собой слоты
+            if len(images) + uploads.reserved_slots(instance.pk) > MAX_PRODUCT_IMAGES:
                 raise serializers.ValidationError("Общее количество изображений не может превышать 5.")
-            for img in images:
-                ProductImage.objects.create(product=instance, image=img)
+            add_product_images([ProductImage(product=instance, image=img) for img in images])
         return instance
 
     def validate(self, attrs):
@@ -122,16 +117,42 @@ class CategoryProductSerializer(serializers.ModelSerializer):
         model = Category
         fields = ['id', 'name', 'images', 'products']
 
-    def to_representation(self, instance):
-        """Передаём context для вложенных сериализаторов"""
-        rep = super().to_representation(instance)
-        rep['products'] = ProductGetSerializer(
-            instance.products.all(),
-            many=True,
-            context=self.context
-        ).data
-        return rep
-    
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    """Query parameters of the product list"""
+    category = serializers.ListField(child=serializers.IntegerField(min_value=1), source='category_ids',
+                                     required=False, help_text='Repeat to select several categories')
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    has_images = serializers.BooleanField(required=False, allow_null=True, default=None)
+    facets = serializers.BooleanField(required=False, default=False,
+                                      help_text='Add product counts per category and price bucket')
+
+    def validate(self, attrs):
+        if attrs.get('min_price') is not None and attrs.get('max_price') is not None \
+                and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError({'max_price': 'Must not be less than min_price.'})
+        return attrs
+
+class CategoryFacetSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+class PriceFacetSerializer(serializers.Serializer):
+    min = serializers.IntegerField(allow_null=True)
+    max = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+class ProductFacetsSerializer(serializers.Serializer):
+    categories = CategoryFacetSerializer(many=True)
+    price = PriceFacetSerializer(many=True)
+
+class ProductListSerializer(serializers.Serializer):
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    results = ProductGetSerializer(many=True)
+    facets = ProductFacetsSerializer(required=False)
 
 
 class PhotoLikeRequestSerializer(serializers.Serializer):
@@ -143,4 +164,74 @@ class PhotoLikeStateSerializer(serializers.Serializer):
 class PhotoLikeStateLikesCountSerializer(serializers.Serializer):
     state = serializers.CharField(allow_null=True)
     likes_count = serializers.IntegerField()
-    dislikes_count = serializers.IntegerField()
\ No newline at end of file
+    dislikes_count = serializers.IntegerField()
+
+
+class TrendingProductSerializer(serializers.ModelSerializer):
+    product = ProductGetSerializer(read_only=True)
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductScore
+        fields = ['product', 'score']
+
+    def get_score(self, obj) -> float:
+        # Хранимый счёт в единицах эпохи, отдаём "недавние лайки" на текущий момент
+        return round(obj.score * self.context['decay'], 3)
+
+
+class TrendingPhotoSerializer(serializers.ModelSerializer):
+    photo = ProductImageSerializer(source='image', read_only=True)
+    product = serializers.IntegerField(source='image.product_id', read_only=True)
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageScore
+        fields = ['photo', 'product', 'score']
+
+    def get_score(self, obj) -> float:
+        return round(obj.score * self.context['decay'], 3)
+
+
+class ProductImportRowErrorSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    errors = serializers.DictField()
+
+class ProductImportReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    updated = serializers.IntegerField()
+    error_count = serializers.IntegerField()
+    errors = ProductImportRowErrorSerializer(many=True)
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1, help_text='File size in bytes')
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', help_text='Hex SHA-256 of the whole file')
+
+    def validate_filename(self, value):
+        # Только имя: каталог задаёт upload_to
+        value = os.path.basename(value.replace('\\', '/'))
+        if not value:
+            raise serializers.ValidationError("Укажите имя файла.")
+        validate_image_file_extension(File(None, value))
+        return value
+
+    def validate_size(self, value):
+        if value > uploads.get_max_size():
+            raise serializers.ValidationError(f"Файл больше {uploads.get_max_size()} байт.")
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    image = ProductImageSerializer(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'product', 'filename', 'size', 'offset', 'status', 'image', 'updated_at']
+
+
+class ProductSearchResultSerializer(serializers.Serializer):
+    next = serializers.URLField(allow_null=True)
+    previous = serializers.URLField(allow_null=True)
+    results = ProductGetSerializer(many=True)
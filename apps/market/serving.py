@@ -0,0 +1,233 @@
+"""Serving catalog media without a CDN
+
+`serve_media` (a Django view, used under WSGI) and `MediaApp` (an ASGI
+wrapper answering MEDIA_URL before Django) share these rules:
+
+* blobs of the content-addressed storage (apps.market.storage) never
+  change: their ETag is the SHA-256 from the name, their size is looked up
+  once per process, and they are sent with a year-long `immutable`
+  Cache-Control. Other files get an ETag from mtime and size and
+  MARKET_MEDIA_MAX_AGE;
+* If-None-Match is answered with 304 and a single `Range` (honouring
+  If-Range) with 206. Several ranges get the whole file;
+* bodies go out without copying through Python where the server allows it.
+  FileResponse is handed to the WSGI server's file_wrapper (sendfile in
+  gunicorn and uWSGI), and MediaApp uses the ASGI
+  `http.response.zerocopysend` extension. With
+  MARKET_MEDIA_ACCEL_REDIRECT set, nginx sends the file (and ranges)
+  itself.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+import stat
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+
+from .storage import BLOB_PREFIX, catalog_storage
+
+BLOCK_SIZE = 256 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+BLOB_NAME = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.\w+)?$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+UNSATISFIABLE = object()
+
+MediaFile = namedtuple('MediaFile', 'path size content_type etag last_modified cache_control')
+
+
+def get_accel_redirect():
+    return getattr(settings, 'MARKET_MEDIA_ACCEL_REDIRECT', None)
+
+
+def _content_type(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def _regular_file(path):
+    info = os.stat(path)
+    if not stat.S_ISREG(info.st_mode):
+        raise FileNotFoundError(path)
+    return info
+
+
+@lru_cache(maxsize=16384)
+def _blob(root, name, sha256):
+    # Отсутствующий файл бросает исключение и в кэш не попадает
+    path = safe_join(root, name)
+    size = _regular_file(path).st_size
+    return MediaFile(path, size, _content_type(name), f'"{sha256}"', None, IMMUTABLE_CACHE_CONTROL)
+
+
+def lookup(name):
+    """MediaFile for a path under MEDIA_ROOT, None when there is no such file"""
+    root = catalog_storage().location
+    try:
+        if name.startswith(BLOB_PREFIX + '/'):
+            match = BLOB_NAME.match(name)
+            # Под blobs/ отдаём только сами blobs, не временные файлы сохранения
+            return _blob(root, name, match.group(1)) if match else None
+        path = safe_join(root, name)
+        info = _regular_file(path)
+    except (OSError, SuspiciousFileOperation):
+        return None
+    return MediaFile(
+        path, info.st_size, _content_type(name), f'"{info.st_mtime_ns:x}-{info.st_size:x}"',
+        http_date(info.st_mtime), f"public, max-age={getattr(settings, 'MARKET_MEDIA_MAX_AGE', 3600)}",
+    )
+
+
+def parse_range(header, size):
+    """(start, length) of a single-range `Range` header, None to ignore it, UNSATISFIABLE for 416"""
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N: последние N байт
+        length = min(int(last), size)
+        return (size - length, length) if length else UNSATISFIABLE
+    start = int(first)
+    if start >= size:
+        return UNSATISFIABLE
+    end = min(int(last), size - 1) if last else size - 1
+    if end < start:
+        return None
+    return start, end - start + 1
+
+
+def negotiate(media, if_none_match=None, range_header=None, if_range=None):
+    """(status, headers, (start, length) of the body or None) for a GET of `media`"""
+    headers = {'ETag': media.etag, 'Cache-Control': media.cache_control}
+    if media.last_modified:
+        headers['Last-Modified'] = media.last_modified
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        # Слабое сравнение, как требует If-None-Match
+        if '*' in etags or media.etag in (etag.removeprefix('W/') for etag in etags):
+            return 304, headers, None
+
+    headers.update({
+        'Content-Type': media.content_type, 'Accept-Ranges': 'bytes', 'X-Content-Type-Options': 'nosniff',
+    })
+    if range_header and (not if_range or if_range.strip() in (media.etag, media.last_modified)):
+        byte_range = parse_range(range_header, media.size)
+        if byte_range is UNSATISFIABLE:
+            headers['Content-Range'] = f'bytes */{media.size}'
+            return 416, headers, None
+        if byte_range is not None:
+            start, length = byte_range
+            headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{media.size}'
+            headers['Content-Length'] = str(length)
+            return 206, headers, byte_range
+    headers['Content-Length'] = str(media.size)
+    return 200, headers, (0, media.size)
+
+
+def iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    media = lookup(path)
+    if media is None:
+        raise Http404('No such file')
+    accel = get_accel_redirect()
+    status, headers, byte_range = negotiate(
+        media, request.headers.get('If-None-Match'),
+        # Диапазоны за X-Accel-Redirect обрабатывает nginx
+        None if accel else request.headers.get('Range'), request.headers.get('If-Range'),
+    )
+
+    if status == 304:
+        response = HttpResponseNotModified()
+    elif accel:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = accel + quote(path)
+        del headers['Content-Length']
+    elif request.method == 'HEAD' or status == 416:
+        response = HttpResponse(status=status)
+    else:
+        try:
+            file = open(media.path, 'rb')
+        except OSError:
+            raise Http404('No such file')
+        if status == 206:
+            response = StreamingHttpResponse(iter_range(file, *byte_range), status=status)
+        else:
+            # Весь файл: FileResponse уходит в wsgi.file_wrapper сервера (sendfile)
+            response = FileResponse(file)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+class MediaApp:
+    """ASGI app answering GET/HEAD under MEDIA_URL ahead of Django, everything else goes to `app`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        prefix = settings.MEDIA_URL
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD') or not scope['path'].startswith(prefix):
+            return await self.app(scope, receive, send)
+        request_headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        media = lookup(scope['path'][len(prefix):])
+        try:
+            file = open(media.path, 'rb') if media is not None else None
+        except OSError:
+            file = None
+        if file is None:
+            # 404 и всё остальное отвечает Django
+            return await self.app(scope, receive, send)
+
+        with file:
+            status, headers, byte_range = negotiate(
+                media, request_headers.get('if-none-match'), request_headers.get('range'),
+                request_headers.get('if-range'),
+            )
+            await send({
+                'type': 'http.response.start', 'status': status,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+            })
+            if byte_range is None or scope['method'] == 'HEAD':
+                await send({'type': 'http.response.body', 'body': b''})
+            elif 'http.response.zerocopysend' in scope.get('extensions', {}):
+                start, length = byte_range
+                await send({'type': 'http.response.zerocopysend', 'file': file, 'offset': start, 'count': length})
+            else:
+                await self.send_blocks(send, file, *byte_range)
+
+    async def send_blocks(self, send, file, start, length):
+        loop = asyncio.get_running_loop()
+        while length > 0:
+            # Чтение с диска не блокирует event loop
+            block = await loop.run_in_executor(None, os.pread, file.fileno(), min(BLOCK_SIZE, length), start)
+            if not block:
+                break
+            start += len(block)
+            length -= len(block)
+            await send({'type': 'http.response.body', 'body': block, 'more_body': length > 0})
+        if length > 0:
+            await send({'type': 'http.response.body', 'body': b''})
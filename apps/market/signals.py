@@ -0,0 +1,76 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import images, instrumentation, rankings, routers, search
+from .cache import bump_version
+from .models import Category, MediaBlob, PhotoLike, Product, ProductImage, likes_changed
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=PhotoLike)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_version(sender._meta.model_name)
+
+
+@receiver(post_save, sender=ProductImage)
+def enqueue_image_processing(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        images.enqueue([instance])
+
+
+@receiver(post_delete, sender=ProductImage)
+def discount_image_likes(sender, instance, **kwargs):
+    if instance.likes_count:
+        Product.objects.filter(pk=instance.product_id).update(popularity=F('popularity') - instance.likes_count)
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=ProductImage)
+def remember_media(sender, instance, **kwargs):
+    # Файлы до изменения: post_save считает по ним, какие ссылки ушли
+    stored = None if instance._state.adding else sender.objects.filter(pk=instance.pk).first()
+    instance._stored_media = stored.media_names() if stored is not None else []
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductImage)
+def count_media_references(sender, instance, **kwargs):
+    MediaBlob.objects.adjust(added=instance.media_names(), removed=getattr(instance, '_stored_media', []))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ProductImage)
+def discount_media_references(sender, instance, **kwargs):
+    MediaBlob.objects.adjust(removed=instance.media_names())
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_backend().index([instance])
+
+
+@receiver(post_save, sender=Product)
+def move_product_scores(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        rankings.move_product(instance)
+
+
+@receiver(likes_changed)
+def update_trending_scores(sender, changes, **kwargs):
+    rankings.record_likes(changes)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(connection_created)
+def install_query_hooks(sender, connection, **kwargs):
+    instrumentation.install(connection)
+    routers.install(connection)
@@ -0,0 +1,96 @@
+"""Content-addressed storage for product and category images
+
+Every distinct file is stored once, as `blobs/ab/cd/<sha256><ext>`. save()
+hashes the content while streaming it to a temporary file next to the
+blobs and renames it into place, so an upload of bytes that are already
+stored costs no extra disk and returns the existing name. The name passed
+to save() (upload_to plus the uploaded file name) only contributes the
+extension. A blob's content never changes, so its URL can be cached
+forever.
+
+Blobs are shared between rows, so delete() leaves them alone (files saved
+before this storage was introduced are still deleted). MediaBlob
+counts the ProductImage/Category references of every blob and `manage.py
+gc_media` removes the unreferenced ones.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+
+BLOB_PREFIX = 'blobs'
+BLOCK_SIZE = 64 * 1024
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+def blob_name(sha256, extension):
+    return posixpath.join(BLOB_PREFIX, sha256[:2], sha256[2:4], sha256 + extension)
+
+
+def catalog_storage():
+    """Storage of ProductImage.image and Category.images, STORAGES['catalog']"""
+    return storages['catalog']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя выбирает _save по содержимому, одинаковые файлы и должны совпадать
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        directory = self.path(BLOB_PREFIX)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+
+        if hasattr(content, 'temporary_file_path'):
+            # Уже на диске (крупная загрузка, собранный UploadSession): хэшируем на месте и перемещаем
+            source = content.temporary_file_path()
+            with open(source, 'rb') as file:
+                while block := file.read(BLOCK_SIZE):
+                    digest.update(block)
+        else:
+            with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+                    digest.update(chunk)
+            source = file.name
+
+        name = blob_name(digest.hexdigest(), extension)
+        path = self.path(name)
+        try:
+            if os.path.exists(path):
+                # Свежий mtime защищает blob от gc_media, пока строка с новой ссылкой не записана
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                try:
+                    file_move_safe(source, path)
+                except FileExistsError:
+                    # Тот же файл параллельно сохранил другой процесс
+                    pass
+                else:
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            if not hasattr(content, 'temporary_file_path') and os.path.exists(source):
+                os.remove(source)
+        return name
+
+    def delete(self, name):
+        # Blob может быть общим для нескольких строк, такие удаляет только gc_media
+        if not is_blob(name):
+            super().delete(name)
+
+    def blob_names(self):
+        """Names of all files under the blob prefix, including leftovers of interrupted saves"""
+        for directory, _, files in os.walk(self.path(BLOB_PREFIX)):
+            for filename in files:
+                relative = os.path.relpath(os.path.join(directory, filename), self.location)
+                yield relative.replace(os.sep, '/')
@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from ..cache import get_cache
+from ..models import Category, Product, ProductImage, PhotoLike
+
+User = get_user_model()
+
+
+def make_catalog(categories, products_per_category, images_per_product, users=()):
+    """Seed a small synthetic catalog, liking every image from every given user
+
+    Images point at files that do not exist, so they are bulk-created: no
+    post_save, no ImageJob that would fail on commit.
+    """
+    offset = Category.objects.count()
+    for c in range(categories):
+        category = Category.objects.create(name=f'Category {offset + c}', images='category_image/c.jpg')
+        for p in range(products_per_category):
+            product = Product.objects.create(
+                name=f'Product {offset + c}-{p}', price='10.00', description='', category=category,
+            )
+            photos = ProductImage.objects.bulk_create(
+                [ProductImage(product=product, image=f'product_images/{i}.jpg') for i in range(images_per_product)]
+            )
+            for image in photos:
+                for n, user in enumerate(users):
+                    PhotoLike.objects.create(user=user, photo=image, is_like=n % 2 == 0)
+    ProductImage.objects.all().recount_likes()
+    Product.objects.all().recount_popularity()
+
+
+@override_settings(MARKET_IMAGE_WORKERS=0)
+class MarketTestCase(TestCase):
+    def setUp(self):
+        # Версии кэша живут вне транзакции теста, поэтому сбрасываем его явно
+        get_cache().clear()
+
+    def use_media_root(self, **overrides):
+        """Store media in a temporary directory for this test, `overrides` are extra settings"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, **overrides))
+        return media_root
@@ -0,0 +1,89 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory
+from rest_framework.test import APIClient
+
+from apps.accounts.authentication import ClaimsRefreshToken
+
+from .. import async_views
+from ..cache import get_cache
+from ..metrics import registry
+from ..models import Category, Product, ProductImage
+from .base import MarketTestCase, User, make_catalog
+
+
+class AsyncReadViewTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(email=f'a{n}@example.com') for n in range(2)]
+        make_catalog(2, 3, 2, cls.users)
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.auth = f'Bearer {ClaimsRefreshToken.for_user(self.users[0]).access_token}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, url, method='get', auth=True, data=None, **kwargs):
+        headers = {'Authorization': self.auth} if auth else {}
+        request = getattr(self.factory, method)(url, data, headers=headers)
+        return async_to_sync(view.as_view())(request, **kwargs)
+
+    def test_reads_match_sync_views(self):
+        category, product = Category.objects.first(), Product.objects.first()
+        cases = [
+            (async_views.AsyncCategoryViews, '/api/category/?page_size=1', {}),
+            (async_views.AsyncCategoryOneViews, f'/api/category/{category.pk}', {'pk': category.pk}),
+            (async_views.AsyncProductViews, f'/api/product/?ordering=-price&facets=true&category={category.pk}', {}),
+            (async_views.AsyncProductOneViews, f'/api/product/{product.pk}/', {'pk': product.pk}),
+        ]
+        for view, url, kwargs in cases:
+            with self.subTest(url=url):
+                response = self.call(view, url, **kwargs)
+                self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+                get_cache().clear()
+                self.assertEqual(json.loads(response.content), self.client.get(url).json())
+
+    def test_query_counts_and_cache_match_sync_views(self):
+        with self.assertNumQueries(3 + 3):
+            self.call(async_views.AsyncCategoryViews, '/api/category/')
+        # Та же запись кэша, что у синхронного view
+        self.assertEqual(self.client.get('/api/category/')['X-Cache'], 'HIT')
+
+    def test_shapes_and_errors_match_sync_views(self):
+        for url in ('/api/category/?fields=id,products.images.id', '/api/product/?expand=&ordering=price',
+                    '/api/product/?fields=nope'):
+            with self.subTest(url=url):
+                view = async_views.AsyncCategoryViews if 'category' in url else async_views.AsyncProductViews
+                response = self.call(view, url)
+                get_cache().clear()
+                expected = self.client.get(url)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), expected.json())
+
+    def test_authentication(self):
+        response = self.call(async_views.AsyncCategoryViews, '/api/category/', auth=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.auth = 'Bearer garbage'
+        self.assertEqual(self.call(async_views.AsyncProductViews, '/api/product/').status_code, 401)
+        self.assertEqual(self.call(async_views.AsyncProductViews, '/api/product/', auth=False).status_code, 200)
+        self.assertEqual(self.call(async_views.AsyncProductViews, '/api/product/?min_price=x',
+                                   auth=False).status_code, 400)
+
+    def test_like_state_and_delegated_toggle(self):
+        photo = ProductImage.objects.first()
+        view, url = async_views.AsyncPhotoLikeView, f'/api/photos/{photo.pk}/like/'
+        self.assertEqual(json.loads(self.call(view, url, pk=photo.pk).content), {'state': 'liked'})
+        response = self.call(view, url, 'post', data={'action': 'like'}, pk=photo.pk)
+        self.assertEqual(response.data, {'state': None, 'likes_count': 0, 'dislikes_count': 1})
+        self.assertEqual(json.loads(self.call(view, url, pk=photo.pk).content), {'state': None})
+
+    async def test_metrics_middleware_counts_queries_under_asgi(self):
+        response = await self.async_client.get('/api/product/')
+        self.assertEqual(response.status_code, 200)
+        stats = registry.snapshot()[('GET', 'api/product/')]
+        self.assertEqual((stats.statuses, stats.queries_sum), ({200: 1}, 4))
@@ -0,0 +1,96 @@
+from rest_framework.test import APIClient
+
+from ..cache import stats
+from ..models import Product, ProductImage
+from .base import MarketTestCase, User, make_catalog
+
+
+class CatalogCacheTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='cache@example.com')
+        make_catalog(1, 2, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        stats.reset()
+
+    def test_repeated_read_is_served_from_cache(self):
+        self.assertEqual(self.client.get('/api/product/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/product/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(stats.snapshot()['hits'], 1)
+
+    def test_write_invalidates_cached_reads(self):
+        product = Product.objects.first()
+        self.client.get(f'/api/product/{product.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed'
+            product.save()
+        response = self.client.get(f'/api/product/{product.pk}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_like_toggle_invalidates_category_tree(self):
+        photo = ProductImage.objects.first()
+        self.client.get('/api/category/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/photos/{photo.pk}/like/', {'action': 'like'})
+        response = self.client.get('/api/category/')
+        images = [image for product in response.data['results'][0]['products'] for image in product['images']]
+        self.assertIn(1, [image['likes_count'] for image in images])
+
+    def test_not_found_is_not_cached(self):
+        self.client.get('/api/product/999/')
+        self.assertEqual(self.client.get('/api/product/999/')['X-Cache'], 'MISS')
+
+
+class ConditionalGetTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='etag@example.com')
+        make_catalog(1, 2, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_catalog_answers_304(self):
+        response = self.client.get('/api/category/')
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        response = self.client.get('/api/category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+
+    def test_query_string_changes_etag(self):
+        etag = self.client.get('/api/product/?page_size=1')['ETag']
+        response = self.client.get('/api/product/?page_size=1&ordering=-price', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get('/api/product/?page_size=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_like_changes_etag(self):
+        etag = self.client.get('/api/product/')['ETag']
+        photo = ProductImage.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/photos/{photo.pk}/like/', {'action': 'like'})
+        response = self.client.get('/api/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete_changes_etag(self):
+        product = Product.objects.first()
+        etag = self.client.get(f'/api/category/{product.category_id}')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.filter(product=product).delete()
+        response = self.client.get(f'/api/category/{product.category_id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,160 @@
+import base64
+import json
+
+from rest_framework.test import APIClient
+
+from ..cache import get_cache
+from ..models import Category, Product, ProductImage, PhotoLike
+from .base import MarketTestCase, User, make_catalog
+
+
+class CatalogQueryCountTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(email=f'u{n}@example.com') for n in range(3)]
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    # Помимо самих данных: по одному агрегату на таблицу для ETag/Last-Modified
+    def test_category_list_query_count_is_constant(self):
+        make_catalog(1, 1, 1, self.users)
+        with self.assertNumQueries(3 + 3):
+            self.client.get('/api/category/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_catalog(5, 4, 3, self.users)
+        with self.assertNumQueries(3 + 3):
+            response = self.client.get('/api/category/')
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_product_list_query_count_is_constant(self):
+        make_catalog(2, 5, 2, self.users)
+        with self.assertNumQueries(2 + 2):
+            self.client.get('/api/product/')
+
+    def test_category_payload_counts(self):
+        make_catalog(1, 1, 1, self.users)
+        response = self.client.get('/api/category/')
+        image = response.data['results'][0]['products'][0]['images'][0]
+        self.assertEqual(image['likes_count'], 2)
+        self.assertEqual(image['dislikes_count'], 1)
+
+
+class KeysetPaginationTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='pager@example.com')
+        make_catalog(1, 7, 0)
+        # Одинаковые цены проверяют сортировку по id внутри группы
+        for n, product in enumerate(Product.objects.order_by('id')):
+            product.price = 5 + n // 3
+            product.save()
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data[link]
+        return ids, response
+
+    def test_walks_all_pages_in_order(self):
+        ids, _ = self.walk('/api/product/?page_size=3')
+        self.assertEqual(ids, list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_ordering_by_price_with_ties(self):
+        ids, _ = self.walk('/api/product/?page_size=2&ordering=-price')
+        expected = list(Product.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_walks_back(self):
+        response = self.client.get('/api/product/?page_size=3&ordering=price')
+        response = self.client.get(response.data['next'])
+        second_page = [item['id'] for item in response.data['results']]
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']], second_page)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/product/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor_and_ordering(self):
+        self.assertEqual(self.client.get('/api/product/?cursor=garbage').status_code, 404)
+        for ordering, position in (('price', ['abc', 1]), ('price', [None, 1]), ('id', [1, 'x']), ('id', [1, 2 ** 70])):
+            payload = json.dumps({'o': ordering, 'd': False, 'p': position, 'b': False}).encode()
+            cursor = base64.urlsafe_b64encode(payload).decode()
+            with self.subTest(position=position):
+                self.assertEqual(self.client.get(f'/api/product/?ordering={ordering}&cursor={cursor}').status_code, 404)
+        self.assertEqual(self.client.get('/api/category/?ordering=price').status_code, 400)
+
+
+class ProductFilterTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='filter@example.com')
+        cls.phones = Category.objects.create(name='Phones', images='category_image/p.jpg')
+        cls.cases = Category.objects.create(name='Cases', images='category_image/c.jpg')
+        for name, price, category, photos in [
+            ('Basic phone', 40, cls.phones, 1), ('Mid phone', 300, cls.phones, 2),
+            ('Top phone', 1200, cls.phones, 0), ('Slim case', 15, cls.cases, 1), ('Hard case', 60, cls.cases, 0),
+        ]:
+            product = Product.objects.create(name=name, price=price, description='', category=category)
+            for i in range(photos):
+                ProductImage.objects.create(product=product, image=f'product_images/{i}.jpg')
+        users = [User.objects.create_user(email=f'fan{n}@example.com') for n in range(2)]
+        for user in users:
+            PhotoLike.objects.toggle(user, ProductImage.objects.filter(product__name='Mid phone').first().pk, True)
+        PhotoLike.objects.toggle(users[0], ProductImage.objects.get(product__name='Slim case').pk, True)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, query):
+        response = self.client.get(f'/api/product/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['name'] for item in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.names(f'category={self.phones.id}&min_price=100&ordering=price'),
+                         ['Mid phone', 'Top phone'])
+        self.assertEqual(self.names(f'category={self.phones.id}&category={self.cases.id}&max_price=50&ordering=price'),
+                         ['Slim case', 'Basic phone'])
+        self.assertEqual(self.names('has_images=false&ordering=name'), ['Hard case', 'Top phone'])
+        self.assertEqual(self.names('has_images=true&min_price=20&ordering=-price'), ['Mid phone', 'Basic phone'])
+
+    def test_ordering_by_popularity(self):
+        self.assertEqual(self.names('ordering=-popularity&page_size=2'), ['Mid phone', 'Slim case'])
+
+    def test_facets_are_one_grouped_query(self):
+        plain = f'/api/product/?category={self.phones.id}&max_price=500'
+        with self.assertNumQueries(2 + 2):
+            self.client.get(plain)
+        get_cache().clear()
+        with self.assertNumQueries(2 + 2 + 1):
+            response = self.client.get(plain + '&facets=true')
+        facets = response.data['facets']
+        # Категории считаются в пределах цены, цены — в пределах выбранных категорий
+        self.assertEqual(facets['categories'], [
+            {'id': self.phones.id, 'count': 2}, {'id': self.cases.id, 'count': 2},
+        ])
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 1, 0, 1, 0])
+        self.assertEqual((facets['price'][0]['min'], facets['price'][0]['max']), (None, 50))
+        self.assertNotIn('facets', self.client.get(plain).data)
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.client.get('/api/product/?min_price=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/product/?min_price=10&max_price=5').status_code, 400)
+        self.assertEqual(self.client.get('/api/product/?ordering=-likes').status_code, 400)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from collections import Counter
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from ..cache import get_cache
+from ..routers import ReplicaRouter, ReplicaSelector, ReplicaState
+from ..models import Product, ProductImage
+from .base import User, make_catalog
+
+
+class DatabaseTuningTests(TestCase):
+    def test_sqlite_connections_apply_the_pragmas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite pragmas')
+        with connection.cursor() as cursor:
+            values = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        pragmas = settings.SQLITE_PRAGMAS
+        self.assertEqual(values, {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': pragmas['busy_timeout'],
+            'mmap_size': pragmas['mmap_size'], 'cache_size': pragmas['cache_size'],
+        })
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(MARKET_IMAGE_WORKERS=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second SQLite file stands in for the replica; it only changes when synced"""
+    alias = 'replica_test'
+
+    @classmethod
+    def setUpClass(cls):
+        # Псевдоним появляется после проверок раннера, поэтому и в databases добавляется здесь
+        directory = tempfile.mkdtemp()
+        name = os.path.join(directory, 'replica.sqlite3')
+        connections.settings[cls.alias] = {
+            **connection.settings_dict, 'NAME': name, 'TEST': {**connection.settings_dict['TEST'], 'NAME': name},
+        }
+        cls.databases = {'default', cls.alias}
+        super().setUpClass()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cls.addClassCleanup(cls.drop_replica)
+
+    @classmethod
+    def drop_replica(cls):
+        connections[cls.alias].close()
+        del connections[cls.alias]
+        del connections.settings[cls.alias]
+
+    def setUp(self):
+        get_cache().clear()
+        self.enterContext(override_settings(MARKET_READ_REPLICAS=[self.alias]))
+
+    def seed(self):
+        """One product with a photo, copied to the replica"""
+        make_catalog(1, 1, 1)
+        self.product = Product.objects.get()
+        self.photo = ProductImage.objects.get()
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        self.seed()
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed on primary')
+        client = APIClient()
+        self.assertEqual(client.get(f'/api/product/{self.product.pk}/').data['name'], self.product.name)
+
+        response = client.put(f'/api/product/{self.product.pk}/', {
+            'name': 'Updated', 'price': '12.00', 'category': self.product.category_id, 'description': 'New',
+        })
+        self.assertEqual(response.data['name'], 'Updated')
+        self.assertIn('market_primary', response.cookies)
+        self.assertEqual(client.get(f'/api/product/{self.product.pk}/').data['name'], 'Updated')
+
+    @override_settings(MARKET_REPLICA_LAG_SECONDS=0)
+    def test_state_read_from_a_replica_is_not_kept_past_the_lag(self):
+        self.seed()
+        self.product.name = 'Renamed'
+        self.product.save()
+        # Версия уже поднята, а реплика отдаёт прежнее состояние
+        stale = APIClient().get(f'/api/product/{self.product.pk}/')
+        self.assertEqual(stale.data['name'], 'Product 0-0')
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        response = APIClient().get(f'/api/product/{self.product.pk}/', HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_like_toggle_reads_its_own_write(self):
+        self.seed()
+        user = User.objects.create_user(email='replica@example.com')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(f'/api/photos/{self.photo.pk}/like/', {'action': 'like'})
+        self.assertEqual((response.data['state'], response.data['likes_count']), ('liked', 1))
+        self.assertEqual(client.get(f'/api/photos/{self.photo.pk}/like/').data['state'], 'liked')
+
+        # Клиент без cookie читает реплику, которая ещё не получила лайк
+        other = APIClient()
+        other.force_authenticate(user)
+        self.assertIsNone(other.get(f'/api/photos/{self.photo.pk}/like/').data['state'])
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+        self.assertEqual(other.get(f'/api/photos/{self.photo.pk}/like/').data['state'], 'liked')
+
+    def test_reads_inside_a_primary_transaction_stay_on_the_primary(self):
+        router = ReplicaRouter()
+        with ReplicaState():
+            self.assertEqual(router.db_for_read(Product), self.alias)
+            self.assertEqual(router.db_for_read(User), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_least_latency_prefers_the_faster_replica(self):
+        selector = ReplicaSelector()
+        selector.observe('fast', 0.001)
+        selector.observe('slow', 0.050)
+        with override_settings(MARKET_REPLICA_SELECTION='least-latency'):
+            picks = Counter(selector.choose(['slow', 'fast']) for _ in range(20))
+        self.assertEqual(picks, {'fast': 18, 'slow': 2})
+        with override_settings(MARKET_REPLICA_SELECTION='round-robin'):
+            self.assertEqual({selector.choose(['slow', 'fast']) for _ in range(2)}, {'slow', 'fast'})
@@ -0,0 +1,51 @@
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from rest_framework.test import APIClient
+
+from ..models import ImageJob, Product, ProductImage
+from .base import MarketTestCase, make_catalog
+
+
+class ImagePipelineTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(1, 1, 0)
+        cls.product = Product.objects.get()
+
+    def setUp(self):
+        super().setUp()
+        self.use_media_root(MARKET_IMAGE_VARIANTS={'thumb': 64}, MARKET_IMAGE_FORMATS=['webp'])
+
+    def upload(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = ProductImage.objects.create(product=self.product, image=self.upload())
+            self.assertEqual(ImageJob.objects.get().status, ImageJob.PENDING)
+
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+        photo.refresh_from_db()
+        with photo.image.storage.open(photo.variants['thumb']['webp']) as variant_file:
+            with Image.open(variant_file) as variant:
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertEqual(variant.size, (64, 32))
+                self.assertFalse(variant.getexif())
+
+        response = APIClient().get(f'/api/product/{photo.product_id}/')
+        self.assertRegex(response.data['images'][0]['variants']['thumb']['webp'],
+                         r'^/media/blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.webp$')
+
+    def test_failed_job_is_recorded(self):
+        with self.assertLogs('apps.market.images', 'ERROR') as logs, self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image='product_images/missing.jpg')
+        self.assertIn('FileNotFoundError', logs.output[0])
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 1))
+        self.assertEqual(ProductImage.objects.get().variants, {})
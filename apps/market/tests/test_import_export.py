@@ -0,0 +1,121 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from ..exporter import iter_product_lines
+from ..importer import ProductImporter, iter_rows
+from ..models import Category, ImageJob, Product, ProductImage, UploadSession
+from .base import MarketTestCase, User, make_catalog
+
+
+class ProductImportTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', is_staff=True)
+        category = Category.objects.create(name='Phones', images='category_image/p.jpg')
+        cls.product = Product.objects.create(name='Old phone', price='1.00', description='', category=category)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_upload_upserts_and_reports_row_errors(self):
+        content = (
+            'name,price,description,category,images\n'
+            'New phone,199.99,Fresh,Phones,product_images/a.jpg;product_images/b.jpg\n'
+            'Old phone,2.50,Cheaper,Phones,\n'
+            'Bad price,abc,,Phones,\n'
+            'Lost,1.00,,Tablets,\n'
+            'New phone,5.00,,Phones,\n'
+        ).encode()
+        upload = SimpleUploadedFile('products.csv', content, content_type='text/csv')
+        response = self.client.post('/api/product/import/', {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6])
+        self.assertEqual(Product.objects.get(name='Old phone').price, Decimal('2.50'))
+        self.assertEqual(Product.objects.get(name='New phone').images.count(), 2)
+        self.assertEqual(ImageJob.objects.count(), 2)
+
+    def test_jsonl_command_uses_bulk_queries(self):
+        lines = [json.dumps({'name': f'Item {n}', 'price': '3.00', 'category': 'Phones'}) for n in range(50)]
+        lines.append('{not json')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            handle.write('\n'.join(lines))
+        self.addCleanup(os.remove, handle.name)
+
+        stdout, stderr = StringIO(), StringIO()
+        # Один чанк: категории, существующие товары, одна вставка и savepoint вокруг
+        with self.assertNumQueries(5):
+            call_command('import_products', handle.name, chunk_size=100, stdout=stdout, stderr=stderr)
+        self.assertEqual(Product.objects.filter(name__startswith='Item').count(), 50)
+        self.assertIn('line 51', stderr.getvalue())
+
+    def test_undecodable_and_malformed_files_are_reported(self):
+        content = b'name,price,description,category\nFine,1.00,,Phones\nBad\xff,1.00,,Phones\n'
+        report = ProductImporter().run(iter_rows(BytesIO(content), 'csv'))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['line'] for error in report['errors']], [3])
+        self.assertIn("can't decode byte 0xff", report['errors'][0]['errors']['non_field_errors'][0])
+
+        content = f'name,price,description,category\nHuge,1.00,{"x" * (csv.field_size_limit() + 1)},Phones\n'
+        report = ProductImporter().run(iter_rows(BytesIO(content.encode()), 'csv'))
+        self.assertIn('field larger than field limit', report['errors'][0]['errors']['non_field_errors'][0])
+        # В JSONL строка с ошибкой не мешает следующим
+        content = b'{"name": "\xff"}\n' + json.dumps({'name': 'Next', 'price': '1.00', 'category': 'Phones'}).encode()
+        report = ProductImporter().run(iter_rows(BytesIO(content), 'jsonl'))
+        self.assertEqual((report['created'], [error['line'] for error in report['errors']]), (1, [1]))
+
+    def test_image_limit_counts_live_uploads(self):
+        product = self.product
+        ProductImage.objects.bulk_create(ProductImage(product=product, image=f'product_images/{n}.jpg') for n in range(4))
+        UploadSession.objects.create(product=product, filename='a.png', size=1, sha256='0' * 64)
+        row = {'name': 'Old phone', 'price': '1.00', 'category': 'Phones', 'images': 'product_images/new.jpg'}
+        report = ProductImporter().run([(2, row)])
+        self.assertEqual([error['line'] for error in report['errors']], [2])
+        self.assertEqual(product.images.count(), 4)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(User.objects.create_user(email='user@example.com'))
+        self.assertEqual(self.client.post('/api/product/import/').status_code, 403)
+
+
+class ProductExportTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='export@example.com', is_staff=True)
+        make_catalog(2, 3, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_matches_api_payload(self):
+        response = self.client.get('/api/product/export/')
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        api = self.client.get('/api/product/').data['results']
+        self.assertEqual(lines, json.loads(json.dumps(api)))
+
+    def test_gzip_export(self):
+        response = self.client.get('/api/product/export/?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(content.splitlines()), 6)
+
+    def test_queries_scale_with_chunks_not_rows(self):
+        # Товары одним курсором + prefetch фото на каждый чанк из двух
+        with self.assertNumQueries(1 + 3):
+            lines = list(iter_product_lines(chunk_size=2))
+        self.assertEqual(len(lines), 6)
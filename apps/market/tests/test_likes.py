@@ -0,0 +1,199 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .. import benchmark, likes
+from ..cache import get_cache
+from ..models import Product, ProductImage, PhotoLike
+from .base import MarketTestCase, User, make_catalog
+
+
+class PhotoLikeCounterTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='liker@example.com')
+        make_catalog(1, 1, 1)
+        cls.photo = ProductImage.objects.get()
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, action):
+        return self.client.post(f'/api/photos/{self.photo.pk}/like/', {'action': action}).data
+
+    def test_toggle_updates_stored_counters(self):
+        self.assertEqual(self.post('like'), {'state': 'liked', 'likes_count': 1, 'dislikes_count': 0})
+        self.assertEqual(self.post('dislike'), {'state': 'disliked', 'likes_count': 0, 'dislikes_count': 1})
+        self.assertEqual(self.post('dislike'), {'state': None, 'likes_count': 0, 'dislikes_count': 0})
+        self.assertFalse(PhotoLike.objects.exists())
+        self.assertEqual(Product.objects.get().popularity, 0)
+        self.post('like')
+        self.assertEqual(Product.objects.get().popularity, 1)
+
+    def test_toggle_reads_the_reaction_once(self):
+        # Одна выборка и одна запись; delete() ещё собирает строки для post_delete
+        for is_like, expected in ((True, 2), (False, 2), (False, 3)):
+            with self.subTest(is_like=is_like), CaptureQueriesContext(connection) as queries:
+                PhotoLike.objects.toggle(self.user, self.photo.pk, is_like=is_like)
+            self.assertEqual(len([query for query in queries if 'market_photolike' in query['sql']]), expected)
+
+    def test_recount_command_repairs_drift(self):
+        PhotoLike.objects.create(user=self.user, photo=self.photo, is_like=True)
+        ProductImage.objects.update(likes_count=7, dislikes_count=3)
+        Product.objects.update(popularity=7)
+        call_command('recount_photo_likes', batch_size=1, stdout=StringIO())
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.likes_count, self.photo.dislikes_count), (1, 0))
+        self.assertEqual(Product.objects.get().popularity, 1)
+
+
+@override_settings(MARKET_LIKE_WRITE_BEHIND=True, MARKET_LIKE_FLUSH_INTERVAL=0, MARKET_LIKE_JOURNAL_DIR=None)
+class LikeWriteBehindTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(email=f'wb{n}@example.com') for n in range(2)]
+        make_catalog(1, 1, 2)
+        cls.photo, cls.other = ProductImage.objects.order_by('id')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        likes.buffer.clear()
+        self.addCleanup(likes.buffer.clear)
+
+    def post(self, action, photo=None):
+        return self.client.post(f'/api/photos/{(photo or self.photo).pk}/like/', {'action': action}).data
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return likes.buffer.flush()
+
+    def test_taps_answer_from_the_buffer_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post('like'), {'state': 'liked', 'likes_count': 1, 'dislikes_count': 0})
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['SELECT'])
+        likes.buffer.toggle(self.users[1], self.photo.pk, is_like=False)
+        self.assertEqual(self.post('dislike'), {'state': 'disliked', 'likes_count': 0, 'dislikes_count': 2})
+        self.assertEqual(self.client.get(f'/api/photos/{self.photo.pk}/like/').data, {'state': 'disliked'})
+        self.assertFalse(PhotoLike.objects.exists())
+
+        self.assertEqual(self.flush(), 2)
+        self.photo.refresh_from_db()
+        self.assertEqual((self.photo.likes_count, self.photo.dislikes_count), (0, 2))
+        self.assertEqual(PhotoLike.objects.filter(is_like=False).count(), 2)
+
+    def test_batch_coalesces_and_recounts(self):
+        PhotoLike.objects.create(user=self.users[1], photo=self.other, is_like=True)
+        ProductImage.objects.all().recount_likes()
+        self.post('like')
+        self.post('like')  # повторный лайк снимает первый: писать нечего
+        self.post('like', self.other)
+        likes.buffer.toggle(self.users[1], self.other.pk, is_like=True)
+        self.assertEqual(self.flush(), 2)
+        self.assertEqual(list(PhotoLike.objects.values_list('user', 'photo', 'is_like')),
+                         [(self.users[0].pk, self.other.pk, True)])
+        self.assertEqual(Product.objects.get().popularity, 1)
+        # Следующий тап читает уже записанное состояние
+        self.assertEqual(self.post('like', self.other), {'state': None, 'likes_count': 0, 'dislikes_count': 0})
+
+    def test_deleted_photo_does_not_block_the_batch(self):
+        self.post('like')
+        self.post('like', self.other)
+        self.other.delete()
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(PhotoLike.objects.get().photo_id, self.photo.pk)
+
+    def test_journal_of_a_dead_process_is_replayed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with open(os.path.join(directory, 'likes-999999999.jsonl'), 'w') as journal:
+            journal.write(json.dumps([self.users[0].pk, self.photo.pk, True]) + '\n')
+            journal.write(json.dumps([self.users[1].pk, self.photo.pk, False]) + '\n')
+            journal.write('[1, 2')  # оборванная запись при падении
+        buffer = likes.LikeBuffer()
+        with override_settings(MARKET_LIKE_JOURNAL_DIR=directory):
+            buffer.start()
+        buffer.toggle(self.users[0], self.other.pk, is_like=True)
+        self.assertEqual(len(open(os.path.join(directory, f'likes-{os.getpid()}.jsonl')).readlines()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(buffer.flush(), 3)
+        buffer.journal.close()
+        self.assertEqual(PhotoLike.objects.count(), 3)
+        self.assertEqual(os.listdir(directory), [f'likes-{os.getpid()}.jsonl'])
+        self.assertEqual(os.path.getsize(os.path.join(directory, f'likes-{os.getpid()}.jsonl')), 0)
+
+    def test_journal_claimed_by_a_dead_replayer_is_replayed_again(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Владелец — забравший журнал процесс 999999999, а не живой 1
+        with open(os.path.join(directory, 'replay-999999999-likes-1.jsonl'), 'w') as journal:
+            journal.write(json.dumps([self.users[0].pk, self.photo.pk, True]) + '\n')
+        with open(os.path.join(directory, f'replay-{os.getppid()}-likes-999999999.jsonl'), 'w'):
+            pass
+        buffer = likes.LikeBuffer()
+        with override_settings(MARKET_LIKE_JOURNAL_DIR=directory):
+            buffer.start()
+        self.assertEqual(len(buffer.replayed), 1)
+        os.remove(buffer.replayed[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(buffer.flush(), 1)
+        buffer.journal.close()
+        self.assertEqual(buffer.replayed, [])
+        self.assertEqual(PhotoLike.objects.get().user_id, self.users[0].pk)
+
+
+@override_settings(MARKET_IMAGE_WORKERS=0)
+class PhotoLikeConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        get_cache().clear()
+
+    def test_concurrent_toggles_keep_counters_consistent(self):
+        make_catalog(1, 1, 1)
+        photo = ProductImage.objects.get()
+        users = [User.objects.create_user(email=f'c{n}@example.com') for n in range(4)]
+        errors = []
+
+        def hammer(user, seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(15):
+                    PhotoLike.objects.toggle(user, photo.pk, is_like=rng.random() < 0.5)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        # Два потока на пользователя имитируют двойное нажатие
+        threads = [
+            threading.Thread(target=hammer, args=(user, n))
+            for n, user in enumerate(users * 2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        photo.refresh_from_db()
+        self.assertEqual(photo.likes_count, PhotoLike.objects.filter(is_like=True).count())
+        self.assertEqual(photo.dislikes_count, PhotoLike.objects.filter(is_like=False).count())
+
+    def test_write_benchmark_runs_without_lock_errors(self):
+        catalog = benchmark.seed_catalog(categories=2, products=10, images=2, likes=20, users=4)
+        results = benchmark.run_write_concurrency(catalog, writers=4, readers=2, seconds=0.5, hot_photos=3)
+        self.assertEqual({kind: row['statuses'] for kind, row in results.items() if row['errors']}, {})
+        for photo in ProductImage.objects.all():
+            self.assertEqual(photo.likes_count, photo.likes.filter(is_like=True).count())
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+
+from .. import media, serving
+from ..models import Category, MediaBlob, Product, ProductImage
+from .base import MarketTestCase, make_catalog
+
+
+class ContentAddressedStorageTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(1, 2, 0)
+        cls.products = list(Product.objects.order_by('id'))
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), 'green').save(buffer, 'PNG')
+        cls.content = buffer.getvalue()
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = self.use_media_root(MARKET_MEDIA_GC_GRACE_HOURS=1)
+
+    def upload(self, name='photo.PNG'):
+        return SimpleUploadedFile(name, self.content, content_type='image/png')
+
+    def blob_files(self):
+        return sorted(ProductImage._meta.get_field('image').storage.blob_names())
+
+    def age(self, name, hours=2):
+        path = os.path.join(self.media_root, name)
+        old = time.time() - hours * 3600
+        os.utime(path, (old, old))
+
+    def test_identical_uploads_are_stored_once(self):
+        photos = [ProductImage.objects.create(product=product, image=self.upload()) for product in self.products]
+        category = Category.objects.create(name='Same picture', images=self.upload('cover.png'))
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual({photo.image.name for photo in photos} | {category.images.name},
+                         {f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.png'})
+        self.assertEqual(self.blob_files(), [photos[0].image.name])
+        self.assertEqual(MediaBlob.objects.get().refcount, 3)
+        with photos[1].image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_unreferenced_blobs_are_collected_after_the_grace_period(self):
+        photos = [ProductImage.objects.create(product=product, image=self.upload()) for product in self.products]
+        name = photos[0].image.name
+        photos[0].delete()
+        self.assertEqual(MediaBlob.objects.get().refcount, 1)
+        # Расхождение счётчика не стоит файла, на который ещё есть ссылка
+        MediaBlob.objects.update(refcount=0)
+        self.age(name)
+        self.assertEqual(media.collect_garbage(), (0, 0))
+        self.assertEqual(MediaBlob.objects.get().refcount, 1)
+
+        photos[1].delete()
+        self.assertEqual(MediaBlob.objects.get().refcount, 0)
+        # Удаление строки не трогает файл, свежий blob переживает сборку
+        self.assertEqual(self.blob_files(), [name])
+        ProductImage.objects.create(product=self.products[0], image=self.upload())
+        ProductImage.objects.all().delete()
+        self.assertEqual(media.collect_garbage(), (0, 0))
+
+        self.age(name)
+        call_command('gc_media', stdout=StringIO())
+        self.assertEqual((self.blob_files(), MediaBlob.objects.count()), ([], 0))
+
+    def test_dedupe_adopts_files_saved_before_the_blob_store(self):
+        legacy = FileSystemStorage()
+        names = [legacy.save(f'product_images/{n}.png', ContentFile(self.content)) for n in range(2)]
+        ProductImage.objects.bulk_create([ProductImage(product=product, image=name, variants={'thumb': {'png': name}})
+                                          for product, name in zip(self.products, names)])
+
+        call_command('dedupe_media', stdout=StringIO())
+        blob, = self.blob_files()
+        self.assertEqual(set(ProductImage.objects.values_list('image', flat=True)), {blob})
+        self.assertEqual(ProductImage.objects.first().variants, {'thumb': {'png': blob}})
+        self.assertFalse(any(legacy.exists(name) for name in names))
+        self.assertEqual(MediaBlob.objects.get().refcount, 4)
+
+
+class MediaServingTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = self.use_media_root(MARKET_MEDIA_ACCEL_REDIRECT=None)
+        self.content = bytes(range(256)) * 40
+        self.name = ProductImage._meta.get_field('image').storage.save('photo.png', ContentFile(self.content))
+        self.url = settings.MEDIA_URL + self.name
+
+    def test_blobs_are_immutable_and_revalidated_without_touching_disk(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.content).hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual((response['Content-Type'], response['Content-Length']), ('image/png', str(len(self.content))))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        with mock.patch('apps.market.serving.os.stat', side_effect=AssertionError('stat')):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'W/"x", {response["ETag"]}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_single_ranges(self):
+        size = len(self.content)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual((response['Content-Range'], response['Content-Length']), (f'bytes 10-19/{size}', '10'))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size - 3}-')
+        self.assertEqual(response['Content-Range'], f'bytes {size - 3}-{size - 1}/{size}')
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{size}'))
+        # Несколько диапазонов и устаревший If-Range отдают весь файл
+        for headers in ({'HTTP_RANGE': 'bytes=0-1,5-6'}, {'HTTP_RANGE': 'bytes=0-1', 'HTTP_IF_RANGE': '"stale"'}):
+            response = self.client.get(self.url, **headers)
+            self.assertEqual((response.status_code, response['Content-Length']), (200, str(size)))
+
+    def test_head_and_files_outside_the_blob_store(self):
+        legacy = FileSystemStorage().save('category_images/cover.jpg', ContentFile(b'legacy'))
+        response = self.client.head(settings.MEDIA_URL + legacy)
+        self.assertEqual((response.status_code, response.content, response['Content-Length']), (200, b'', '6'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(settings.MEDIA_URL + legacy, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         304)
+
+    def test_missing_files_and_paths_outside_media_root_are_404(self):
+        secret = tempfile.NamedTemporaryFile(dir=os.path.dirname(self.media_root), suffix='.txt')
+        self.addCleanup(secret.close)
+        open(os.path.join(self.media_root, 'blobs', 'tmp123.tmp'), 'w').close()
+        for path in ('blobs/00/00/' + '0' * 64 + '.png', 'blobs/', 'blobs/tmp123.tmp',
+                     '..%2F' + os.path.basename(secret.name)):
+            self.assertEqual(self.client.get(settings.MEDIA_URL + path).status_code, 404, path)
+
+    def test_accel_redirect_hands_the_file_to_nginx(self):
+        with override_settings(MARKET_MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url, HTTP_RANGE='bytes=0-1')
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def call_asgi(self, path, headers=(), extensions=None):
+        messages = []
+        downstream = mock.AsyncMock()
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': list(headers), 'extensions': extensions or {}}
+        async_to_sync(serving.MediaApp(downstream))(scope, None, send)
+        return messages, downstream
+
+    def test_asgi_app_serves_media_ahead_of_django(self):
+        messages, downstream = self.call_asgi(self.url, [(b'range', b'bytes=100-')])
+        start, *body = messages
+        self.assertEqual(start['status'], 206)
+        self.assertIn((b'cache-control', b'public, max-age=31536000, immutable'), start['headers'])
+        self.assertEqual(b''.join(message['body'] for message in body), self.content[100:])
+        self.assertFalse(body[-1]['more_body'])
+        downstream.assert_not_called()
+
+        messages, _ = self.call_asgi(self.url, extensions={'http.response.zerocopysend': {}})
+        self.assertEqual((messages[1]['type'], messages[1]['offset'], messages[1]['count']),
+                         ('http.response.zerocopysend', 0, len(self.content)))
+
+        for path in ('/api/product/', settings.MEDIA_URL + 'missing.png'):
+            messages, downstream = self.call_asgi(path)
+            self.assertEqual(messages, [])
+            downstream.assert_called_once()
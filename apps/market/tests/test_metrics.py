@@ -0,0 +1,88 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, override_settings
+from rest_framework.test import APIClient
+
+from ..cache import stats
+from ..log import QueueLogHandler
+from ..metrics import registry
+from ..middleware import HybridMiddleware
+from ..models import Product
+from .base import MarketTestCase, User, make_catalog
+
+
+class MetricsTests(MarketTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        stats.reset()
+        self.client = APIClient()
+
+    def scrape(self, **headers):
+        return self.client.get('/api/metrics/', **headers)
+
+    def test_hybrid_middleware_passes_through_by_default(self):
+        response = HttpResponse()
+        request = AsyncRequestFactory().get('/')
+        self.assertIs(HybridMiddleware(lambda request: response)(request), response)
+
+        async def get_response(request):
+            return response
+
+        self.assertIs(async_to_sync(HybridMiddleware(get_response))(request), response)
+
+    def test_requests_are_aggregated_per_route(self):
+        make_catalog(1, 1, 1)
+        product = Product.objects.get()
+        self.client.get('/api/product/')
+        self.client.get(f'/api/product/{product.pk}/')
+        self.client.get('/api/product/0/')
+        self.client.force_authenticate(User.objects.create_superuser(email='ops@example.com', password='x'))
+        body = self.scrape().content.decode()
+
+        route = 'route="api/product/<int:pk>/"'
+        self.assertIn(f'market_http_requests_total{{method="GET",{route},status="200"}} 1', body)
+        self.assertIn(f'market_http_requests_total{{method="GET",{route},status="404"}} 1', body)
+        self.assertIn(f'market_http_request_duration_seconds_count{{method="GET",{route}}} 2', body)
+        self.assertIn(f'market_http_db_queries_bucket{{method="GET",route="api/product/",le="+Inf"}} 1', body)
+        stats = registry.snapshot()[('GET', 'api/product/')]
+        self.assertEqual(stats.queries_sum, 4)
+        self.assertGreater(stats.size_sum, 0)
+
+    def test_cache_lookups_are_exported(self):
+        self.client.get('/api/product/')
+        self.client.get('/api/product/')
+        self.client.force_authenticate(User.objects.create_superuser(email='ops@example.com', password='x'))
+        body = self.scrape().content.decode()
+        self.assertIn('market_cache_lookups_total{result="hit"} 1', body)
+        self.assertIn('market_cache_lookups_total{result="miss"} 1', body)
+
+    def test_scrape_requires_staff_or_token(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        with override_settings(MARKET_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.client.force_authenticate(User.objects.create_user(email='plain@example.com'))
+        self.assertEqual(self.scrape().status_code, 403)
+
+    def test_queue_handler_never_blocks(self):
+        class Collect(logging.Handler):
+            records = []
+
+            def emit(self, record):
+                self.records.append(record.getMessage())
+
+        handler = QueueLogHandler([Collect()], maxsize=1)
+        handler.listener.stop()  # никто не читает очередь: вторая запись должна быть отброшена
+        handler.listener = None
+        record = logging.LogRecord('t', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+        handler.handle(record)
+        handler.handle(record)
+        self.assertEqual(handler.dropped, 1)
+
+        handler = QueueLogHandler([Collect()])
+        handler.handle(record)
+        handler.close()
+        self.assertEqual(Collect.records, ['hello world'])
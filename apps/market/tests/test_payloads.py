@@ -0,0 +1,134 @@
+import json
+from decimal import Decimal
+
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .. import payloads
+from ..renderers import FastJSONRenderer
+from ..serializers import CategoryProductSerializer, ProductGetSerializer
+from ..models import Category, Product, ProductImage
+from .base import MarketTestCase, User, make_catalog
+
+
+class PayloadGoldenTests(MarketTestCase):
+    """payloads must render byte-for-byte like the serializers through DRF's JSONRenderer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(2, 2, 2)
+        category = Category.objects.create(name='Ünïcode\u2028line', images='category_image/с пробелом.jpg')
+        product = Product.objects.create(name='Чайник «Смарт»\u2029', price=Decimal('7.5'),
+                                         description='"quoted"\n\ttab', category=category)
+        ProductImage.objects.create(product=product, image='product_images/photo #1?.jpg', likes_count=3,
+                                    variants={'thumb': {'webp': 'product_images/variants/a.webp',
+                                                        'jpeg': 'product_images/../odd/a.jpg'}})
+        Product.objects.create(name='No photos', price=Decimal('1000000.99'), description='', category=category)
+
+    def assertRendersLike(self, expected, payload):
+        self.assertEqual(payloads.stdlib_dumps(payload), JSONRenderer().render(expected))
+        self.assertEqual(payloads.get_dumps()(payload), JSONRenderer().render(expected))
+
+    def test_products_match_the_serializer(self):
+        expected = ProductGetSerializer(Product.objects.with_images().order_by('id'), many=True).data
+        rows = Product.objects.order_by('id').values(*payloads.PRODUCT_FIELDS)
+        self.assertRendersLike(expected, payloads.products(rows))
+
+    def test_categories_match_the_serializer(self):
+        expected = CategoryProductSerializer(Category.objects.with_catalog().order_by('id'), many=True).data
+        rows = Category.objects.order_by('id').values(*payloads.CATEGORY_FIELDS)
+        self.assertRendersLike(expected, payloads.categories(rows))
+
+    def test_list_endpoint_serves_the_same_document(self):
+        self.client = APIClient()
+        response = self.client.get('/api/product/?page_size=100')
+        expected = ProductGetSerializer(Product.objects.with_images().order_by('id'), many=True).data
+        self.assertEqual(json.loads(response.content)['results'], json.loads(JSONRenderer().render(expected)))
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def test_renderer_falls_back_to_drf_for_other_types(self):
+        data = {'at': timezone.now(), 'price': Decimal('1.50')}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_output_is_byte_identical_to_drf(self):
+        for data in ({'name': 'line\u2028break\u2029', 'url': '/media/blobs/e9/67/e967.png'}, {'score': 1e16},
+                     [1e-05, -2.5e-7, 0.0001, 1234.5, 1e15], {'text': ':1e5 is not a number'}):
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class PayloadShapeTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(email=f's{n}@example.com') for n in range(2)]
+        make_catalog(2, 2, 2, cls.users)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    # +3/+2: агрегаты ETag, как в CatalogQueryCountTests
+    def test_menu_queries_categories_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get('/api/category/?fields=id,name')
+        self.assertEqual(len(queries), 1 + 3)
+        self.assertNotIn('product', queries[-1]['sql'])
+        self.assertEqual(results[0], {'id': results[0]['id'], 'name': 'Category 0'})
+
+    def test_expand_limits_the_embedded_levels(self):
+        with self.assertNumQueries(2 + 3):
+            results = self.get('/api/category/?expand=products')
+        self.assertEqual(list(results[0]), ['id', 'name', 'images', 'products'])
+        self.assertEqual(list(results[0]['products'][0]), ['id', 'name', 'price', 'category', 'description'])
+        self.assertEqual(self.get('/api/category/?expand=')[0].keys(), {'id', 'name', 'images'})
+
+    def test_nested_fields_select_only_their_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get('/api/category/?fields=name,products.name,products.images.likes_count')
+        self.assertEqual(results[0]['products'][0], {'name': 'Product 0-0', 'images': [{'likes_count': 1}] * 2})
+        self.assertNotIn('dislikes_count', queries[-1]['sql'])
+        self.assertNotIn('description', queries[-2]['sql'])
+
+    def test_cursor_works_without_the_ordering_field(self):
+        url, names = '/api/product/?fields=id&ordering=-name&page_size=3', []
+        while url:
+            response = self.client.get(url).json()
+            names += [product['id'] for product in response['results']]
+            self.assertTrue(all(product.keys() == {'id'} for product in response['results']))
+            url = response['next']
+        expected = list(Product.objects.order_by('-name', '-id').values_list('id', flat=True))
+        self.assertEqual(names, expected)
+
+    def test_detail_views_accept_shapes(self):
+        product = Product.objects.first()
+        response = self.client.get(f'/api/product/{product.pk}/?fields=price,images.id')
+        self.assertEqual(response.json(), {'price': '10.00', 'images': [{'id': image.pk} for image in
+                                                                        product.images.order_by('id')]})
+
+    def test_shapes_have_their_own_etags(self):
+        for url in (f'/api/product/{Product.objects.first().pk}/', '/api/category/'):
+            with self.subTest(url=url):
+                full = self.client.get(url)['ETag']
+                response = self.client.get(url + '?fields=id', HTTP_IF_NONE_MATCH=full)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], full)
+                self.assertEqual(self.client.get(url + '?fields=id', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                                 304)
+
+    def test_unknown_fields_are_rejected(self):
+        for query in ('fields=nope', 'fields=products.nope', 'fields=name.x', 'expand=name', 'expand=products.x'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/category/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(query.split('=')[0], response.json())
@@ -0,0 +1,86 @@
+import json
+import os
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from .. import benchmark
+from ..cache import get_cache
+from ..profiling import QueryProfiler, query_budget, statement_shape
+from ..serializers import ProductGetSerializer
+from ..models import Product, ProductImage
+from .base import MarketTestCase, make_catalog
+
+
+class ProductWithCategoryNameSerializer(ProductGetSerializer):
+    category_name = serializers.CharField(source='category.name')
+
+    class Meta(ProductGetSerializer.Meta):
+        fields = ProductGetSerializer.Meta.fields + ['category_name']
+
+
+class QueryProfilerTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(2, 3, 1)
+
+    def test_statement_shapes_collapse_literals_and_in_lists(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND n > 10 LIMIT 21'),
+            statement_shape('SELECT *  FROM t WHERE id IN (%s) AND n > 3 LIMIT 21'),
+        )
+
+    def test_n_plus_one_is_traced_to_serializer_field(self):
+        with QueryProfiler() as profiler:
+            ProductWithCategoryNameSerializer(Product.objects.with_images(), many=True).data
+        self.assertEqual(profiler.count, 2 + 6)
+        [suspect] = profiler.n_plus_one
+        self.assertEqual(suspect['count'], 6)
+        self.assertEqual(suspect['field'], 'ProductWithCategoryNameSerializer.category_name')
+        self.assertIn('market_category', suspect['sql'])
+        self.assertIn('n+1=ProductWithCategoryNameSerializer.category_name', profiler.summary())
+
+    def test_query_budget(self):
+        with query_budget(2):
+            ProductGetSerializer(Product.objects.with_images(), many=True).data
+        with self.assertRaisesMessage(AssertionError, 'N+1'):
+            with query_budget(4):
+                ProductWithCategoryNameSerializer(Product.objects.all(), many=True).data
+
+    def test_middleware_reports_on_request(self):
+        client = APIClient()
+        self.assertNotIn('X-Query-Profile', client.get('/api/product/'))
+        get_cache().clear()
+        with self.assertLogs('apps.market.middleware', 'INFO') as logs:
+            response = client.get('/api/product/', HTTP_X_PROFILE_QUERIES='1')
+        self.assertTrue(response['X-Query-Profile'].startswith('queries=4;'))
+        report = json.loads(logs.records[0].args[0])
+        self.assertEqual((report['path'], report['queries'], report['n_plus_one']), ('/api/product/', 4, []))
+
+
+class BenchmarkHarnessTests(MarketTestCase):
+    def test_every_scenario_succeeds_on_a_seeded_catalog(self):
+        catalog = benchmark.seed_catalog(categories=2, products=10, images=2, likes=20, users=3)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertEqual(ProductImage.objects.count(), 20)
+        self.use_media_root()
+        results = benchmark.run_client(catalog, benchmark.default_scenarios(), repeat=1)
+        failed = {name: row['statuses'] for name, row in results.items() if row['errors']}
+        self.assertEqual(failed, {})
+        self.assertIn('token', results)
+
+    def test_compare_flags_regressions(self):
+        row = {'p95_ms': 10.0, 'queries': 4, 'errors': 0, 'statuses': {'200': 5}}
+        baseline = {'client:product list': row}
+        self.assertEqual(benchmark.compare({'client:product list': {**row, 'p95_ms': 13.0}}, baseline), [])
+        failures = benchmark.compare({'client:product list': {**row, 'p95_ms': 20.0, 'queries': 5}}, baseline)
+        self.assertEqual(len(failures), 2)
+        failures = benchmark.compare({'client:product list': {**row, 'p95_ms': 20.0, 'queries': 5}}, baseline,
+                                     tolerance=None)
+        self.assertEqual(len(failures), 1)
+
+    def test_missing_baseline_is_an_error(self):
+        with self.assertRaisesMessage(CommandError, '--save-baseline'):
+            call_command('benchmark_api', baseline=os.path.join(self.use_media_root(), 'none.json'), stdout=StringIO())
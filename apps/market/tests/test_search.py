@@ -0,0 +1,54 @@
+from rest_framework.test import APIClient
+
+from ..search import DatabaseBackend
+from ..models import Category, Product
+from .base import MarketTestCase
+
+
+class ProductSearchTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        phones = Category.objects.create(name='Phones', images='category_image/p.jpg')
+        cases = Category.objects.create(name='Cases', images='category_image/c.jpg')
+        cls.case = Product.objects.create(name='Leather case', price='5.00', description='Fits any phone', category=cases)
+        cls.phone = Product.objects.create(name='Smartphone X', price='500.00', description='Great camera', category=phones)
+        cls.cable = Product.objects.create(name='Cable', price='2.00', description='USB charger cable', category=phones)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def search(self, query):
+        return [item['id'] for item in self.client.get('/api/product/search/', query).data['results']]
+
+    def test_prefix_matching_and_ranking(self):
+        # "phone" в названии (Smartphone не в счёт: префикс) выше совпадения в описании
+        self.assertEqual(self.search({'q': 'cab'}), [self.cable.id])
+        self.assertEqual(self.search({'q': 'smart'}), [self.phone.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.case.name = 'Phone case'
+            self.case.save()
+        self.assertEqual(self.search({'q': 'phone'}), [self.case.id])
+
+    def test_category_filter_and_pagination(self):
+        self.assertCountEqual(self.search({'q': 'c', 'category': self.phone.category_id}), [self.phone.id, self.cable.id])
+        response = self.client.get('/api/product/search/', {'q': 'c', 'page_size': 1})
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(len(self.client.get(response.data['next']).data['results']), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable.name = 'Adapter'
+            self.cable.save()
+        self.assertEqual(self.search({'q': 'adapt'}), [self.cable.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cable.delete()
+        self.assertEqual(self.search({'q': 'adapt'}), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search({'q': 'case" ^(*'}), [self.case.id])
+        self.assertEqual(self.client.get('/api/product/search/').status_code, 400)
+
+    def test_database_backend_agrees(self):
+        ids = DatabaseBackend().search('cable usb', category_ids=[self.cable.category_id])
+        self.assertEqual(ids, [self.cable.id])
@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .. import likes, rankings
+from ..models import Category, ImageScore, Product, ProductImage, ProductScore, PhotoLike
+from .base import MarketTestCase, User, make_catalog
+
+
+class TrendingTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(email=f'tr{n}@example.com') for n in range(4)]
+        make_catalog(2, 3, 1)
+        cls.category = Category.objects.order_by('id').first()
+        cls.old, cls.fresh, cls.cold = ProductImage.objects.filter(
+            product__category=cls.category).order_by('id')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def like(self, user, photo, hours_ago):
+        like = PhotoLike.objects.create(user=user, photo=photo, is_like=True)
+        PhotoLike.objects.filter(pk=like.pk).update(created_at=timezone.now() - timedelta(hours=hours_ago))
+
+    def trending(self, suffix='', **params):
+        response = self.client.get(f'/api/category/{self.category.pk}/trending/{suffix}', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_recompute_ranks_recent_likes_first(self):
+        for user in self.users[:3]:
+            self.like(user, self.old, hours_ago=72)  # 3 * 2**-3
+        self.like(self.users[0], self.fresh, hours_ago=24)  # 2**-1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rankings.recompute(), (2, 2))
+
+        data = self.trending()
+        self.assertEqual([row['product']['id'] for row in data['results']], [self.fresh.product_id, self.old.product_id])
+        self.assertAlmostEqual(data['results'][0]['score'], 0.5, places=2)
+        self.assertAlmostEqual(data['results'][1]['score'], 0.375, places=2)
+        photos = self.trending('photos/')['results']
+        self.assertEqual([(row['photo']['id'], row['product']) for row in photos],
+                         [(self.fresh.pk, self.fresh.product_id), (self.old.pk, self.old.product_id)])
+
+    def test_like_changes_shift_scores_incrementally(self):
+        PhotoLike.objects.toggle(self.users[0], self.cold.pk, is_like=True)
+        PhotoLike.objects.toggle(self.users[1], self.cold.pk, is_like=True)
+        score = ImageScore.objects.get(image=self.cold).score * rankings.decay()
+        self.assertAlmostEqual(score, 2, places=2)
+        self.assertEqual(ImageScore.objects.get().category, self.category)
+        PhotoLike.objects.toggle(self.users[0], self.cold.pk, is_like=False)  # лайк -> дизлайк
+        PhotoLike.objects.toggle(self.users[1], self.cold.pk, is_like=True)   # снять лайк
+        self.assertEqual(ProductScore.objects.get(product=self.cold.product_id).score, 0)
+        self.assertEqual(self.trending()['results'], [])
+
+    def test_endpoint_is_a_paginated_range_scan(self):
+        for n, photo in enumerate([self.old, self.fresh, self.cold]):
+            for user in self.users[:n + 1]:
+                PhotoLike.objects.toggle(user, photo.pk, is_like=True)
+        other = ProductImage.objects.exclude(product__category=self.category).first()
+        PhotoLike.objects.toggle(self.users[0], other.pk, is_like=True)
+
+        with self.assertNumQueries(4):  # категория, эпоха, страница, фото товаров
+            data = self.trending(page_size=2)
+        self.assertEqual([row['product']['id'] for row in data['results']],
+                         [self.cold.product_id, self.fresh.product_id])
+        rest = self.client.get(data['next']).data['results']
+        self.assertEqual([row['product']['id'] for row in rest], [self.old.product_id])
+        self.assertEqual(self.client.get('/api/category/0/trending/').status_code, 404)
+
+    def test_moving_a_product_moves_its_scores(self):
+        PhotoLike.objects.toggle(self.users[0], self.old.pk, is_like=True)
+        product = self.old.product
+        product.category = Category.objects.exclude(pk=self.category.pk).first()
+        product.save()
+        self.assertEqual(ProductScore.objects.get().category, product.category)
+        self.assertEqual(ImageScore.objects.get().category, product.category)
+
+    def test_rebase_keeps_order_and_decayed_values(self):
+        PhotoLike.objects.toggle(self.users[0], self.old.pk, is_like=True)
+        PhotoLike.objects.toggle(self.users[1], self.fresh.pk, is_like=True)
+        PhotoLike.objects.toggle(self.users[2], self.fresh.pk, is_like=True)
+        before = {row.image_id: row.score * rankings.decay() for row in ImageScore.objects.all()}
+        rankings.rebase(timezone.now() + timedelta(hours=48))
+        after = {row.image_id: row.score * rankings.decay() for row in ImageScore.objects.all()}
+        for pk, score in before.items():
+            self.assertAlmostEqual(after[pk], score, places=2)
+
+    @override_settings(MARKET_LIKE_WRITE_BEHIND=True, MARKET_LIKE_FLUSH_INTERVAL=0, MARKET_LIKE_JOURNAL_DIR=None)
+    def test_write_behind_flush_updates_scores(self):
+        likes.buffer.clear()
+        self.addCleanup(likes.buffer.clear)
+        likes.buffer.toggle(self.users[0], self.cold.pk, is_like=True)
+        self.assertFalse(ImageScore.objects.exists())
+        likes.buffer.flush()
+        self.assertAlmostEqual(ImageScore.objects.get(image=self.cold).score * rankings.decay(), 1, places=2)
+
+    def assertScore(self, photo, expected):
+        self.assertAlmostEqual(ImageScore.objects.get(image=photo).score * rankings.decay(), expected, places=3)
+        self.assertAlmostEqual(ProductScore.objects.get(product=photo.product_id).score * rankings.decay(), expected,
+                               places=3)
+
+    def test_unlike_subtracts_the_weight_of_the_removed_like(self):
+        self.like(self.users[0], self.cold, hours_ago=72)
+        ProductImage.objects.all().recount_likes()
+        Product.objects.all().recount_popularity()
+        with self.captureOnCommitCallbacks(execute=True):
+            rankings.recompute()
+        PhotoLike.objects.toggle(self.users[1], self.cold.pk, is_like=True)
+        self.assertScore(self.cold, 1 + 2 ** -3)
+        PhotoLike.objects.toggle(self.users[0], self.cold.pk, is_like=True)  # снять старый лайк
+        self.assertScore(self.cold, 1)
+        PhotoLike.objects.toggle(self.users[1], self.cold.pk, is_like=False)  # свежий лайк -> дизлайк
+        self.assertScore(self.cold, 0)
+
+    @override_settings(MARKET_LIKE_WRITE_BEHIND=True, MARKET_LIKE_FLUSH_INTERVAL=0, MARKET_LIKE_JOURNAL_DIR=None)
+    def test_write_behind_unlike_subtracts_the_weight_of_the_removed_like(self):
+        likes.buffer.clear()
+        self.addCleanup(likes.buffer.clear)
+        self.like(self.users[0], self.cold, hours_ago=72)
+        ProductImage.objects.all().recount_likes()
+        Product.objects.all().recount_popularity()
+        with self.captureOnCommitCallbacks(execute=True):
+            rankings.recompute()
+        likes.buffer.toggle(self.users[1], self.cold.pk, is_like=True)
+        likes.buffer.toggle(self.users[0], self.cold.pk, is_like=True)
+        likes.buffer.flush()
+        self.assertScore(self.cold, 1)
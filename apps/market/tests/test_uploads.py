@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from .. import uploads
+from ..models import ImageJob, Product, ProductImage, UploadSession
+from .base import MarketTestCase, User, make_catalog
+
+
+class ResumableUploadTests(MarketTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_catalog(1, 1, 0)
+        cls.product = Product.objects.get()
+        cls.user = User.objects.create_user(email='uploader@example.com')
+        buffer = BytesIO()
+        Image.effect_noise((120, 90), 64).convert('RGB').save(buffer, 'PNG')
+        cls.content = buffer.getvalue()
+
+    def setUp(self):
+        super().setUp()
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        self.use_media_root(MARKET_UPLOAD_DIR=self.upload_dir, MARKET_UPLOAD_MAX_CHUNK_SIZE=4096)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, content=None, **overrides):
+        content = self.content if content is None else content
+        data = {'filename': 'photo.png', 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest()}
+        response = self.client.post(f'/api/product/{self.product.pk}/uploads/', {**data, **overrides}, format='json')
+        return response
+
+    def put(self, session, chunk, start, size=None, **headers):
+        content_range = f'bytes {start}-{start + len(chunk) - 1}/{size or len(self.content)}'
+        return self.client.put(f'/api/uploads/{session}/', chunk, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=content_range, **headers)
+
+    def send(self, session, content, start=0, size=4096):
+        for offset in range(start, len(content), size):
+            chunk = content[offset:offset + size]
+            digest = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+            response = self.put(session, chunk, offset, HTTP_CONTENT_DIGEST=f'sha-256=:{digest}:')
+            self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_chunks_are_joined_into_a_product_image(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        session = response.data['id']
+        self.assertTrue(response['Location'].endswith(f'/api/uploads/{session}/'))
+        self.assertEqual(self.send(session, self.content).data['offset'], len(self.content))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/uploads/{session}/finalize/')
+        self.assertEqual((response.status_code, response.data['status']), (201, 'done'))
+        photo = ProductImage.objects.get(product=self.product)
+        with photo.image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual(ImageJob.objects.get(image=photo).status, ImageJob.DONE)
+        # Куски удалены, файл перемещён, а не скопирован
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertEqual(self.client.post(f'/api/uploads/{session}/finalize/').data['image']['id'], photo.pk)
+
+    def test_upload_with_a_jwt_from_the_token_endpoint(self):
+        User.objects.create_user(email='jwt-uploader@example.com', password='pw')
+        token = self.client.post('/api/token/', {'email': 'jwt-uploader@example.com', 'password': 'pw'}).data
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token['access']}")
+        response = self.start()
+        self.assertEqual(response.status_code, 201, response.content)
+        session = response.data['id']
+        self.assertEqual(UploadSession.objects.get().user.email, 'jwt-uploader@example.com')
+        self.send(session, self.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f'/api/uploads/{session}/finalize/').status_code, 201)
+        # Сессию видит только её владелец
+        other = APIClient()
+        other.force_authenticate(self.user)
+        self.assertEqual(other.get(f'/api/uploads/{session}/').status_code, 404)
+
+    def test_upload_resumes_from_the_stored_offset(self):
+        session = self.start().data['id']
+        self.send(session, self.content[:4096])
+        with self.assertRaises(serializers.ValidationError):
+            # Обрыв соединения: тело короче заявленного диапазона
+            uploads.write_chunk(UploadSession.objects.get(), BytesIO(self.content[4096:5000]), 4096, 8191)
+        self.assertEqual(self.client.get(f'/api/uploads/{session}/').data['offset'], 4096)
+
+        response = self.put(session, self.content[:4096], 0)
+        self.assertEqual((response.status_code, response.data['offset']), (409, 4096))
+        self.send(session, self.content, start=response.data['offset'])
+        self.assertEqual(self.client.post(f'/api/uploads/{session}/finalize/').status_code, 201)
+
+    def test_checksums_are_verified(self):
+        session = self.start().data['id']
+        response = self.put(session, self.content[:4096], 0, HTTP_CONTENT_DIGEST='sha-256=:AAAA:')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+
+        UploadSession.objects.update(sha256='0' * 64)
+        self.send(session, self.content)
+        response = self.client.post(f'/api/uploads/{session}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((UploadSession.objects.get().offset, ProductImage.objects.count()), (0, 0))
+
+        not_an_image = b'x' * 100
+        session = self.start(not_an_image).data['id']
+        self.put(session, not_an_image, 0, size=100)
+        self.assertEqual(self.client.post(f'/api/uploads/{session}/finalize/').status_code, 400)
+
+    def test_open_sessions_hold_image_slots(self):
+        ProductImage.objects.bulk_create([ProductImage(product=self.product, image=f'product_images/{n}.jpg')
+                                          for n in range(4)])
+        session = self.start().data['id']
+        self.assertEqual(self.start().status_code, 400)
+        self.assertEqual(uploads.reserved_slots(self.product.pk), 5)
+
+        self.assertEqual(self.client.delete(f'/api/uploads/{session}/').status_code, 204)
+        self.assertEqual(self.start().status_code, 201)
+
+    def test_sessions_are_private_and_expire(self):
+        session = self.start().data['id']
+        self.send(session, self.content[:4096])
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(email='other@example.com'))
+        self.assertEqual(other.get(f'/api/uploads/{session}/').status_code, 404)
+
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(self.start(filename='../../etc/passwd.png').data['filename'], 'passwd.png')
+        self.assertEqual(uploads.reserved_slots(self.product.pk), 1)
+        call_command('purge_uploads', stdout=StringIO())
+        self.assertEqual(list(UploadSession.objects.values_list('filename', flat=True)), ['passwd.png'])
+        self.assertFalse(os.path.exists(os.path.join(self.upload_dir, session)))
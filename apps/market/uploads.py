@@ -0,0 +1,307 @@
+"""Resumable, chunked uploads of product photos
+
+A multipart POST/PUT holds a worker for the whole transfer and starts over
+when the connection drops. Here a client:
+
+1. opens a session for one file (name, size, SHA-256), which reserves one
+   of the product's MAX_PRODUCT_IMAGES slots;
+2. sends the bytes in chunks, `PUT` with `Content-Range: bytes a-b/size`,
+   each one streamed to its own file under MARKET_UPLOAD_DIR. The session
+   offset only moves forward after a whole chunk (and its optional
+   `Content-Digest`) arrived, so after a drop the client resumes from the
+   offset in the session;
+3. finalizes: the chunks are joined while hashing, the checksum and the
+   image are verified, and the file is moved into storage and attached as
+   a ProductImage (variants are generated by the usual ImageJob).
+
+Sessions untouched for MARKET_UPLOAD_EXPIRY_HOURS stop holding their slot
+and are removed by `manage.py purge_uploads`.
+"""
+import base64
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Now
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .images import add_product_images
+from .models import MAX_PRODUCT_IMAGES, Product, ProductImage, UploadSession
+
+BLOCK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+CONTENT_DIGEST = re.compile(r'sha-256=:([A-Za-z0-9+/=]+):')
+
+
+class OffsetConflict(APIException):
+    """The chunk does not start where the session stands, `offset` tells where to resume"""
+    status_code = status.HTTP_409_CONFLICT
+    default_code = 'offset_conflict'
+
+    def __init__(self, session, detail='Chunk does not start at the upload offset.'):
+        super().__init__(detail)
+        # Смещение остаётся числом, а не ErrorDetail
+        self.detail = {'detail': self.detail, 'offset': session.offset}
+
+
+def get_upload_dir():
+    return Path(getattr(settings, 'MARKET_UPLOAD_DIR', Path(settings.BASE_DIR) / 'uploads'))
+
+
+def get_max_size():
+    return getattr(settings, 'MARKET_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'MARKET_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def session_dir(session):
+    return get_upload_dir() / str(session.pk)
+
+
+def chunk_path(session, start):
+    # Имя по смещению с нулями: сортировка имён совпадает с порядком в файле
+    return session_dir(session) / f'{start:020d}.chunk'
+
+
+def reserved_slots(product_id):
+    """Images of the product plus the slots held by its live upload sessions"""
+    return reserved_slot_counts([product_id])[product_id]
+
+
+def reserved_slot_counts(product_ids):
+    """reserved_slots() of several products in two queries, as a Counter by product id"""
+    counts = Counter()
+    for queryset in (ProductImage.objects.all(), UploadSession.objects.live()):
+        counts.update(dict(
+            queryset.filter(product_id__in=product_ids)
+            .values('product').annotate(total=Count('id')).values_list('product', 'total')
+        ))
+    return counts
+
+
+def open_session(product_id, user, filename, size, sha256):
+    with transaction.atomic():
+        # Блокировка товара упорядочивает конкурентные проверки лимита
+        product = Product.objects.select_for_update().filter(pk=product_id).first()
+        if product is None:
+            return None
+        if reserved_slots(product.pk) >= MAX_PRODUCT_IMAGES:
+            raise ValidationError("Общее количество изображений не может превышать 5.")
+        return UploadSession.objects.create(
+            product=product, user_id=user.pk if user.is_authenticated else None,
+            filename=filename, size=size, sha256=sha256.lower(),
+        )
+
+
+def parse_content_range(value, session):
+    """(start, end) of a `Content-Range: bytes start-end/size` header, end inclusive"""
+    match = CONTENT_RANGE.match(value or '')
+    if match is None:
+        raise ValidationError({'Content-Range': 'Expected "bytes <start>-<end>/<size>".'})
+    start, end, size = map(int, match.groups())
+    if size != session.size or start > end or end >= size:
+        raise ValidationError({'Content-Range': f'Range must lie within the {session.size} byte upload.'})
+    if end - start + 1 > get_max_chunk_size():
+        raise ValidationError({'Content-Range': f'Chunks are limited to {get_max_chunk_size()} bytes.'})
+    return start, end
+
+
+def parse_content_digest(value):
+    """The SHA-256 of an RFC 9530 `Content-Digest` header, None when absent"""
+    if not value:
+        return None
+    match = CONTENT_DIGEST.search(value)
+    if match is None:
+        raise ValidationError({'Content-Digest': 'Only sha-256 digests are supported.'})
+    try:
+        return base64.b64decode(match.group(1), validate=True)
+    except ValueError:
+        raise ValidationError({'Content-Digest': 'Invalid base64.'})
+
+
+def _receive(stream, length, directory):
+    """Copy `length` bytes of `stream` to a temporary file in `directory`, returns (path, received, sha256)"""
+    digest = hashlib.sha256()
+    received = 0
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False) as target:
+        while received < length:
+            block = stream.read(min(BLOCK_SIZE, length - received))
+            if not block:
+                break
+            target.write(block)
+            digest.update(block)
+            received += len(block)
+    return target.name, received, digest.digest()
+
+
+def write_chunk(session, stream, start, end, digest=None):
+    """Store bytes start..end of the upload from `stream` and advance the offset past them
+
+    Nothing is buffered in memory and the offset moves only once the whole
+    chunk is on disk, so a dropped connection leaves the session where it
+    was. Of concurrent retries of the same chunk exactly one is applied.
+    """
+    if session.status != UploadSession.OPEN:
+        raise OffsetConflict(session, 'Upload is already finalized.')
+    if start != session.offset:
+        raise OffsetConflict(session)
+
+    directory = session_dir(session)
+    directory.mkdir(parents=True, exist_ok=True)
+    path, received, received_digest = _receive(stream, end - start + 1, directory)
+    try:
+        if received != end - start + 1:
+            raise ValidationError('Chunk is incomplete, resend it.')
+        if digest is not None and digest != received_digest:
+            raise ValidationError({'Content-Digest': 'Chunk does not match its digest, resend it.'})
+        # Условный UPDATE: из одновременных повторов одного куска выигрывает один
+        claimed = UploadSession.objects.filter(
+            pk=session.pk, status=UploadSession.OPEN, offset=start,
+        ).update(offset=end + 1, updated_at=Now())
+        if not claimed:
+            session.refresh_from_db()
+            raise OffsetConflict(session)
+        os.replace(path, chunk_path(session, start))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    session.refresh_from_db()
+    return session
+
+
+class AssembledFile(File):
+    """The joined upload, moved rather than copied by FileSystemStorage"""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _assemble(session):
+    """Join the chunks into one temporary file, returns (path, sha256 hex)
+
+    A chunk missing at its offset (a writer died between the offset update
+    and the rename) rewinds the session to it, so the client resends it.
+    """
+    digest = hashlib.sha256()
+    position = 0
+    session_dir(session).mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=session_dir(session), suffix='.upload', delete=False) as target:
+        try:
+            while position < session.size:
+                try:
+                    source = open(chunk_path(session, position), 'rb')
+                except FileNotFoundError:
+                    UploadSession.objects.filter(pk=session.pk, offset=session.offset).update(offset=position)
+                    session.refresh_from_db()
+                    raise OffsetConflict(session, 'A chunk is missing, resend from the offset.')
+                with source:
+                    while block := source.read(BLOCK_SIZE):
+                        target.write(block)
+                        digest.update(block)
+                        position += len(block)
+        except BaseException:
+            os.remove(target.name)
+            raise
+    return target.name, digest.hexdigest()
+
+
+def _restart(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    UploadSession.objects.filter(pk=session.pk).update(offset=0, updated_at=Now())
+    session.refresh_from_db()
+
+
+def finalize(session):
+    """Verify the complete upload and attach it to the product, returns the ProductImage
+
+    Finalizing a finished session again returns its image.
+    """
+    if session.status == UploadSession.DONE:
+        return session.image
+    if session.offset != session.size:
+        raise OffsetConflict(session, 'Upload is not complete.')
+
+    path, sha256 = _assemble(session)
+    if sha256 != session.sha256:
+        os.remove(path)
+        _restart(session)
+        raise ValidationError({'sha256': 'Uploaded file does not match the checksum, upload it again.'})
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        os.remove(path)
+        _restart(session)
+        raise ValidationError({'detail': 'Upload a valid image. The file you uploaded was either not an image '
+                                         'or a corrupted image.'})
+
+    field = ProductImage._meta.get_field('image')
+    with open(path, 'rb') as assembled:
+        name = field.storage.save(field.generate_filename(None, session.filename), AssembledFile(assembled))
+    if os.path.exists(path):
+        os.remove(path)
+
+    try:
+        with transaction.atomic():
+            claimed = UploadSession.objects.filter(
+                pk=session.pk, status=UploadSession.OPEN, offset=session.size,
+            ).update(status=UploadSession.DONE, updated_at=Now())
+            if claimed:
+                # Слот был зарезервирован сессией, но multipart-загрузки без сессий могли его занять
+                Product.objects.select_for_update().filter(pk=session.product_id).first()
+                if ProductImage.objects.filter(product_id=session.product_id).count() >= MAX_PRODUCT_IMAGES:
+                    raise ValidationError("Общее количество изображений не может превышать 5.")
+                photo, = add_product_images([ProductImage(product_id=session.product_id, image=name)])
+                UploadSession.objects.filter(pk=session.pk).update(image=photo)
+    except BaseException:
+        field.storage.delete(name)
+        raise
+
+    if not claimed:
+        # Параллельный finalize успел первым
+        field.storage.delete(name)
+        session.refresh_from_db()
+        return finalize(session)
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    session.refresh_from_db()
+    return session.image
+
+
+def abort(session):
+    """Drop the session and its chunks, freeing the image slot"""
+    directory = session_dir(session)
+    session.delete()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def purge():
+    """Delete expired sessions and their chunks, returns how many sessions were removed
+
+    Chunk directories left without a session (its product was deleted) are
+    removed once they are as old as an expired session.
+    """
+    expired = list(UploadSession.objects.expired())
+    for session in expired:
+        abort(session)
+
+    directory = get_upload_dir()
+    if directory.is_dir():
+        cutoff = time.time() - getattr(settings, 'MARKET_UPLOAD_EXPIRY_HOURS', 24) * 3600
+        names = {str(pk) for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for path in directory.iterdir():
+            if path.is_dir() and path.name not in names and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+    return len(expired)
@@ -1,9 +1,31 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+
+if settings.MARKET_ASYNC_VIEWS:
+    # Чтение каталога прямо в event loop, запись уходит в те же DRF views
+    from . import async_views as read_views
+    CategoryViews, CategoryOneViews = read_views.AsyncCategoryViews, read_views.AsyncCategoryOneViews
+    ProductViews, ProductOneViews = read_views.AsyncProductViews, read_views.AsyncProductOneViews
+    PhotoLikeView = read_views.AsyncPhotoLikeView
+else:
+    CategoryViews, CategoryOneViews = views.CategoryViews, views.CategoryOneViews
+    ProductViews, ProductOneViews = views.ProductViews, views.ProductOneViews
+    PhotoLikeView = views.PhotoLikeView
+
 urlpatterns = [
-    path('category/',views.CategoryViews.as_view()),
-    path('category/<int:pk>',views.CategoryOneViews.as_view()),
-    path('product/',views.ProductViews.as_view()),
-    path('product/<int:pk>/',views.ProductOneViews.as_view()),
-    path('photos/<int:pk>/like/',views. PhotoLikeView.as_view()),
+    path('category/',CategoryViews.as_view()),
+    path('category/<int:pk>',CategoryOneViews.as_view()),
+    path('category/<int:pk>/trending/',views.TrendingProductsView.as_view()),
+    path('category/<int:pk>/trending/photos/',views.TrendingPhotosView.as_view()),
+    path('product/',ProductViews.as_view()),
+    path('product/import/',views.ProductImportView.as_view()),
+    path('product/export/',views.ProductExportView.as_view()),
+    path('product/search/',views.ProductSearchView.as_view()),
+    path('product/<int:pk>/',ProductOneViews.as_view()),
+    path('product/<int:pk>/uploads/',views.ProductUploadView.as_view()),
+    path('uploads/<uuid:pk>/',views.UploadSessionView.as_view(),name='upload-session'),
+    path('uploads/<uuid:pk>/finalize/',views.UploadFinalizeView.as_view()),
+    path('photos/<int:pk>/like/',PhotoLikeView.as_view()),
+    path('metrics/',views.MetricsView.as_view()),
 ]
\ No newline at end of file
@@ -1,29 +1,71 @@
+import os
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from drf_spectacular.utils import OpenApiRequest, extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiRequest, extend_schema
 from . import models
-from .models import PhotoLike, ProductImage
+from .models import PhotoLike, ProductImage, UploadSession
 from . import serializers
+from . import exporter
+from . import importer
+from . import likes
+from . import metrics
+from . import payloads
+from . import rankings
+from . import search
+from . import uploads
+from .cache import cached_response
+from .conditional import (
+    category_list_state, category_state, conditional_response, product_list_state, product_state,
+)
+from .pagination import KeysetPagination
 from rest_framework import permissions
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.generics import GenericAPIView
+from rest_framework.exceptions import NotFound, ValidationError
+from django.urls import reverse
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.settings import api_settings
+
+
+def shape_parameters(level):
+    """`fields` and `expand` query parameters of the payloads built for `level`"""
+    relations = ', '.join(f'`{path}`' for path in level.relation_paths())
+    return [
+        OpenApiParameter('fields', str, description='Comma-separated keys to return, dotted for keys of embedded '
+                                                    'objects (`products.name`). All keys by default.'),
+        OpenApiParameter('expand', str, description=f'Comma-separated relations to embed: {relations}. Without '
+                                                    '`fields` and `expand` all are embedded, `expand=` embeds none.'),
+    ]
+
 
 class CategoryViews(APIView):
     parser_classes = [MultiPartParser, FormParser]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'name')
     # permission_classes = [permissions.AllowAny]
 
     @extend_schema(
         summary="List all categories with products",
-        description="Returns a list of all categories along with their related products.",
+        description="Returns a cursor-paginated list of categories along with their related products. "
+                    "`fields` and `expand` trim the payload, e.g. `fields=id,name` for a menu.",
+        parameters=shape_parameters(payloads.CATEGORY),
         responses=serializers.CategoryProductSerializer(many=True),
     )
+    @conditional_response(category_list_state, 'category', 'product', 'productimage', 'photolike')
+    @cached_response('category', 'product', 'productimage', 'photolike')
     def get(self, request):
-        categories = models.Category.objects.all()
-        serializer = serializers.CategoryProductSerializer(categories, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        shape = payloads.request_shape(payloads.CATEGORY, request)
+        paginator = self.pagination_class()
+        categories = models.Category.objects.values(*shape.columns(*self.ordering_fields))
+        rows = paginator.paginate_queryset(categories, request, view=self)
+        return paginator.get_paginated_response(payloads.categories(rows, shape))
 
     @extend_schema(
         summary="Create a new category",
@@ -59,15 +101,17 @@ class CategoryOneViews(APIView):
     @extend_schema(
         summary="Get a single category by ID with its products",
         description="Retrieve a specific category by its ID. Includes all related products.",
+        parameters=shape_parameters(payloads.CATEGORY),
         responses=serializers.CategoryProductSerializer,
     )
+    @conditional_response(category_state, 'category', 'product', 'productimage', 'photolike')
+    @cached_response('category', 'product', 'productimage', 'photolike')
     def get(self, request, pk):
-        try:
-            category = models.Category.objects.get(id=pk)
-            serializer = serializers.CategoryProductSerializer(category)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except models.Category.DoesNotExist:
+        shape = payloads.request_shape(payloads.CATEGORY, request)
+        rows = payloads.categories(models.Category.objects.filter(id=pk).values(*shape.columns()), shape)
+        if not rows:
             return Response({'detail': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(rows[0], status=status.HTTP_200_OK)
 
     @extend_schema(
         summary="Delete a category by ID",
@@ -86,16 +130,41 @@ class CategoryOneViews(APIView):
 
 class ProductViews(APIView):
     parser_classes = [MultiPartParser, FormParser]
+    pagination_class = KeysetPagination
+    ordering_fields = ('id', 'price', 'name', 'popularity')
 
     @extend_schema(
         summary="List all products with their category",
-        description="Returns a list of all products along with their related category information.",
-        responses=serializers.ProductGetSerializer(many=True),
+        description="Returns a cursor-paginated list of products along with their related category information. "
+                    "Filter by `category` (repeatable), `min_price`/`max_price` and `has_images`; order by "
+                    "price, name or popularity (total photo likes). With `facets=true` the response also "
+                    "counts the matching products per category and per price bucket.",
+        parameters=[serializers.ProductFilterSerializer, *shape_parameters(payloads.PRODUCT)],
+        responses=serializers.ProductListSerializer,
     )
+    @conditional_response(product_list_state, 'product', 'productimage', 'photolike')
+    @cached_response('product', 'productimage', 'photolike')
     def get(self, request):
-        products = models.Product.objects.all()
-        serializer = serializers.ProductGetSerializer(products, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filters = serializers.ProductFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = dict(filters.validated_data)
+        with_facets = params.pop('facets')
+        shape = payloads.request_shape(payloads.PRODUCT, request)
+
+        paginator = self.pagination_class()
+        # Поля сортировки нужны курсору, даже если их нет в fields
+        products = models.Product.objects.browse(**params).values(*shape.columns(*self.ordering_fields))
+        page = paginator.paginate_queryset(products, request, view=self)
+        response = paginator.get_paginated_response(payloads.products(page, shape))
+        if with_facets:
+            # Фасеты не учитывают собственный фильтр, поэтому категории и цена передаются отдельно
+            response.data['facets'] = models.Product.objects.browse(has_images=params.get('has_images')).facet_counts(
+                settings.MARKET_PRICE_BUCKETS,
+                category_ids=params.get('category_ids'),
+                min_price=params.get('min_price'),
+                max_price=params.get('max_price'),
+            )
+        return response
 
     @extend_schema(
         summary="Create a new product",
@@ -128,19 +197,176 @@ class ProductViews(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+class ProductImportView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary="Bulk import products from CSV or JSONL",
+        description="Upserts products by name in chunked transactions. Columns/keys: name, price, "
+                    "description, category (category name), images (storage paths, ';'-separated in CSV). "
+                    "Invalid rows are reported by line number without aborting the import.",
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {
+                    'file': {'type': 'string', 'format': 'binary'},
+                    'format': {'type': 'string', 'enum': list(importer.FORMATS)},
+                },
+                'required': ['file']
+            }
+        },
+        responses=serializers.ProductImportReportSerializer,
+    )
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if fmt == 'ndjson':
+            fmt = 'jsonl'
+        if fmt not in importer.FORMATS:
+            return Response({'format': [f"Choose one of: {', '.join(importer.FORMATS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        product_importer = importer.ProductImporter(chunk_size=settings.MARKET_IMPORT_CHUNK_SIZE)
+        report = product_importer.run(importer.iter_rows(upload.file, fmt))
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ProductSearchView(APIView):
+    @extend_schema(
+        summary="Full-text product search",
+        description="Prefix matching on name and description, ranked by relevance (name matches first). "
+                    "Filter by one or more `category` ids.",
+        parameters=[
+            OpenApiParameter('q', str, required=True),
+            OpenApiParameter('category', int, many=True),
+            OpenApiParameter('page', int),
+            OpenApiParameter('page_size', int),
+        ],
+        responses=serializers.ProductSearchResultSerializer,
+    )
+    @cached_response('product', 'productimage', 'photolike')
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        try:
+            category_ids = [int(pk) for pk in request.query_params.getlist('category')]
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', settings.MARKET_PAGE_SIZE)), 1),
+                            settings.MARKET_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'detail': 'category, page and page_size must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not query:
+            return Response({'q': ['This parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = search.search_products(query, category_ids, limit=page_size + 1, offset=(page - 1) * page_size)
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(products) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': serializers.ProductGetSerializer(products[:page_size], many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+class TrendingView(APIView):
+    """Top of a category by time-decayed likes: one range scan of the (category, score, id) index
+
+    Subclasses set `score_model` (ProductScore, ImageScore) and add the
+    relations their serializer needs in get_queryset().
+    """
+    pagination_class = KeysetPagination
+    ordering_fields = ('score',)
+    ordering = '-score'
+    score_model = None
+    serializer_class = None
+
+    def get_queryset(self, pk):
+        return self.score_model.objects.filter(category_id=pk, score__gt=0)
+
+    def get(self, request, pk):
+        if not models.Category.objects.filter(pk=pk).exists():
+            return Response({'detail': 'Category not found'}, status=status.HTTP_404_NOT_FOUND)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(self.get_queryset(pk), request, view=self)
+        serializer = self.serializer_class(page, many=True, context={'decay': rankings.decay()})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class TrendingProductsView(TrendingView):
+    score_model = models.ProductScore
+    serializer_class = serializers.TrendingProductSerializer
+
+    def get_queryset(self, pk):
+        return super().get_queryset(pk).select_related('product').prefetch_related('product__images')
+
+    @extend_schema(
+        summary="Trending products of a category",
+        description="Products ordered by likes with exponential time decay "
+                    "(half-life MARKET_TRENDING_HALF_LIFE_HOURS). `score` is the decayed like count as of now.",
+        responses=serializers.TrendingProductSerializer(many=True),
+    )
+    @cached_response('product', 'productimage', 'photolike')
+    def get(self, request, pk):
+        return super().get(request, pk)
+
+
+class TrendingPhotosView(TrendingView):
+    score_model = models.ImageScore
+    serializer_class = serializers.TrendingPhotoSerializer
+
+    def get_queryset(self, pk):
+        return super().get_queryset(pk).select_related('image')
+
+    @extend_schema(
+        summary="Trending photos of a category",
+        description="Product photos ordered by likes with exponential time decay. "
+                    "`score` is the decayed like count as of now.",
+        responses=serializers.TrendingPhotoSerializer(many=True),
+    )
+    @cached_response('product', 'productimage', 'photolike')
+    def get(self, request, pk):
+        return super().get(request, pk)
+
+
+class ProductExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary="Export the product catalog as NDJSON",
+        description="Streams one product per line in constant memory. Pass `gzip=1` for a gzip-compressed file.",
+        parameters=[OpenApiParameter('gzip', bool, description='Compress the export with gzip')],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.BINARY},
+    )
+    def get(self, request):
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        blocks = exporter.export_products(chunk_size=settings.MARKET_EXPORT_CHUNK_SIZE, gzip=compress)
+        if compress:
+            response = StreamingHttpResponse(blocks, content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="products.ndjson.gz"'
+        else:
+            response = StreamingHttpResponse(blocks, content_type='application/x-ndjson; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+        return response
+
+
 class ProductOneViews(APIView):
     @extend_schema(
         summary="Get a single product by ID",
         description="Retrieve a specific product by its ID, including its images and category.",
+        parameters=shape_parameters(payloads.PRODUCT),
         responses=serializers.ProductGetSerializer,
     )
+    @conditional_response(product_state, 'product', 'productimage', 'photolike')
+    @cached_response('product', 'productimage', 'photolike')
     def get(self, request, pk):
-        try:
-            product = models.Product.objects.get(id=pk)
-            serializer = serializers.ProductSerializer(product)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except models.Product.DoesNotExist:
+        shape = payloads.request_shape(payloads.PRODUCT, request)
+        rows = payloads.products(models.Product.objects.filter(id=pk).values(*shape.columns()), shape)
+        if not rows:
             return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(rows[0], status=status.HTTP_200_OK)
 
     @extend_schema(
         summary="Delete a product by ID",
@@ -198,6 +424,91 @@ class ProductOneViews(APIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class ProductUploadView(APIView):
+    @extend_schema(
+        summary="Start a resumable image upload",
+        description="Opens an upload session for one image of the product, reserving one of its 5 image slots "
+                    "until it is finalized, aborted or expires. Send the file in chunks to the returned "
+                    "session, then finalize it.",
+        request=serializers.UploadSessionCreateSerializer,
+        responses={201: serializers.UploadSessionSerializer},
+    )
+    def post(self, request, pk):
+        params = serializers.UploadSessionCreateSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        session = uploads.open_session(pk, request.user, **params.validated_data)
+        if session is None:
+            return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        location = request.build_absolute_uri(reverse('upload-session', args=[session.pk]))
+        return Response(serializers.UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED,
+                        headers={'Location': location})
+
+
+def get_upload_session(request, pk):
+    session = UploadSession.objects.select_related('image').filter(pk=pk).first()
+    # Чужая сессия выглядит как несуществующая
+    if session is None or (session.user_id is not None and session.user_id != request.user.pk):
+        raise NotFound('Upload not found')
+    return session
+
+
+class UploadSessionView(APIView):
+    @extend_schema(
+        summary="Get the state of an upload",
+        description="`offset` is the number of bytes received so far: resume by sending the chunk starting there.",
+        responses=serializers.UploadSessionSerializer,
+    )
+    def get(self, request, pk):
+        return Response(serializers.UploadSessionSerializer(get_upload_session(request, pk)).data)
+
+    @extend_schema(
+        summary="Upload one chunk",
+        description="The request body is the raw chunk, `Content-Range: bytes <start>-<end>/<size>` places it "
+                    "in the file and must start at the session offset (409 with the offset otherwise). An "
+                    "optional `Content-Digest: sha-256=:<base64>:` is verified before the chunk is accepted.",
+        request={'application/octet-stream': OpenApiTypes.BINARY},
+        parameters=[
+            OpenApiParameter('Content-Range', str, OpenApiParameter.HEADER, required=True),
+            OpenApiParameter('Content-Digest', str, OpenApiParameter.HEADER),
+        ],
+        responses=serializers.UploadSessionSerializer,
+    )
+    def put(self, request, pk):
+        session = get_upload_session(request, pk)
+        start, end = uploads.parse_content_range(request.headers.get('Content-Range'), session)
+        if int(request.META.get('CONTENT_LENGTH') or 0) != end - start + 1:
+            raise ValidationError({'Content-Length': 'Must equal the length of the Content-Range.'})
+        digest = uploads.parse_content_digest(request.headers.get('Content-Digest'))
+        # Тело читается потоком прямо на диск, request.data не трогаем
+        session = uploads.write_chunk(session, request.stream, start, end, digest)
+        return Response(serializers.UploadSessionSerializer(session).data)
+
+    @extend_schema(
+        summary="Abort an upload",
+        description="Deletes the received chunks and frees the image slot.",
+        responses={204: None},
+    )
+    def delete(self, request, pk):
+        uploads.abort(get_upload_session(request, pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadFinalizeView(APIView):
+    @extend_schema(
+        summary="Finish an upload",
+        description="Checks the SHA-256 and that the file is an image, then attaches it to the product. A "
+                    "checksum mismatch restarts the upload from offset 0. Repeating the call returns the "
+                    "same image.",
+        request=None,
+        responses={201: serializers.UploadSessionSerializer},
+    )
+    def post(self, request, pk):
+        session = get_upload_session(request, pk)
+        uploads.finalize(session)
+        session = get_upload_session(request, pk)
+        return Response(serializers.UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
 class PhotoLikeView(GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = serializers.PhotoLikeRequestSerializer  # Обязательно укажи сериализатор
@@ -208,10 +519,12 @@ class PhotoLikeView(GenericAPIView):
         responses=serializers.PhotoLikeStateSerializer  # Укажи сериализатор ответа для GET
     )
     def get(self, request, pk):
-        like_obj = PhotoLike.objects.filter(user=request.user, photo_id=pk).first()
-        if not like_obj:
+        like_obj = PhotoLike.objects.filter(user_id=request.user.pk, photo_id=pk).first()
+        # Ещё не записанный тап из write-behind буфера важнее строки в БД
+        is_like = likes.buffer.state(request.user.pk, pk, like_obj.is_like if like_obj else None)
+        if is_like is None:
             state = None
-        elif like_obj.is_like:
+        elif is_like:
             state = "liked"
         else:
             state = "disliked"
@@ -228,34 +541,34 @@ class PhotoLikeView(GenericAPIView):
         serializer.is_valid(raise_exception=True)
         action = serializer.validated_data['action']
 
-        photo = ProductImage.objects.filter(pk=pk).first()
-        if not photo:
+        try:
+            toggle = likes.buffer.toggle if likes.is_enabled() else PhotoLike.objects.toggle
+            current, likes_count, dislikes_count = toggle(request.user, pk, is_like=action == 'like')
+        except ProductImage.DoesNotExist:
             return Response({'detail': 'Photo not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        like_obj, created = PhotoLike.objects.get_or_create(user=request.user, photo=photo)
-
-        if action == 'like':
-            if not created and like_obj.is_like:
-                like_obj.delete()
-                state = None
-            else:
-                like_obj.is_like = True
-                like_obj.save()
-                state = 'liked'
-        else:  # dislike
-            if not created and not like_obj.is_like:
-                like_obj.delete()
-                state = None
-            else:
-                like_obj.is_like = False
-                like_obj.save()
-                state = 'disliked'
-
-        likes_count = photo.likes.filter(is_like=True).count()
-        dislikes_count = photo.likes.filter(is_like=False).count()
+        if current is None:
+            state = None
+        else:
+            state = 'liked' if current else 'disliked'
 
         return Response({
             'state': state,
             'likes_count': likes_count,
             'dislikes_count': dislikes_count
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    authentication_classes = [metrics.ScrapeTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    permission_classes = [metrics.CanScrapeMetrics]
+    renderer_classes = [metrics.PrometheusRenderer]
+
+    @extend_schema(
+        summary="Request metrics in Prometheus text format",
+        description="Per-route request counts by status, latency, SQL query count/time and response size "
+                    "histograms for this process. Staff users or `Authorization: Bearer <MARKET_METRICS_TOKEN>`.",
+        responses={(200, 'text/plain'): OpenApiTypes.STR},
+    )
+    def get(self, request):
+        return Response(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
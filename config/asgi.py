@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+if settings.MARKET_SERVE_MEDIA:
+    # Медиа отдаётся до Django: без middleware и через zero-copy send сервера
+    from apps.market.serving import MediaApp
+
+    application = MediaApp(application)
@@ -54,6 +54,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учитывать время всех остальных middleware
+    'apps.market.middleware.MetricsMiddleware',
+    'apps.market.middleware.QueryProfilerMiddleware',
+    'apps.market.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,8 +65,6 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'apps.market.middleware.SimpleLoggingMiddleware',
-    'apps.market.middleware.LoggingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -88,20 +90,151 @@ AUTH_USER_MODEL = 'accounts.User'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Applied to every new SQLite connection. WAL lets reads run alongside the single writer,
+# synchronous=NORMAL is durable in WAL mode except for the last commits on power loss,
+# busy_timeout (ms) is how long a writer queues for the lock before "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+
+# DB_ENGINE=postgresql switches to PostgreSQL configured from POSTGRES_* (needs psycopg[pool])
+if os.environ.get('DB_ENGINE') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'market'),
+            'USER': os.environ.get('POSTGRES_USER', 'market'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # The pool keeps connections open itself and refuses to work with CONN_MAX_AGE
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Persistent connections skip reconnecting and re-running the pragmas on every request
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # BEGIN IMMEDIATE takes the write lock up front: a transaction that reads before writing
+                # waits on busy_timeout instead of failing when it upgrades its read lock
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            },
+            # File-backed test DB: the shared-cache in-memory one fails concurrent writers
+            # with "database table is locked" instead of waiting on busy_timeout
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+# Read replicas of `default` as replica_1, replica_2, ...: DB_REPLICAS is a comma-separated list of
+# PostgreSQL hosts, or of SQLite files standing in for replicas locally (refresh them with
+# `manage.py sync_sqlite_replicas`)
+for number, source in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    replica = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default']['OPTIONS']), 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'].endswith('postgresql'):
+        replica['HOST'] = source.strip()
+    else:
+        replica['NAME'] = BASE_DIR / source.strip()
+    DATABASES[f'replica_{number}'] = replica
+
+DATABASE_ROUTERS = ['apps.market.routers.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Catalog response cache, swap BACKEND/LOCATION for Redis or Memcached in production
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'market-catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
 }
 
+MARKET_CACHE_ALIAS = 'catalog'
+MARKET_CACHE_TIMEOUT = 300
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'apps.accounts.authentication.ClaimsJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'apps.market.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Callable encoding response payloads to JSON bytes (apps.market.payloads.get_dumps),
+# None picks orjson when installed and the stdlib otherwise
+MARKET_JSON_DUMPS = None
+
+# Default and upper bound for ?page_size= on the catalog list endpoints
+MARKET_PAGE_SIZE = 20
+MARKET_MAX_PAGE_SIZE = 100
+
+# Upper bounds of the price facet buckets on the product list, the last bucket is open-ended
+MARKET_PRICE_BUCKETS = [50, 100, 500, 1000, 5000]
+
+# Rows per transaction for the bulk product import
+MARKET_IMPORT_CHUNK_SIZE = 1000
+
+# Products fetched (with their images) per query by the NDJSON export
+MARKET_EXPORT_CHUNK_SIZE = 1000
+
+# Bearer token for Prometheus scraping /api/metrics/ (staff users can always read it)
+MARKET_METRICS_TOKEN = os.environ.get('MARKET_METRICS_TOKEN')
+
+# SQL profiling per request: 'off', 'always', or 'header' (only with `X-Profile-Queries: 1`)
+MARKET_QUERY_PROFILER = 'header' if DEBUG else 'off'
+# Same statement shape repeated this many times in one request is reported as N+1
+MARKET_N_PLUS_ONE_THRESHOLD = 3
+
+# Requests slower than this are logged by MetricsMiddleware
+MARKET_SLOW_REQUEST_SECONDS = 1.0
+
+# Serve catalog reads (GET) from native async views; enable when running under ASGI (config.asgi)
+MARKET_ASYNC_VIEWS = os.environ.get('MARKET_ASYNC_VIEWS', '0') == '1'
+
+# Buffer like/dislike taps in memory and write them in batches (apps.market.likes)
+MARKET_LIKE_WRITE_BEHIND = os.environ.get('MARKET_LIKE_WRITE_BEHIND', '0') == '1'
+# Seconds between batch writes of buffered taps
+MARKET_LIKE_FLUSH_INTERVAL = 0.5
+# Directory for per-process tap journals replayed after a crash, None keeps taps only in memory
+MARKET_LIKE_JOURNAL_DIR = os.environ.get('MARKET_LIKE_JOURNAL_DIR')
+
+# Half-life of a like in the trending scores (apps.market.rankings)
+MARKET_TRENDING_HALF_LIFE_HOURS = 24
+
+# Aliases in DATABASES that serve catalog reads (apps.market.routers)
+MARKET_READ_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+# 'round-robin' or 'least-latency'
+MARKET_REPLICA_SELECTION = os.environ.get('MARKET_REPLICA_SELECTION', 'round-robin')
+# Upper bound of replica lag: clients read from the primary this long after their own write,
+# and responses built from replica reads are cached no longer than this
+MARKET_REPLICA_LAG_SECONDS = 5
+
+# Dotted path to an apps.market.search.SearchBackend, None picks FTS5 on SQLite
+MARKET_SEARCH_BACKEND = None
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -109,6 +242,12 @@ SIMPLE_JWT = {
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
 
+# Cache holding token versions and the jti denylist. With DEBUG off startup fails unless it is shared between
+# processes (Redis, Memcached, database), a LocMemCache would revoke tokens in one worker only
+ACCOUNTS_AUTH_CACHE_ALIAS = 'default'
+# Seconds a token that passed the revocation check is trusted without asking the cache again (0 = always ask)
+ACCOUNTS_AUTH_LOCAL_TTL = 0
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'My Project API',
     'DESCRIPTION': 'This is the API documentation for my awesome Django project',
@@ -178,6 +317,33 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # ProductImage/Category files: one copy per distinct content under MEDIA_ROOT/blobs (apps.market.storage)
+    'catalog': {'BACKEND': 'apps.market.storage.ContentAddressedStorage'},
+}
+# Unreferenced blobs younger than this are kept by `gc_media`: their row may still be being written
+MARKET_MEDIA_GC_GRACE_HOURS = 1
+# Serve MEDIA_URL from the app (apps.market.serving): the Django view under WSGI, MediaApp under ASGI
+MARKET_SERVE_MEDIA = DEBUG or os.environ.get('MARKET_SERVE_MEDIA', '0') == '1'
+# Behind nginx: an internal location aliasing MEDIA_ROOT, the view then only answers with X-Accel-Redirect
+MARKET_MEDIA_ACCEL_REDIRECT = os.environ.get('MARKET_MEDIA_ACCEL_REDIRECT')
+# max-age of media outside the blob store (blobs are cached for a year as immutable)
+MARKET_MEDIA_MAX_AGE = 3600
+
+# Background thumbnails/WebP/AVIF for ProductImage, 0 workers = process inline after commit
+MARKET_IMAGE_WORKERS = 2
+MARKET_IMAGE_VARIANTS = {'thumb': 320, 'medium': 1024}
+MARKET_IMAGE_FORMATS = ['webp', 'avif']
+
+# Resumable photo uploads (apps.market.uploads): chunks wait on local disk until the upload is finalized
+MARKET_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+MARKET_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+MARKET_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# Untouched sessions stop holding an image slot and are deleted by `purge_uploads`
+MARKET_UPLOAD_EXPIRY_HOURS = 24
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -208,15 +374,19 @@ LOGGING = {
             'filename': 'debug.log',
             'formatter': 'verbose',
         },
+        'queue': {  # запись в console/file в фоновом потоке, запрос не ждёт I/O
+            '()': 'apps.market.log.QueueLogHandler',
+            'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+        },
     },
     'loggers': {
         'django': {  # логгер для Django
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': True,
         },
         'apps.market': {  # логгер для вашего приложения
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'DEBUG',
             'propagate': False,
         },
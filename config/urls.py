@@ -1,15 +1,15 @@
+import re
+
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path,include,re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
+
+from apps.accounts.views import ClaimsTokenRefreshView
 
 api_urlpatterns = [
     path('',include('apps.market.urls')),
@@ -18,14 +18,18 @@ api_urlpatterns = [
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('docs/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('docs/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', ClaimsTokenRefreshView.as_view(), name='token_refresh'),
 ]
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/',include(api_urlpatterns)),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
+if settings.MARKET_SERVE_MEDIA:
+    from apps.market.serving import serve_media
+
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
+    ]
 
 